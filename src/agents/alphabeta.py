@@ -0,0 +1,292 @@
+"""
+   ..module: alphabeta
+    :synopsis: Alpha-beta search agent. Searches a private copy of the game with
+    paranoid alpha-beta (the agent against a coalition of all opponents), using
+    iterative deepening under a time limit, a transposition table, and killer
+    and history heuristics to order the moves.
+"""
+
+import os, sys
+import random
+import time
+
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+if src_path not in sys.path:
+    sys.path.append( src_path )
+
+import game.movevector as movevector
+import map.cell as cell
+import map.zobrist as zobrist
+import agents.gameai as gameai
+import agents.transposition as transposition
+
+# Default number of seconds that the agent may search per turn.
+DEFAULT_SECONDS = 1.0
+
+# Default maximum search depth, in moves (unit moves, new units and ends of turns).
+DEFAULT_MAX_DEPTH = 32
+
+# Score of a won game; a lost game scores -WIN_SCORE. Both are adjusted by the number
+# of moves needed to reach the end of the game, so that quicker wins are preferred.
+WIN_SCORE = 1000000
+
+# Scores beyond this bound (in absolute value) are wins and losses rather than
+# evaluations of a position.
+WIN_BOUND = WIN_SCORE // 2
+
+# Weight of each enemy unit next to a tower in the default evaluation. Any unit that
+# moves into a tower destroys it, so these units are worth more than their strength.
+TOWER_THREAT_WEIGHT = 20
+
+# Number of killer moves remembered per search depth.
+NUM_KILLERS = 2
+
+# The clock is only read once every CLOCK_INTERVAL nodes.
+CLOCK_INTERVAL = 256
+
+def towerThreats(game_map, color):
+    """Number of units of other colors next to the tower of the input color."""
+    threats = 0
+    for pos in game_map.getAdjacent(game_map.getTower(color)):
+        if game_map.getType(pos) == cell.UNIT and game_map.getColor(pos) != color:
+            threats += 1
+    return threats
+
+def defaultEvaluation(game_map, color):
+    """
+    Default evaluation from the point of view of the input color: its material (see
+    gameai.materialScore) minus the material of all opponents together, with a bonus
+    for enemy towers that it threatens and a penalty for threats to its own tower.
+    """
+    score = 0
+    for other in gameai.TURN_ORDER:
+        try:
+            threats = towerThreats(game_map, other)
+        except RuntimeError:
+            # Players without a tower are out of the game.
+            continue
+        if other == color:
+            score += gameai.materialScore(game_map, other) - TOWER_THREAT_WEIGHT * threats
+        else:
+            score -= gameai.materialScore(game_map, other) - TOWER_THREAT_WEIGHT * threats
+    return score
+
+def scoreToTable(value, ply):
+    """
+    Convert a score found at the input ply to the form stored in a transposition table.
+    Wins and losses are counted from the root of the search; the table counts them
+    from the node instead, so that they stay right when the node is reached at
+    another ply.
+    """
+    if value > WIN_BOUND:
+        return value + ply
+    elif value < -WIN_BOUND:
+        return value - ply
+    return value
+
+def scoreFromTable(value, ply):
+    """Convert a score from a transposition table to a score at the input ply (see scoreToTable)."""
+    if value > WIN_BOUND:
+        return value - ply
+    elif value < -WIN_BOUND:
+        return value + ply
+    return value
+
+"""
+Raised inside the search when the time for the current iteration has run out.
+"""
+class __timeout__(Exception):
+    pass
+
+"""
+Agent that picks each move (unit moves, new units and the end of the turn) with an
+alpha-beta search over a copy of the game. The search is paranoid: the agent assumes
+that every opponent plays to minimize the agent's score. Each ply of the search is a
+single move, so a turn spans several plies.
+"""
+class AlphaBetaAgent(gameai.Agent):
+
+    def __init__(self, color, resources=0, seed=None, seconds=DEFAULT_SECONDS,
+                 max_depth=DEFAULT_MAX_DEPTH, evaluate=defaultEvaluation, table=None):
+        """
+        Class constructor. evaluate takes a Map and the agent's color and returns the
+        value of the position for the agent. table is the TranspositionTable used by
+        the search; agents can share one, even agents of different colors, since each
+        agent keys its entries by its own color as well. The seed breaks ties between
+        moves.
+        """
+        gameai.Agent.__init__(self, color, resources)
+        if seconds <= 0:
+            raise ValueError( "The number of seconds must be positive." )
+        elif type(max_depth) is not int or max_depth <= 0:
+            raise ValueError( "The maximum depth must be a positive integer." )
+        self.__random__   = random.Random(seed)
+        self.__seconds__  = seconds
+        self.__maxdepth__ = max_depth
+        self.__evaluate__ = evaluate
+        self.__table__    = transposition.TranspositionTable() if table is None else table
+        # Killer moves per ply, and the history score of every move that caused a cutoff
+        self.__killers__  = {}
+        self.__history__  = {}
+        self.__numnodes__   = 0
+        self.__searchtime__ = 0.0
+        self.__numsearches__, self.__totaldepth__ = 0, 0
+
+    def makeMove(self, game_map):
+        """
+        Generator that yields the moves of this turn one at a time. Each search may use
+        half of the time that is left in the turn, but always searches at least one ply.
+        """
+        search_game = gameai.buildSearchGame(game_map, self.__color__, self.getResources())
+        search_game.startJournal()
+        deadline = time.perf_counter() + self.__seconds__
+        while True:
+            move_type, contents = self.search(search_game, (deadline - time.perf_counter()) / 2)
+            vect = movevector.MoveVector(move_type, contents)
+            search_game.makeMove(vect)
+            yield vect
+            if move_type == movevector.TYPE_END_TURN:
+                return
+
+    def search(self, search_game, seconds):
+        """
+        Search the current state of search_game with iterative deepening for the input
+        number of seconds, and return the best move for the current player as a
+        (move_type, move_contents) pair. search_game must be keeping a journal; it is
+        left in the state it started in.
+        """
+        start = time.perf_counter()
+        self.__table__.newSearch()
+        self.__killers__ = {}
+        actions = gameai.legalActions(search_game)
+        best = actions[-1]
+        # Once the game is over the only thing left to do is to end the turn.
+        if len(actions) > 1 and not search_game.gameOver():
+            completed = 0
+            for depth in range(1, self.__maxdepth__ + 1):
+                # The first iteration always runs to completion.
+                deadline = None if depth == 1 else start + seconds
+                try:
+                    value = self.__alphaBeta__(search_game, depth, -WIN_SCORE - 1, WIN_SCORE + 1, 0, deadline)
+                except __timeout__:
+                    break
+                best, completed = self.__bestmove__, depth
+                # Stop once the search has found a forced win or loss.
+                if abs(value) > WIN_SCORE - self.__maxdepth__:
+                    break
+            self.__numsearches__ += 1
+            self.__totaldepth__  += completed
+        self.__searchtime__ += time.perf_counter() - start
+        return best
+
+    def getStats(self):
+        """
+        Get a dictionary with the total number of nodes and seconds spent searching, the
+        number of nodes per second, the average depth reached by the searches and the
+        statistics of the transposition table.
+        """
+        return {"nodes": self.__numnodes__, "seconds": self.__searchtime__,
+                "nodes_per_second": self.__numnodes__ / self.__searchtime__
+                                    if self.__searchtime__ > 0 else 0.0,
+                "average_depth": self.__totaldepth__ / self.__numsearches__
+                                 if self.__numsearches__ > 0 else 0.0,
+                "table": self.__table__.getStats()}
+
+    def __alphaBeta__(self, search_game, depth, alpha, beta, ply, deadline):
+        """
+        Value of the current state of search_game for this agent, searched to the input
+        depth. The best move at the root is stored in __bestmove__.
+        """
+        self.__numnodes__ += 1
+        if deadline is not None and self.__numnodes__ % CLOCK_INTERVAL == 0 and time.perf_counter() > deadline:
+            raise __timeout__()
+        if not self.__inGame__(search_game):
+            return -WIN_SCORE + ply
+        elif search_game.gameOver():
+            return WIN_SCORE - ply
+        elif depth == 0:
+            return self.__evaluate__(search_game.getMap(), self.__color__)
+        # Values are scores for this agent, so the key records whose search stored them.
+        key   = search_game.getHash() ^ zobrist.searcherKey(self.__color__)
+        entry = self.__table__.lookup(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, value, flag, table_move = entry
+            value = scoreFromTable(value, ply)
+            if entry_depth >= depth and ply > 0:
+                if flag == transposition.EXACT:
+                    return value
+                elif flag == transposition.LOWER_BOUND and value >= beta:
+                    return value
+                elif flag == transposition.UPPER_BOUND and value <= alpha:
+                    return value
+        maximizing = search_game.getCurrentColor() == self.__color__
+        original_alpha, original_beta = alpha, beta
+        best_value, best_move = None, None
+        for action in self.__orderActions__(search_game, ply, table_move):
+            search_game.makeMove(movevector.MoveVector(*action))
+            try:
+                value = self.__alphaBeta__(search_game, depth - 1, alpha, beta, ply + 1, deadline)
+            finally:
+                search_game.unmakeMove()
+            if best_value is None or (value > best_value if maximizing else value < best_value):
+                best_value, best_move = value, action
+            if maximizing:
+                alpha = max(alpha, value)
+            else:
+                beta = min(beta, value)
+            if alpha >= beta:
+                self.__recordCutoff__(action, ply, depth)
+                break
+        if best_value <= original_alpha:
+            flag = transposition.UPPER_BOUND
+        elif best_value >= original_beta:
+            flag = transposition.LOWER_BOUND
+        else:
+            flag = transposition.EXACT
+        self.__table__.store(key, depth, scoreToTable(best_value, ply), flag, best_move)
+        if ply == 0:
+            self.__bestmove__ = best_move
+        return best_value
+
+    def __orderActions__(self, search_game, ply, table_move):
+        """
+        Order the legal moves: the move from the transposition table first, then the
+        killer moves of this ply, then attacks on towers and units, then the remaining
+        moves by their history score. The end of the turn comes last.
+        """
+        game_map = search_game.getMap()
+        color    = search_game.getCurrentColor()
+        killers  = self.__killers__.get(ply, ())
+        actions  = gameai.legalActions(search_game)
+        self.__random__.shuffle(actions)
+        def priority(action):
+            if action == table_move:
+                return 4, 0
+            elif action in killers:
+                return 3, 0
+            elif action[0] == movevector.TYPE_MOVE_UNIT:
+                target = action[1][1]
+                target_color = game_map.getColor(target)
+                if target_color != cell.EMPTY and target_color != color:
+                    return (2 if game_map.getType(target) == cell.TOWER else 1), 0
+            elif action[0] == movevector.TYPE_END_TURN:
+                return -1, 0
+            return 0, self.__history__.get(action, 0)
+        actions.sort(key=priority, reverse=True)
+        return actions
+
+    def __recordCutoff__(self, action, ply, depth):
+        """Remember a move that caused a beta cutoff in the killer and history tables."""
+        killers = self.__killers__.setdefault(ply, [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[NUM_KILLERS:]
+        self.__history__[action] = self.__history__.get(action, 0) + depth * depth
+
+    def __inGame__(self, search_game):
+        """Determine whether this agent is still in search_game."""
+        for i in range(search_game.getNumPlayers()):
+            if search_game.getPlayer(i).getColor() == self.__color__:
+                return True
+        return False
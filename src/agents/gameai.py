@@ -4,15 +4,58 @@ in the AI players.
 """
 
 import os, sys
+import random
 
 cell_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
 if cell_path not in sys.path:
     sys.path.append( cell_path )
 
 import game
+import game.game
 import map
+import map.cell as cell
 import game.movevector as movevector
 
+# Colors in the order in which search agents assume that the players take their turns.
+TURN_ORDER = (cell.RED, cell.GREEN, cell.BLUE, cell.YELLOW)
+
+"""
+Material of the player with the input color: the resources that the player collects
+at the end of each turn plus the total strength of their units. Used by the search
+agents to evaluate positions that they cannot search to the end of the game.
+"""
+def materialScore(game_map, color):
+    return game_map.collectPlayerResources(color) + \
+        sum(game_map.getStrength(pos) for pos in game_map.getUnits(color))
+
+"""
+Build a Game from a copy of the map for an agent of the input color to search. Every
+color with a tower joins the game, in the order of TURN_ORDER starting with the
+agent. Opponents' resources are not visible on the map, so they start at zero.
+"""
+def buildSearchGame(game_map, color, resources):
+    start = TURN_ORDER.index(color)
+    rotation = []
+    for other in TURN_ORDER[start:] + TURN_ORDER[:start]:
+        try:
+            game_map.getTower(other)
+        except RuntimeError:
+            continue
+        rotation += [game.Player(other, resources if other == color else 0)]
+    return game.game.Game(game_map, rotation=rotation)
+
+"""
+Every legal move of the current player of the input Game, as a list of
+(move_type, move_contents) pairs ending with the end of the turn.
+"""
+def legalActions(current_game):
+    from_positions, to_positions, build_positions = current_game.legalMoves()
+    actions  = [(movevector.TYPE_MOVE_UNIT, (tuple(a), tuple(b))) for a, b in
+                zip(from_positions.tolist(), to_positions.tolist())]
+    actions += [(movevector.TYPE_MAKE_UNIT, tuple(pos)) for pos in build_positions.tolist()]
+    actions += [(movevector.TYPE_END_TURN, None)]
+    return actions
+
 """
 Parent AI class. Inherits from the generic Player class.
 """
@@ -21,20 +64,23 @@ class Agent(game.Player):
     """
     Class constructor.
     """
-    def __init__(self):
+    def __init__(self, color, resources=0):
+        game.Player.__init__(self, color, resources)
         # Set contains the indices of all units that have moved this
         # turn (contains the indices of the final position of the unit).
         self.__moved_units__ = set()
 
     """
     Policy that is implemented by the AI. Takes a Map and a position of a unit
-    to move. Should be implemented in child classes. Returns a MoveVector object.
+    to move. Should be implemented in child classes. Returns a MoveVector object,
+    or None to leave the unit where it is.
     """
     def policy(self, map, pos):
         pass
 
     """
-    Policy for making new units. Always occurs at the start of the turn.
+    Policy for making new units. Always occurs at the start of the turn. Returns
+    an iterable of MoveVector objects of type TYPE_MAKE_UNIT (or None).
     """
     def makeUnitPolicy(self, map):
         pass
@@ -52,22 +98,26 @@ class Agent(game.Player):
     as is convenient.
 
     This function is a generator, so that the game can loop over the moves in
-    this 
+    this turn. Every move is also made on game_map (the agent's own copy of the
+    map), so that the policies always see the current board.
     """
     def makeMove(self, game_map):
         # Clear the __moved_units__ set
-        self.__moved_units__ = set
+        self.__moved_units__ = set()
         # Get all indices containing a unit of this player
         units = game_map.getUnits(self.__color__)
         # Make all units at the start of the turn
-        for move in self.makeUnitPolicy(game_map):
-            if type(move) is not movevector.MoveVector or move.getType() != movevector.TYPE_MAKE_UNIT:
+        for move in self.makeUnitPolicy(game_map) or ():
+            if type(move) is not movevector.MoveVector or move.getMoveType() != movevector.TYPE_MAKE_UNIT:
                 raise TypeError( "The return value from makeUnitPolicy should be a " +
                                  "MoveVector of type TYPE_MAKE_UNIT." )
             else:
                 # Place position of made unit in __moved_units__
-                pos = move.getContents()
+                pos = tuple(move.getMoveContents())
                 self.__moved_units__.add(pos)
+                game_map.setCell(pos, color=self.__color__, type=cell.UNIT,
+                                 strength=game.game.DEFAULT_NEW_UNIT_STRENGTH)
+                yield move
         for unit in units:
             # Skip over moved units, esp. units that have been combined with units
             # that were moved earlier.
@@ -75,11 +125,66 @@ class Agent(game.Player):
                 continue
             else:
                 move = self.policy(game_map, unit)
-                if type(move) is not movevector.MoveVector or move.getType() != movevector.TYPE_MOVE_UNIT:
+                if move is None:
+                    continue
+                elif type(move) is not movevector.MoveVector or move.getMoveType() != movevector.TYPE_MOVE_UNIT:
                     raise TypeError("The return value from the policy() function should " +
                                     "be a MoveVector of type TYPE_MOVE_UNIT.")
                 else:
                     # Place final position of unit in __moved_units__
-                    _, final_position = move.getContents()
-                    self.__moved_units__.add(final_position)
+                    start_position, final_position = move.getMoveContents()
+                    self.__moved_units__.add(tuple(final_position))
+                    self.__applyMove__(game_map, tuple(start_position), tuple(final_position))
+                    yield move
         yield movevector.MoveVector(move_type=movevector.TYPE_END_TURN)
+
+    """
+    Make a unit move on the agent's copy of the map, removing a player from the
+    copy when the move destroys their tower, as the game does.
+    """
+    def __applyMove__(self, game_map, from_position, to_position):
+        tower_color = None
+        if game_map.getType(to_position) == cell.TOWER:
+            tower_color = game_map.getColor(to_position)
+        game_map.makeMove(from_position, to_position)
+        if tower_color is not None and game_map.getType(to_position) != cell.TOWER:
+            game_map.removeColor(tower_color)
+
+"""
+AI that plays uniformly random legal moves. Mostly useful as an opponent for
+testing other agents and for self-play benchmarks.
+"""
+class RandomAgent(Agent):
+
+    """
+    Class constructor. The seed makes the agent's moves reproducible.
+    """
+    def __init__(self, color, resources=0, seed=None):
+        Agent.__init__(self, color, resources)
+        self.__random__ = random.Random(seed)
+
+    """
+    Make at most one unit per turn, in a random empty cell next to the tower.
+    """
+    def makeUnitPolicy(self, map):
+        if self.getResources() < game.game.NEW_UNIT_COST:
+            return []
+        build_positions = map.legalMoves(self.__color__)[2].tolist()
+        if not build_positions:
+            return []
+        pos = tuple(self.__random__.choice(build_positions))
+        return [movevector.MoveVector(movevector.TYPE_MAKE_UNIT, pos)]
+
+    """
+    Move the unit into a random adjacent cell, or leave it in place if it has
+    nowhere to go.
+    """
+    def policy(self, map, pos):
+        # The neighbors come from the map itself, so they need no further checks.
+        targets = [target for target in map.getAdjacent(pos) if not
+                   (map.getColorUnchecked(*target) == self.__color__ and
+                    map.getTypeUnchecked(*target) == cell.TOWER)]
+        if not targets:
+            return None
+        return movevector.MoveVector(movevector.TYPE_MOVE_UNIT,
+                                     (pos, self.__random__.choice(targets)))
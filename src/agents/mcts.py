@@ -0,0 +1,259 @@
+"""
+   ..module: mcts
+    :synopsis: Monte Carlo Tree Search agent. Searches a private copy of the game,
+    making and unmaking moves through the game journal rather than copying the
+    map, and keeps its search tree from one move (and one turn) to the next.
+"""
+
+import os, sys
+import math
+import random
+import time
+
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+if src_path not in sys.path:
+    sys.path.append( src_path )
+
+import game.movevector as movevector
+import map.zobrist as zobrist
+import agents.gameai as gameai
+
+# Number of playouts per move when no budget is given.
+DEFAULT_PLAYOUTS = 200
+
+# Exploration constant of the UCT formula; rewards lie between 0 and 1.
+DEFAULT_EXPLORATION = 1.4
+
+# Maximum number of random moves in a playout before the position is evaluated.
+DEFAULT_ROLLOUT_DEPTH = 40
+
+# The search tree is discarded at the start of a turn once it has more nodes than this.
+DEFAULT_MAX_NODES = 200000
+
+def materialShares(current_game):
+    """
+    Default evaluation: the share of the total material (see gameai.materialScore)
+    held by each player still in the game, as a dictionary from colors to rewards.
+    """
+    game_map = current_game.getMap()
+    scores = {}
+    for i in range(current_game.getNumPlayers()):
+        color = current_game.getPlayer(i).getColor()
+        scores[color] = gameai.materialScore(game_map, color)
+    total = sum(scores.values())
+    if total == 0:
+        return dict((color, 1.0 / len(scores)) for color in scores)
+    return dict((color, score / total) for color, score in scores.items())
+
+"""
+A state in the search tree. Stores the color of the player to move, the legal moves
+in the state (as (move_type, move_contents) pairs) and the number of visits and the
+total reward of each move, from the point of view of the player to move.
+"""
+class __node__(object):
+
+    def __init__(self, color, actions):
+        self.color   = color
+        self.actions = actions
+        self.visits  = [0] * len(actions)
+        self.rewards = [0.0] * len(actions)
+        self.total   = 0
+        self.tried   = 0
+
+"""
+Agent that picks each move (unit moves, new units and the end of the turn) with a
+Monte Carlo Tree Search over a copy of the game. Every player in the tree picks the
+move that is best for themselves (max^n UCT). Opponents' resources are not visible
+on the map, so the search assumes that they have none unless it has seen the state
+before. The budget of each move is a number of playouts, a number of seconds, or
+both (whichever runs out first).
+"""
+class MCTSAgent(gameai.Agent):
+
+    def __init__(self, color, resources=0, seed=None, playouts=None, seconds=None,
+                 exploration=DEFAULT_EXPLORATION, rollout_depth=DEFAULT_ROLLOUT_DEPTH,
+                 evaluate=materialShares, max_nodes=DEFAULT_MAX_NODES):
+        """
+        Class constructor. evaluate takes the searched Game and returns a dictionary
+        from the colors of the players still in the game to rewards between 0 and 1.
+        """
+        gameai.Agent.__init__(self, color, resources)
+        if playouts is None and seconds is None:
+            playouts = DEFAULT_PLAYOUTS
+        if playouts is not None and (type(playouts) is not int or playouts <= 0):
+            raise ValueError( "The number of playouts must be a positive integer." )
+        elif seconds is not None and seconds <= 0:
+            raise ValueError( "The number of seconds must be positive." )
+        self.__random__       = random.Random(seed)
+        self.__playouts__     = playouts
+        self.__seconds__      = seconds
+        self.__exploration__  = exploration
+        self.__rolloutdepth__ = rollout_depth
+        self.__evaluate__     = evaluate
+        self.__maxnodes__     = max_nodes
+        # Search tree, keyed by Game.getHash
+        self.__nodes__        = {}
+        # Opponents' resources in the states of the tree where this agent starts a
+        # turn, keyed by the hash of the state without the opponents' resources.
+        self.__turnstarts__   = {}
+        self.__numplayouts__  = 0
+        self.__searchtime__   = 0.0
+
+    def makeMove(self, game_map):
+        """
+        Generator that yields the moves of this turn one at a time, searching before
+        each one. Ends with a move of type TYPE_END_TURN.
+        """
+        if len(self.__nodes__) > self.__maxnodes__:
+            self.__nodes__, self.__turnstarts__ = {}, {}
+        search_game = self.__buildGame__(game_map)
+        search_game.startJournal()
+        while not search_game.gameOver():
+            node = self.search(search_game)
+            best = max(range(len(node.actions)), key=lambda k: node.visits[k])
+            move_type, contents = node.actions[best]
+            vect = movevector.MoveVector(move_type, contents)
+            search_game.makeMove(vect)
+            yield vect
+            if move_type == movevector.TYPE_END_TURN:
+                return
+        # Once the game is over the only thing left to do is to end the turn.
+        yield movevector.MoveVector(move_type=movevector.TYPE_END_TURN)
+
+    def search(self, search_game):
+        """
+        Run playouts from the current state of search_game until the budget runs out.
+        search_game must be keeping a journal; it is left in the state it started in.
+        Returns the tree node of the current state.
+        """
+        key  = search_game.getHash()
+        root = self.__nodes__.get(key)
+        if root is None:
+            root = self.__nodes__[key] = self.__newNode__(search_game)
+        if len(root.actions) <= 1:
+            return root
+        start, num_playouts = time.perf_counter(), 0
+        deadline = None if self.__seconds__ is None else start + self.__seconds__
+        while self.__playouts__ is None or num_playouts < self.__playouts__:
+            self.__playout__(search_game, root)
+            num_playouts += 1
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+        self.__numplayouts__ += num_playouts
+        self.__searchtime__  += time.perf_counter() - start
+        return root
+
+    def getStats(self):
+        """
+        Get a dictionary with the total number of playouts and seconds spent searching,
+        the number of playouts per second and the size of the search tree.
+        """
+        return {"playouts": self.__numplayouts__, "seconds": self.__searchtime__,
+                "playouts_per_second": self.__numplayouts__ / self.__searchtime__
+                                       if self.__searchtime__ > 0 else 0.0,
+                "nodes": len(self.__nodes__)}
+
+    def __buildGame__(self, game_map):
+        """
+        Build the game that is searched (see gameai.buildSearchGame). Opponents'
+        resources are taken from a state seen in an earlier search if there is one.
+        """
+        search_game = gameai.buildSearchGame(game_map, self.__color__, self.getResources())
+        rotation = [search_game.getPlayer(i) for i in range(search_game.getNumPlayers())]
+        for color, resources in self.__turnstarts__.get(self.__turnKey__(search_game), ()):
+            for search_player in rotation:
+                if search_player.getColor() == color:
+                    search_player.setResources(resources)
+        return search_game
+
+    def __turnKey__(self, search_game):
+        """Get the hash of the state of search_game without the opponents' resources."""
+        key = search_game.getHash()
+        for i in range(search_game.getNumPlayers()):
+            search_player = search_game.getPlayer(i)
+            if search_player.getColor() != self.__color__:
+                key ^= zobrist.resourceKey(search_player.getColor(), search_player.getResources())
+        return key
+
+    def __newNode__(self, search_game):
+        """Create a tree node for the current state of search_game."""
+        actions = gameai.legalActions(search_game)
+        # Moves are expanded in a random order.
+        self.__random__.shuffle(actions)
+        return __node__(search_game.getCurrentColor(), actions)
+
+    def __playout__(self, search_game, root):
+        """
+        Walk down the tree from root with UCT, add one new node, finish the game with
+        random moves (up to the rollout depth), and back up the result.
+        """
+        path, node, num_made = [], root, 0
+        while not search_game.gameOver():
+            if node.tried < len(node.actions):
+                k = node.tried
+                node.tried += 1
+            else:
+                k = self.__select__(node)
+            path += [(node, k)]
+            move_type, contents = node.actions[k]
+            search_game.makeMove(movevector.MoveVector(move_type, contents))
+            num_made += 1
+            if search_game.gameOver():
+                break
+            key   = search_game.getHash()
+            child = self.__nodes__.get(key)
+            if child is None:
+                self.__nodes__[key] = self.__newNode__(search_game)
+                if move_type == movevector.TYPE_END_TURN and search_game.getCurrentColor() == self.__color__:
+                    self.__rememberTurnStart__(search_game)
+                break
+            node = child
+        num_made += self.__rollout__(search_game)
+        if search_game.gameOver():
+            rewards = {search_game.getCurrentColor(): 1.0}
+        else:
+            rewards = self.__evaluate__(search_game)
+        for node, k in path:
+            node.visits[k]  += 1
+            node.rewards[k] += rewards.get(node.color, 0.0)
+            node.total      += 1
+        search_game.rollback(num_made)
+
+    def __select__(self, node):
+        """Pick the move of a fully expanded node with the highest UCT score."""
+        log_total = math.log(node.total)
+        best, best_score = 0, -1.0
+        for k in range(len(node.actions)):
+            visits = node.visits[k]
+            score  = node.rewards[k] / visits + self.__exploration__ * math.sqrt(log_total / visits)
+            if score > best_score:
+                best, best_score = k, score
+        return best
+
+    def __rollout__(self, search_game):
+        """Make uniformly random legal moves; returns the number of moves made."""
+        num_made = 0
+        while num_made < self.__rolloutdepth__ and not search_game.gameOver():
+            from_positions, to_positions, build_positions = search_game.legalMoves()
+            num_moves, num_builds = len(from_positions), len(build_positions)
+            k = self.__random__.randrange(num_moves + num_builds + 1)
+            if k < num_moves:
+                vect = movevector.MoveVector(movevector.TYPE_MOVE_UNIT,
+                                             (tuple(from_positions[k].tolist()), tuple(to_positions[k].tolist())))
+            elif k < num_moves + num_builds:
+                vect = movevector.MoveVector(movevector.TYPE_MAKE_UNIT,
+                                             tuple(build_positions[k - num_moves].tolist()))
+            else:
+                vect = movevector.MoveVector(movevector.TYPE_END_TURN)
+            search_game.makeMove(vect)
+            num_made += 1
+        return num_made
+
+    def __rememberTurnStart__(self, search_game):
+        """Record the opponents' resources at a state where this agent starts a turn."""
+        resources = []
+        for i in range(search_game.getNumPlayers()):
+            search_player = search_game.getPlayer(i)
+            if search_player.getColor() != self.__color__:
+                resources += [(search_player.getColor(), search_player.getResources())]
+        self.__turnstarts__[self.__turnKey__(search_game)] = tuple(resources)
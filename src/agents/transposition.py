@@ -0,0 +1,75 @@
+"""
+   ..module: transposition
+    :synopsis: A bounded transposition table that search agents can use to
+    remember the values of game states they have already searched, keyed by
+    the hash from Game.getHash. One table can be shared between several agents.
+"""
+
+# The kinds of values that can be stored in the table.
+EXACT       = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+# Default number of slots in the table.
+DEFAULT_SIZE = 2**18
+
+"""
+Fixed-size hash table from 64-bit state hashes to search results. Every hash maps
+to a single slot. Within the current search, an entry is only replaced by one of
+at least its search depth, or by an exact value for the same state; entries from
+earlier searches are always replaced.
+"""
+class TranspositionTable(object):
+
+    def __init__(self, size=DEFAULT_SIZE):
+        """Create an empty table with the input number of slots."""
+        if type(size) is not int:
+            raise TypeError( "The size of a TranspositionTable must be of type int." )
+        elif size <= 0:
+            raise ValueError( "The size of a TranspositionTable must be positive." )
+        self.__size__       = size
+        self.__entries__    = [None] * size
+        self.__generation__ = 0
+        self.__hits__       = 0
+        self.__misses__     = 0
+
+    def lookup(self, key):
+        """
+        Get the entry stored for the input hash as a tuple (depth, value, flag, move),
+        or None if there is no such entry.
+        """
+        entry = self.__entries__[key % self.__size__]
+        if entry is None or entry[0] != key:
+            self.__misses__ += 1
+            return None
+        self.__hits__ += 1
+        return entry[1:5]
+
+    def store(self, key, depth, value, flag=EXACT, move=None):
+        """
+        Store the result of searching the state with the input hash to the input depth.
+        flag is one of EXACT, LOWER_BOUND and UPPER_BOUND.
+        """
+        slot  = key % self.__size__
+        entry = self.__entries__[slot]
+        # A shallower bound for the same state would only lose information, but an
+        # exact value is still kept.
+        if (entry is None or entry[5] != self.__generation__ or depth >= entry[1]
+                or (entry[0] == key and flag == EXACT)):
+            self.__entries__[slot] = (key, depth, value, flag, move, self.__generation__)
+
+    def newSearch(self):
+        """
+        Mark the start of a new search. Entries stored before this call are kept, but
+        are replaced by any entry from the new search that maps to the same slot.
+        """
+        self.__generation__ += 1
+
+    def clear(self):
+        """Remove all entries from the table."""
+        self.__entries__ = [None] * self.__size__
+        self.__hits__, self.__misses__ = 0, 0
+
+    def getStats(self):
+        """Get a dictionary with the number of lookups that found an entry or not."""
+        return {"size": self.__size__, "hits": self.__hits__, "misses": self.__misses__}
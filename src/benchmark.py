@@ -0,0 +1,270 @@
+"""
+   .. module: benchmark
+    :synopsis: Benchmarks of the game engine. Times the basic operations of a
+    Map and full turns of random play through a Game on boards of several
+    sizes, and reports how many operations run per second and the peak memory
+    that one operation allocates. Results are saved as JSON, and a run can be
+    compared against a saved baseline to catch performance regressions. Run
+    ``python src/benchmark.py --help`` for the available options.
+"""
+
+import sys, os
+import argparse
+import collections
+import json
+import platform
+import random
+import time
+import tracemalloc
+import numpy as np
+
+src_path = os.path.dirname(os.path.abspath(__file__))
+if src_path not in sys.path:
+    sys.path.append( src_path )
+
+import map
+import map.cell as cell
+import game.game as game
+import agents.gameai as gameai
+import selfplay
+
+# Board sizes that are benchmarked by default, as (rows, columns).
+DEFAULT_SIZES = ((8, 7), (64, 64), (256, 256), (1000, 1000), (2000, 2000))
+
+# Default minimum number of seconds that each benchmark is timed for.
+DEFAULT_MIN_TIME = 0.2
+
+# A benchmark has regressed if it runs this fraction slower than its baseline.
+DEFAULT_THRESHOLD = 0.1
+
+# Number of extra units of each color per cell of the board in the crowded board
+# that the map benchmarks run on.
+UNIT_DENSITY = 0.01
+
+# Number of positions that the setCell and getAdjacent benchmarks cycle through.
+NUM_POSITIONS = 1000
+
+"""
+The two boards of one size that the benchmarks run on: the standard starting board
+(see selfplay.buildMap) and the same board crowded with extra units of every color.
+Benchmarks get snapshots of the boards, so that they never change them.
+"""
+class Boards(object):
+
+    def __init__(self, rows, cols, seed=0):
+        """Build the boards of the input size. The extra units are placed with the input seed."""
+        self.rows, self.cols = rows, cols
+        self.__rng__      = random.Random(seed)
+        self.__starting__ = selfplay.buildMap(rows, cols)
+        self.__crowded__  = self.__starting__.snapshot()
+        num_units = max(int(UNIT_DENSITY * rows * cols), 1)
+        for color in selfplay.PLAYER_COLORS:
+            for k in range(num_units):
+                pos = self.randomPosition()
+                if self.__crowded__.getType(pos) == cell.EMPTY:
+                    self.__crowded__.setCell(pos, color=color, type=cell.UNIT, strength=1)
+
+    def starting(self):
+        """Get a snapshot of the starting board."""
+        return self.__starting__.snapshot()
+
+    def crowded(self):
+        """Get a snapshot of the crowded board."""
+        return self.__crowded__.snapshot()
+
+    def randomPosition(self):
+        """Get a random position on the board."""
+        return (self.__rng__.randrange(self.rows), self.__rng__.randrange(self.cols))
+
+    def emptyPositions(self, num):
+        """Get up to num random positions of empty cells of the crowded board."""
+        positions = [self.randomPosition() for k in range(num)]
+        return [pos for pos in positions if self.__crowded__.getType(pos) == cell.EMPTY]
+
+# Each benchmark takes the Boards of one size, prepares what it needs, and returns a
+# function that performs one operation. Only the operations are timed.
+
+def benchConstruct(boards):
+    """Construct an empty Map."""
+    return lambda: map.Map(boards.rows, boards.cols)
+
+def benchSetCell(boards):
+    """Turn an empty cell into a unit, or a unit made this way back into an empty cell."""
+    game_map, positions = boards.crowded(), boards.emptyPositions(NUM_POSITIONS)
+    count = [0]
+    def operation():
+        k, count[0] = count[0], count[0] + 1
+        pos = positions[k % len(positions)]
+        if (k // len(positions)) % 2 == 0:
+            game_map.setCell(pos, color=cell.RED, type=cell.UNIT, strength=1)
+        else:
+            game_map.setCell(pos, color=cell.EMPTY, type=cell.EMPTY, strength=0)
+    return operation
+
+def benchGetAdjacent(boards):
+    """Get the neighbors of a cell."""
+    game_map = boards.crowded()
+    positions = [boards.randomPosition() for k in range(NUM_POSITIONS)]
+    count = [0]
+    def operation():
+        count[0] += 1
+        game_map.getAdjacent(positions[count[0] % len(positions)])
+    return operation
+
+def benchMakeMove(boards):
+    """Move a unit into an empty neighboring cell, then back on the next operation."""
+    game_map = boards.starting()
+    start = sorted(game_map.getUnits(cell.RED))[0]
+    end = [pos for pos in game_map.getAdjacent(start) if game_map.getType(pos) == cell.EMPTY][0]
+    path = [start, end]
+    def operation():
+        game_map.makeMove(path[0], path[1])
+        path.reverse()
+    return operation
+
+def benchGetUnits(boards):
+    """Get the units of one color of the crowded board."""
+    game_map = boards.crowded()
+    return lambda: game_map.getUnits(cell.RED)
+
+def benchCollectResources(boards):
+    """Get the resources of every player."""
+    game_map = boards.crowded()
+    return lambda: game_map.collectResources()
+
+def benchRemoveColor(boards):
+    """Remove one color from a fresh snapshot of the crowded board."""
+    game_map = boards.crowded()
+    return lambda: game_map.snapshot().removeColor(cell.RED)
+
+def benchGameTurn(boards):
+    """Play one turn of a random agent in a four player game, restarting the game when it ends."""
+    # Game.resetGame cannot bring back players that were knocked out, so every game
+    # is a new Game.
+    games = [0]
+    def newGame():
+        players = [gameai.RandomAgent(color, seed=games[0] * cell.MAX_PLAYERS + k)
+                   for k, color in enumerate(selfplay.PLAYER_COLORS)]
+        games[0] += 1
+        return game.Game(boards.starting(), rotation=players)
+    current_game = [newGame()]
+    def operation():
+        if current_game[0].gameOver():
+            current_game[0] = newGame()
+        current_game[0].queryCurrentPlayer()
+    return operation
+
+# The benchmarks by name, in the order in which they are run.
+BENCHMARKS = collections.OrderedDict([
+    ("construct", benchConstruct), ("setCell", benchSetCell), ("getAdjacent", benchGetAdjacent),
+    ("makeMove", benchMakeMove), ("getUnits", benchGetUnits),
+    ("collectResources", benchCollectResources), ("removeColor", benchRemoveColor),
+    ("gameTurn", benchGameTurn)])
+
+def timeOperation(operation, min_time=DEFAULT_MIN_TIME):
+    """
+    Run an operation repeatedly, in batches that double in size, until at least
+    min_time seconds have passed. Returns the number of operations and the seconds
+    they took.
+    """
+    ops, batch, clock = 0, 1, time.perf_counter
+    start = clock()
+    while True:
+        for k in range(batch):
+            operation()
+        ops += batch
+        elapsed = clock() - start
+        if elapsed >= min_time:
+            return ops, elapsed
+        batch *= 2
+
+def peakMemory(operation):
+    """Get the peak number of bytes allocated while running an operation once."""
+    tracemalloc.start()
+    try:
+        operation()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def runBenchmarks(sizes=DEFAULT_SIZES, names=None, min_time=DEFAULT_MIN_TIME, seed=0):
+    """
+    Run the benchmarks with the input names (all of them if None) on boards of every
+    input (rows, columns) size. Yields one dictionary per benchmark and size, with the
+    number of operations, the seconds they took, the operations per second, and the
+    peak memory of one operation in bytes. The peak memory of the benchmarks that write
+    to a board includes the copy of the planes it shares with the boards (see
+    Map.snapshot).
+    """
+    names = list(BENCHMARKS) if names is None else names
+    for rows, cols in sizes:
+        boards = Boards(rows, cols, seed)
+        for name in names:
+            # The memory is measured on a separate copy, since tracing slows Python down.
+            peak = peakMemory(BENCHMARKS[name](boards))
+            ops, seconds = timeOperation(BENCHMARKS[name](boards), min_time)
+            yield {"benchmark": name, "size": "%dx%d" % (rows, cols), "ops": ops,
+                   "seconds": seconds, "ops_per_sec": ops / seconds, "peak_bytes": peak}
+
+def compareResults(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results against the results of a baseline run. Returns one dictionary per
+    benchmark and size found in both, with the ratio of the current to the baseline
+    operations per second and whether it fell below 1 - threshold.
+    """
+    previous = dict(((result["benchmark"], result["size"]), result) for result in baseline)
+    comparisons = []
+    for result in results:
+        key = (result["benchmark"], result["size"])
+        if key in previous:
+            ratio = result["ops_per_sec"] / previous[key]["ops_per_sec"]
+            comparisons += [{"benchmark": key[0], "size": key[1], "ratio": ratio,
+                             "regressed": ratio < 1 - threshold}]
+    return comparisons
+
+def parseArgs(argv):
+    """Parse the command line arguments of the benchmarks."""
+    parser = argparse.ArgumentParser(description="Benchmark the HexTowns engine.")
+    parser.add_argument("--sizes", default=",".join("%dx%d" % size for size in DEFAULT_SIZES),
+                        help="comma-separated board sizes as ROWSxCOLS")
+    parser.add_argument("--only", default=None,
+                        help="comma-separated benchmarks to run (" + ", ".join(BENCHMARKS) + ")")
+    parser.add_argument("--min-time", type=float, default=DEFAULT_MIN_TIME,
+                        help="minimum number of seconds to time each benchmark for")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the extra units on the boards")
+    parser.add_argument("--output", default=None, help="write the results to this JSON file")
+    parser.add_argument("--baseline", default=None,
+                        help="compare the results against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fraction of the baseline speed that a benchmark may lose")
+    args = parser.parse_args(argv)
+    args.sizes = [tuple(int(x) for x in size.lower().split("x")) for size in args.sizes.split(",")]
+    args.only = None if args.only is None else args.only.split(",")
+    for name in args.only or []:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark " + repr(name))
+    return args
+
+def main(argv=None):
+    """Run the benchmarks. Returns 1 if any benchmark regressed against the baseline, else 0."""
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+    results = []
+    for result in runBenchmarks(args.sizes, args.only, args.min_time, args.seed):
+        results += [result]
+        print("%-16s %11s %14.1f ops/sec %12d bytes" %
+              (result["benchmark"], result["size"], result["ops_per_sec"], result["peak_bytes"]))
+    if args.output is not None:
+        with open(args.output, "w") as stream:
+            json.dump({"python": platform.python_version(), "numpy": np.__version__,
+                       "results": results}, stream, indent=1)
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as stream:
+        comparisons = compareResults(results, json.load(stream)["results"], args.threshold)
+    for comparison in comparisons:
+        print("%-16s %11s %6.2fx%s" % (comparison["benchmark"], comparison["size"], comparison["ratio"],
+                                       "  REGRESSION" if comparison["regressed"] else ""))
+    return 1 if any(comparison["regressed"] for comparison in comparisons) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,6 +6,7 @@
 
 from . import game as gamemod
 from . import player as playermod
+from . import replay as replaymod
 
 # Allows user to instantiate a Game object by importing
 # this module.
@@ -14,3 +15,7 @@ Game = gamemod.Game
 # Allows uer to instantiate a Player object by importing
 # this module.
 Player = playermod.Player
+
+# Classes for writing and reading replay logs.
+ReplayWriter = replaymod.ReplayWriter
+Replay = replaymod.Replay
@@ -6,7 +6,8 @@
 """
 
 import os, sys
-import copy
+import json
+import time
 
 from . import movevector
 from . import player
@@ -18,6 +19,8 @@ if map_path not in sys.path:
 
 import map
 import map.cell as cell
+import map.zobrist as zobrist
+import map.stats as stats
 
 # Default amount of resources required to generate a new unit
 NEW_UNIT_COST = 5
@@ -30,20 +33,22 @@ class Game(object):
     def __init__(self, map, rotation=(cell.RED,cell.GREEN,cell.BLUE,cell.YELLOW)):
         """
         Constructor for a new instance of the game class. Stores the player rotation in
-        a class 
+        a class. Each entry of the rotation is either a color, in which case a new Player
+        of that color joins the game, or a Player object (for instance an AI agent).
         """
         if type(rotation) not in (list,tuple):
             raise TypeError("Rotation should be of type tuple or list.")
         # Add new players of all the colors in the rotation to the game.
         self.__rotator__ = rotator.Rotator()
-        for color in rotation:
+        for entry in rotation:
+            color = entry.getColor() if isinstance(entry, player.Player) else entry
             if not cell.validPlayerColor(color):
                 raise ValueError( "Color (id: " + str(color) + ") is not a valid color." )
             elif self.__rotator__.hasColor(color):
                 raise ValueError( "Color " + cell.getColorString(color) +
                                   " appears twice in rotation." )
             else:
-                new_player = player.Player(color)
+                new_player = entry if isinstance(entry, player.Player) else player.Player(color)
                 self.__rotator__.appendPlayer(new_player)
         if map is None:
             self.map = None
@@ -52,14 +57,24 @@ class Game(object):
         self.__moved__ = set()
         self.__current_player__ = self.__rotator__.getCurrentPlayer()
         self.__stored_moves__   = []
-        self.__default_map__    = copy.deepcopy(map)
+        # Stack of the states needed to undo each move; kept only after startJournal
+        self.__journal__        = None
+        # Receives every move that is made (see setRecorder)
+        self.__recorder__       = None
+        # Counters and timers of the hot paths, kept only after startStats
+        self.__stats__          = None
+        self.__trace__          = None
+        self.__default_map__    = None if map is None else map.snapshot()
 
     def getCurrentPlayer(self):
         """Returns the player whose turn it currently is."""
         return self.__rotator__.getCurrentPlayer()
 
     def getStoredMoves(self):
-        """Returns a list of the stored moves."""
+        """
+        Returns a list of the stored moves. Moves are not stored while a recorder is set
+        (see setRecorder), since the recorder keeps them instead.
+        """
         return self.__stored_moves__[:]
 
     def clearStoredMoves(self):
@@ -68,7 +83,9 @@ class Game(object):
 
     def resetGame(self):
         """Resets the game."""
-        self.map = self.__default_map__
+        self.map = None if self.__default_map__ is None else self.__default_map__.snapshot()
+        if self.__stats__ is not None and self.map is not None:
+            self.map.startStats(self.__stats__)
         self.__moved__ = set()
         self.__rotator__.reset()
         self.__current_player__ = self.__rotator__.getCurrentPlayer()
@@ -107,22 +124,21 @@ class Game(object):
             raise TypeError( "Inputs to game.moveUnit must be of type list or tuple." )
         if len(from_position) != 2 or len(to_position) != 2:
             raise ValueError( "Each input to game.moveUnit must have length 2." )
-        if self.map.getColor( from_position ) != self.getCurrentPlayer().__color__:
-            raise RuntimeError( "Trying to move a piece from a different player, or an empty square." )
-        elif self.map.getType( from_position ) != cell.UNIT:
-            raise RuntimeError( "The piece that is attempting to be moved is not of type cell.UNIT." )
-        elif from_position in self.__moved__:
-            raise RuntimeError( "That piece has already moved this turn." )
+        # Check the indices and the adjacency of the cells once; everything after this
+        # reads and moves through the map's unchecked accessors.
+        self.map.__checkAdjacent__(from_position, to_position)
+        (from_x, from_y), (to_x, to_y) = from_position, to_position
+        self.map.__checkUnitMove__(from_x, from_y, self.getCurrentPlayer().__color__, self.__moved__)
         # Determine if the unit is moving to a tower
-        if self.map.getType( to_position ) == cell.TOWER:
+        if self.map.getTypeUnchecked(to_x, to_y) == cell.TOWER:
             moving_to_tower = True
-            to_color = self.map.getColor( to_position )
+            to_color = self.map.getColorUnchecked(to_x, to_y)
         else:
             moving_to_tower = False
-        self.map.makeMove(from_position, to_position)
-        self.__moved__.add(to_position)
+        self.map.makeMoveUnchecked(from_x, from_y, to_x, to_y)
+        self.__moved__.add( (to_x, to_y) )
         # Return the player that was destroyed, if there was one.
-        if moving_to_tower and self.map.getType( to_position ) != cell.TOWER:
+        if moving_to_tower and self.map.getTypeUnchecked(to_x, to_y) != cell.TOWER:
             self.destroyPlayer( to_color )
             return to_color
         else: 
@@ -138,8 +154,12 @@ class Game(object):
         resources_collected = self.map.collectPlayerResources(current_player.getColor())
         current_player.changeResources(resources_collected)
         # Find the next player who is still in the game
-        self.__moved__.clear()
+        self.__moved__ = set()
         self.__current_player__ = self.__rotator__.rotate()
+        if self.__stats__ is not None:
+            self.__stats__.count("game.turns")
+            if self.__trace__ is not None:
+                self.__traceTurn__(current_player.getColor())
 
     def destroyPlayer(self, color):
         """
@@ -158,17 +178,18 @@ class Game(object):
         if type(location) not in (list, tuple) or len(location) != 2:
             raise TypeError( "Input to game.makeUnit must be a list or tuple of length 2." )
         tower_pos = self.map.getTower(self.getCurrentPlayer().getColor())
-        if location not in self.map.getAdjacent( tower_pos ):
+        if tuple(location) not in self.map.getAdjacent( tower_pos ):
             raise ValueError( "The input location is not adjacent to the current player's tower." )
-        if self.map.getType( location ) != cell.EMPTY:
+        # A neighbor of the tower is on the board, but its indices may not be integers.
+        self.map.__checkIndices__(location)
+        i, j = location
+        if self.map.getTypeUnchecked(i, j) != cell.EMPTY:
             raise RuntimeError( "The input location is non-empty." )
         if self.__current_player__.getResources() < NEW_UNIT_COST:
             raise RuntimeError( "The player does not have enough resources to generate a new unit." )
         # Add a new unit in the given location
-        self.map.setCell(location,
-                         color=self.__current_player__.getColor(),
-                         strength = DEFAULT_NEW_UNIT_STRENGTH,
-                         type=cell.UNIT)
+        self.map.setCellUnchecked(i, j, self.__current_player__.getColor(), cell.UNIT,
+                                  DEFAULT_NEW_UNIT_STRENGTH)
 
     def makeMove(self, vect):
         """
@@ -176,43 +197,274 @@ class Game(object):
         """
         if type(vect) is not movevector.MoveVector:
             raise TypeError( "Input to game.getMove must be of type MoveVector." )
+        if self.__journal__ is not None:
+            self.__journal__ += [(vect, self.map.journalLength(), len(self.__stored_moves__),
+                                  self.__moved__, len(self.__moved__), self.__rotator__.getState())]
+        if self.__stats__ is not None:
+            self.__stats__.count("game.moves")
         move_type = vect.getMoveType()
         contents  = vect.getMoveContents()
         # Run over different cases for the move type.
         # Note that error checking on move contents is performed in movevector.py upon
         # vector initialization.
-        contents = vect.getMoveContents()
-        if move_type == movevector.TYPE_MOVE_UNIT:
-            self.moveUnit(contents[0], contents[1])
-        elif move_type == movevector.TYPE_MAKE_UNIT:
-            self.makeUnit(contents)
-        elif move_type == movevector.TYPE_END_TURN:
-            self.endTurn()
+        try:
+            if move_type == movevector.TYPE_MOVE_UNIT:
+                self.moveUnit(contents[0], contents[1])
+            elif move_type == movevector.TYPE_MAKE_UNIT:
+                self.makeUnit(contents)
+            elif move_type == movevector.TYPE_END_TURN:
+                self.endTurn()
+            else:
+                raise RuntimeError( "Move type " + str(move_type) + " not identified." )
+        except Exception:
+            # Leave the journal as it was before the move that failed. This works even
+            # while the game is being recorded, since the failed move was never recorded.
+            if self.__journal__ is not None:
+                self.__undoMove__()
+            raise
+        self.__recordMoves__([vect])
+
+    def makeMoves(self, vects):
+        """
+        Perform a sequence of moves given as MoveVector objects. Runs of consecutive
+        moves of type TYPE_MOVE_UNIT are checked and applied as a batch through
+        Map.applyMoves; the result is the same as calling makeMove on each vector.
+        """
+        vects = list(vects)
+        for vect in vects:
+            if type(vect) is not movevector.MoveVector:
+                raise TypeError( "Inputs to game.makeMoves must be of type MoveVector." )
+        # Every move needs its own entry in the journal, so journaled games make
+        # the moves one at a time.
+        if self.__journal__ is not None:
+            for vect in vects:
+                self.makeMove(vect)
+            return
+        k = 0
+        while k < len(vects):
+            if vects[k].getMoveType() != movevector.TYPE_MOVE_UNIT:
+                self.makeMove(vects[k])
+                k += 1
+                continue
+            end = k
+            while end < len(vects) and vects[end].getMoveType() == movevector.TYPE_MOVE_UNIT:
+                end += 1
+            k += self.__moveUnits__(vects[k:end])
+
+    def __moveUnits__(self, vects):
+        """
+        Apply a batch of moves of type TYPE_MOVE_UNIT, stopping after a move that
+        destroys a player. Returns the number of moves that were applied.
+        """
+        from_positions = [vect.getMoveContents()[0] for vect in vects]
+        to_positions   = [vect.getMoveContents()[1] for vect in vects]
+        try:
+            # The map checks each move as moveUnit does, including that units only move
+            # once per turn.
+            captured = self.map.applyMoves(from_positions, to_positions,
+                                           color=self.getCurrentPlayer().getColor(),
+                                           stop_on_capture=True, moved=self.__moved__)
+        except Exception as error:
+            if not hasattr(error, "num_applied"):
+                # The batch was rejected before any move was made. Making the moves one at
+                # a time applies the moves before the invalid one and raises its error,
+                # as makeMove would.
+                for vect in vects:
+                    self.makeMove(vect)
+                return len(vects)
+            # Record the moves that were made before the invalid one.
+            num_applied = getattr(error, "num_applied", 0)
+            self.__moved__.update(tuple(pos) for pos in to_positions[:num_applied])
+            self.__countMoves__(num_applied)
+            self.__recordMoves__(vects[:num_applied])
+            raise
+        num_applied = captured[0][0] + 1 if captured else len(vects)
+        self.__moved__.update(tuple(pos) for pos in to_positions[:num_applied])
+        if captured:
+            self.destroyPlayer( captured[0][1] )
+        self.__countMoves__(num_applied)
+        self.__recordMoves__(vects[:num_applied])
+        return num_applied
+
+    def __countMoves__(self, n):
+        """Count n moves applied as a batch in the stats, if they are being collected."""
+        if self.__stats__ is not None:
+            self.__stats__.count("game.moves", n)
+
+    def __recordMoves__(self, vects):
+        """
+        Keep moves that have been made: pass them to the recorder if there is one, or
+        else add them to the stored moves. A recorded game streams its moves out instead
+        of keeping all of them in memory.
+        """
+        if self.__recorder__ is None:
+            self.__stored_moves__ += vects
         else:
-            raise RuntimeError( "Move type " + str(move_type) + " not identified." )
-        self.__stored_moves__ += [vect]
+            for vect in vects:
+                self.__recorder__.recordMove(self, vect)
+
+    def legalMoves(self):
+        """
+        Get every move that the current player can make. Returns the start and end
+        positions of all legal unit moves and the cells where the player can make a new
+        unit, as integer arrays with one (i,j) pair per row (see Map.legalMoves).
+        """
+        current_player = self.getCurrentPlayer()
+        from_positions, to_positions, build_positions = \
+            self.map.legalMoves(current_player.getColor(), moved=self.__moved__)
+        if current_player.getResources() < NEW_UNIT_COST:
+            build_positions = build_positions[:0]
+        return from_positions, to_positions, build_positions
 
     def queryCurrentPlayer(self):
         """
-        Gets all the moves that the player wants to make.
+        Gets all the moves that the player wants to make and makes them, until the player
+        ends their turn. The player's makeMove method is passed a copy-on-write snapshot of
+        the map, which it can modify without affecting the game, and must return an
+        iterable of MoveVector objects (usually it is a generator).
         """
         moving_player = self.__rotator__.getCurrentPlayer()
+        game_stats = self.__stats__
+        if game_stats is not None:
+            start = time.perf_counter()
+            map_snapshot = self.map.snapshot()
+            game_stats.addTime("game.snapshot", time.perf_counter() - start)
+            # Snapshots are not timed, but the player calls the map's hot paths (getUnits
+            # in particular) on its snapshot, so its calls are timed with the game's.
+            map_snapshot.startStats(game_stats)
+        else:
+            map_snapshot = self.map.snapshot()
         # Get an iterator that gives us all the moves that the player intends
         # on making.
-        move_iterator = moving_player.getMove(copy.deepcopy(self.map))
         try:
-            move_iterator = iter(move_iterator())
-            for move in move_iterator:
-                self.makeMove(move)
-            # After running through the iterator, it should be the next player's turn
-            if self.getCurrentPlayer().getColor() == moving_player.getColor():
-                raise RuntimeError( "Finished iterating over move_iterator in getMoves() " +
-                                    "before the player ended their turn with a move of type " +
-                                    "movevector.END_TURN." )
+            move_iterator = iter(moving_player.makeMove(map_snapshot))
         except TypeError:
-            raise TypeError( "The value returned from player " + 
-                             cell.getColorString(moving_player.getColor()) + "'s getMove() function " +
+            raise TypeError( "The value returned from player " +
+                             cell.getColorString(moving_player.getColor()) + "'s makeMove() function " +
                              "was not iterable." )
+        if game_stats is not None:
+            # The player thinks while it produces its moves, not while the game makes them.
+            move_iterator = game_stats.wrapIterator(
+                "think." + cell.getColorString(moving_player.getColor()), move_iterator)
+        for move in move_iterator:
+            self.makeMove(move)
+            if move.getMoveType() == movevector.TYPE_END_TURN:
+                return
+        # After running through the iterator, it should be the next player's turn
+        raise RuntimeError( "Finished iterating over the moves from makeMove() " +
+                            "before the player ended their turn with a move of type " +
+                            "movevector.TYPE_END_TURN." )
+
+    def setRecorder(self, recorder):
+        """
+        Set an object whose recordMove(game, vect) method is called after every move
+        that is made in the game, for instance a replay.ReplayWriter. Pass None to stop
+        recording. Moves cannot be undone while the game is being recorded, and are not
+        added to the stored moves (see getStoredMoves).
+        """
+        self.__recorder__ = recorder
+
+    def startStats(self, trace=None):
+        """
+        Start counting turns and timing the hot paths of the game: the map's methods
+        (see Map.startStats), including those that players call on the snapshot they are
+        passed, the time taken to make that snapshot and the time that each
+        player spends thinking, under "think.<color>". If trace is a writable text
+        stream, one line of JSON is written to it at the end of every turn, with the
+        turn, its player, its duration and what was recorded during it (including the
+        number of moves, "game.moves").
+        """
+        self.__stats__ = stats.Stats()
+        self.__trace__ = trace
+        self.__lastturn__ = (time.perf_counter(), self.__stats__.snapshot())
+        if self.map is not None:
+            self.map.startStats(self.__stats__)
+
+    def stopStats(self):
+        """Stop counting and timing, and discard what has been recorded."""
+        if self.map is not None:
+            self.map.stopStats()
+        self.__stats__ = None
+        self.__trace__ = None
+
+    def stats(self):
+        """
+        Get a snapshot of the counters and timers recorded since startStats was called,
+        as a dictionary that can be stored as JSON (see stats.Stats.snapshot).
+        """
+        if self.__stats__ is None:
+            raise RuntimeError( "The game is not recording stats; call startStats first." )
+        return self.__stats__.snapshot()
+
+    def __traceTurn__(self, color):
+        """Write the line of the trace for the turn of the input color, which has just ended."""
+        now, current = time.perf_counter(), self.__stats__.snapshot()
+        start, previous = self.__lastturn__
+        line = {"turn": current["counters"]["game.turns"], "color": cell.getColorString(color),
+                "seconds": now - start}
+        line.update(stats.difference(current, previous))
+        self.__trace__.write(json.dumps(line) + "\n")
+        self.__lastturn__ = (now, current)
+
+    def startJournal(self):
+        """
+        Start recording the moves made through makeMove so that they can be undone
+        with unmakeMove and rollback, including their effect on the map, the units
+        that have moved, the players' resources and the player rotation.
+        """
+        self.__journal__ = []
+        self.map.startJournal()
+
+    def stopJournal(self):
+        """Stop recording moves and discard the journal."""
+        self.__journal__ = None
+        self.map.stopJournal()
+
+    def unmakeMove(self):
+        """Undo the most recent move made through makeMove."""
+        if self.__journal__ is None:
+            raise RuntimeError( "The game is not keeping a journal; call startJournal first." )
+        elif not self.__journal__:
+            raise RuntimeError( "There are no moves in the journal to undo." )
+        elif self.__recorder__ is not None:
+            raise RuntimeError( "Moves cannot be undone while the game is being recorded." )
+        self.__undoMove__()
+
+    def __undoMove__(self):
+        """Undo the move of the last entry of the journal, without any checks."""
+        vect, map_length, num_stored, moved, num_moved, rotator_state = self.__journal__.pop()
+        self.map.rollbackJournal(map_length)
+        del self.__stored_moves__[num_stored:]
+        # endTurn replaces the set of moved units, while moveUnit adds one position to it.
+        if self.__moved__ is not moved:
+            self.__moved__ = moved
+        elif len(self.__moved__) > num_moved:
+            self.__moved__.discard( tuple(vect.getMoveContents()[1]) )
+        self.__rotator__.setState(rotator_state)
+        self.__current_player__ = self.__rotator__.getCurrentPlayer()
+
+    def rollback(self, n):
+        """Undo the n most recent moves."""
+        if type(n) is not int:
+            raise TypeError( "The input to rollback must be of type int." )
+        elif self.__journal__ is None or n > len(self.__journal__):
+            raise ValueError( "Cannot undo " + str(n) + " moves." )
+        for k in range(n):
+            self.unmakeMove()
+
+    def getHash(self):
+        """
+        Get a 64-bit hash of the game state: the board, the player whose turn it is,
+        the resources of every player and the units that have already moved this turn.
+        Two games that reached the same state through different moves have the same hash.
+        """
+        key = self.map.getHash() ^ zobrist.playerKey( self.getCurrentColor() )
+        for i in range(self.getNumPlayers()):
+            game_player = self.getPlayer(i)
+            key ^= zobrist.resourceKey( game_player.getColor(), game_player.getResources() )
+        for pos in self.__moved__:
+            key ^= zobrist.movedKey(pos)
+        return key
 
     def getMap(self):
         """Returns a reference to the game map."""
@@ -73,6 +73,16 @@ class Player(object):
             raise ValueError( "Player has a negative amount of resources " +
                               "after this operation." )
 
+    """
+    Set the number of resources that this player has.
+    """
+    def setResources(self, resources):
+        if type(resources) is not int:
+            raise TypeError( "Resources must be an integer." )
+        elif resources < 0:
+            raise ValueError( "Resources must be non-negative." )
+        self.__resources__ = resources
+
     """
     Set the number of resources that this player has to zero.
     """
@@ -31,7 +31,7 @@ class __rotationnode__(object):
 
     def changePlayer(self, player_ref):
         """Change the player that is being used by this node"""
-        if type(player_ref) is not player.Player:
+        if not isinstance(player_ref, player.Player):
             raise TypeError("The type of the input passed to a new __rotationnode__ " +
                             "object must be of type Player.")
         else:
@@ -79,7 +79,7 @@ class Rotator(object):
 
     def appendPlayer(self, new_player):
         """Adds a node containing a player to the end of the list."""
-        if type(new_player) is not player.Player:
+        if not isinstance(new_player, player.Player):
             raise TypeError("Can only append objects of type Player.")
         # Insert the player with the input color into __colordict__
         color = new_player.getColor()
@@ -103,9 +103,9 @@ class Rotator(object):
 
     def removePlayer(self, color):
         """Remove the player of a given color from the list"""
-        if type(color) not in (player.Player, int):
+        if type(color) is not int and not isinstance(color, player.Player):
             raise TypeError("Input to removePlayer must be of type int or Player.")
-        if type(color) is player.Player:
+        if isinstance(color, player.Player):
             color = color.getColor()
         if color not in self.__colordict__:
             raise IndexError("The input color/player was not found in the Rotator.")
@@ -129,7 +129,7 @@ class Rotator(object):
         Inserts a player at a given index of the linked list. Index based on the current
         node in the rotator.
         """
-        if type(player_to_insert) is not player.Player:
+        if not isinstance(player_to_insert, player.Player):
             raise TypeError("The first input to insertPlayer must be of type Player.")
         elif player_to_insert.getColor() in self.__colordict__:
             raise ValueError("The player to insert has color " + 
@@ -216,6 +216,29 @@ class Rotator(object):
         while self.getCurrentColor() != self.__initial_color__:
             self.rotate()
     
+    def getState(self):
+        """
+        Get a tuple that records the players in the rotation (starting from the
+        current player), their resources and the initial player. The rotation can be
+        returned to this state with setState.
+        """
+        players = []
+        node_i = self.__currentnode__
+        for i in range(self.getNumPlayers()):
+            players += [(node_i.getPlayer(), node_i.getPlayer().getResources())]
+            node_i = node_i.getNext()
+        return (tuple(players), getattr(self, "__initial_color__", None))
+
+    def setState(self, state):
+        """Return the rotation to a state obtained from getState."""
+        players, initial_color = state
+        self.__currentnode__ = None
+        self.__colordict__   = {}
+        for rotation_player, resources in players:
+            rotation_player.setResources(resources)
+            self.appendPlayer(rotation_player)
+        self.__initial_color__ = initial_color
+
     def getInitialPlayer(self):
         """Get the initial player in the rotation."""
         return self.__colordict__[self.__initial_color__]
@@ -0,0 +1,249 @@
+"""
+   .. module: replay
+      :synopsis: Compact binary replay logs. A ReplayWriter streams the moves of a
+      game to an append-only file of fixed-size records, and writes a full snapshot
+      of the game to a second file every few turns. A Replay memory-maps both files,
+      so that a log can be scanned without building Python objects for its moves,
+      and a game can be rebuilt at any turn by replaying the moves since the last
+      snapshot before it.
+"""
+
+import os, sys
+import numpy as np
+
+from . import game as gamemod
+from . import movevector
+
+map_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+if map_path not in sys.path:
+    sys.path.append( map_path )
+
+import map
+import map.cell as cell
+
+# Version of the file format, stored in the header of both files.
+FORMAT_VERSION = 1
+
+# First bytes of the move log and of the snapshot file.
+MOVES_MAGIC     = b"HXMOVES"
+SNAPSHOTS_MAGIC = b"HXSNAPS"
+
+# Suffix added to the path of the move log to get the path of the snapshot file.
+SNAPSHOT_SUFFIX = ".snapshots"
+
+# Default number of turns between snapshots.
+DEFAULT_SNAPSHOT_INTERVAL = 16
+
+# Value of the unused coordinates of a record.
+NO_POSITION = 0xFFFF
+
+# Header at the start of both files.
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u2"), ("rows", "<u4"), ("cols", "<u4"),
+                         ("grid", "S16"), ("packed", "u1"), ("interval", "<u4")])
+
+# One record per move: the move type and the start and end positions of the move. New
+# units are stored in the end position; unused coordinates are NO_POSITION.
+MOVE_DTYPE = np.dtype([("type", "u1"), ("from", "<u2", (2,)), ("to", "<u2", (2,))])
+
+def snapshotDtype(m, n):
+    """
+    Get the record type of the snapshots of an m x n map: the turn at which the
+    snapshot was taken, the number of moves made before it, the colors of the players
+    still in the game (starting with the current player, padded with cell.EMPTY),
+    their resources, and the planes of the map.
+    """
+    return np.dtype([("turn", "<u8"), ("move", "<u8"),
+                     ("rotation", "u1", (cell.MAX_PLAYERS,)), ("resources", "<i8", (cell.MAX_PLAYERS,)),
+                     ("colors", "i1", (m, n)), ("types", "i1", (m, n)), ("strengths", "<i4", (m, n)),
+                     ("cellresources", "<i4", (m, n)), ("isdisabled", "?", (m, n))])
+
+def __readHeader__(path, magic):
+    """Read and check the header of a replay file."""
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header[0]["magic"] != magic:
+        raise ValueError( "The file " + path + " is not a replay file." )
+    elif header[0]["version"] != FORMAT_VERSION:
+        raise ValueError( "The file " + path + " has version " + str(header[0]["version"]) +
+                          "; only version " + str(FORMAT_VERSION) + " can be read." )
+    return header[0]
+
+def __mapRecords__(path, dtype):
+    """Memory-map the records that follow the header of a replay file."""
+    # A log that is still being written may end with part of a record.
+    count = (os.path.getsize(path) - HEADER_DTYPE.itemsize) // dtype.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=HEADER_DTYPE.itemsize, shape=(count,))
+
+"""
+Writes the moves of a game to a replay log. Attach a writer to a game with
+Game.setRecorder; every move made through the game from then on is appended to the
+log, and a snapshot is taken when the writer is created and every <interval> turns.
+"""
+class ReplayWriter(object):
+
+    def __init__(self, path, current_game, interval=DEFAULT_SNAPSHOT_INTERVAL):
+        """Create the files of a new log at path, overwriting any existing log."""
+        if type(interval) is not int or interval <= 0:
+            raise ValueError( "The snapshot interval must be a positive integer." )
+        game_map = current_game.getMap()
+        rows, cols = game_map.getDimensions()
+        if max(rows, cols) >= NO_POSITION:
+            raise ValueError( "Maps with " + str(NO_POSITION) + " or more rows or columns " +
+                              "cannot be recorded." )
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["version"], header["rows"], header["cols"] = FORMAT_VERSION, rows, cols
+        header["grid"], header["interval"] = game_map.__grid__, interval
+        header["packed"] = game_map.__strengths__.dtype == map.map.PACKED_DTYPES["strengths"]
+        self.__interval__  = interval
+        self.__snapshot__  = np.zeros(1, dtype=snapshotDtype(rows, cols))
+        self.__turn__      = 0
+        self.__nummoves__  = 0
+        self.__moves__     = open(path, "wb")
+        self.__snapshots__ = open(path + SNAPSHOT_SUFFIX, "wb")
+        header["magic"] = MOVES_MAGIC
+        self.__moves__.write(header.tobytes())
+        header["magic"] = SNAPSHOTS_MAGIC
+        self.__snapshots__.write(header.tobytes())
+        self.__writeSnapshot__(current_game)
+
+    def recordMove(self, current_game, vect):
+        """Append a move that has just been made in current_game to the log."""
+        record = np.full(1, NO_POSITION, dtype=MOVE_DTYPE)
+        move_type = vect.getMoveType()
+        record["type"] = move_type
+        if move_type == movevector.TYPE_MOVE_UNIT:
+            record["from"], record["to"] = vect.getMoveContents()
+        elif move_type == movevector.TYPE_MAKE_UNIT:
+            record["to"] = vect.getMoveContents()
+        self.__moves__.write(record.tobytes())
+        self.__nummoves__ += 1
+        if move_type == movevector.TYPE_END_TURN:
+            self.__turn__ += 1
+            if self.__turn__ % self.__interval__ == 0:
+                self.__writeSnapshot__(current_game)
+
+    def getNumMoves(self):
+        """Get the number of moves that have been recorded."""
+        return self.__nummoves__
+
+    def flush(self):
+        """Write any buffered records to disk."""
+        self.__moves__.flush()
+        self.__snapshots__.flush()
+
+    def close(self):
+        """Close the files of the log."""
+        self.__moves__.close()
+        self.__snapshots__.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __writeSnapshot__(self, current_game):
+        """Append a snapshot of the current state of the game to the snapshot file."""
+        game_map, snapshot = current_game.getMap(), self.__snapshot__
+        snapshot["turn"], snapshot["move"] = self.__turn__, self.__nummoves__
+        snapshot["rotation"], snapshot["resources"] = cell.EMPTY, 0
+        for i in range(current_game.getNumPlayers()):
+            snapshot["rotation"][0, i]  = current_game.getPlayer(i).getColor()
+            snapshot["resources"][0, i] = current_game.getPlayer(i).getResources()
+        for field, name in (("colors", "__colors__"), ("types", "__types__"), ("strengths", "__strengths__"),
+                            ("cellresources", "__resources__"), ("isdisabled", "__isdisabled__")):
+            plane = getattr(game_map, name)
+            if plane.dtype != bool and plane.size and (plane.min() < np.iinfo(snapshot[field].dtype).min or
+                                                       plane.max() > np.iinfo(snapshot[field].dtype).max):
+                raise OverflowError( "The values of " + name + " do not fit in a replay snapshot." )
+            snapshot[field] = plane
+        self.__snapshots__.write(snapshot.tobytes())
+
+"""
+Reads a replay log. Both files of the log are memory-mapped; moves are only turned
+into MoveVector objects when a game is rebuilt or when getMove is called.
+"""
+class Replay(object):
+
+    def __init__(self, path):
+        """Open the log written to path by a ReplayWriter."""
+        header = __readHeader__(path, MOVES_MAGIC)
+        snapshot_header = __readHeader__(path + SNAPSHOT_SUFFIX, SNAPSHOTS_MAGIC)
+        self.__numrows__  = int(header["rows"])
+        self.__numcols__  = int(header["cols"])
+        self.__grid__     = header["grid"].decode()
+        self.__packed__   = bool(header["packed"])
+        self.__interval__ = int(snapshot_header["interval"])
+        self.__moves__     = __mapRecords__(path, MOVE_DTYPE)
+        self.__snapshots__ = __mapRecords__(path + SNAPSHOT_SUFFIX,
+                                            snapshotDtype(self.__numrows__, self.__numcols__))
+        # Index of the END_TURN record of every turn, built on first use.
+        self.__turnends__  = None
+
+    def getDimensions(self):
+        """Get the number of rows and columns of the recorded map."""
+        return (self.__numrows__, self.__numcols__)
+
+    def getSnapshotInterval(self):
+        """Get the number of turns between snapshots."""
+        return self.__interval__
+
+    def getNumMoves(self):
+        """Get the number of moves in the log."""
+        return len(self.__moves__)
+
+    def getNumTurns(self):
+        """Get the number of turns that were ended in the log."""
+        return len(self.__turnEnds__())
+
+    def getMoves(self):
+        """
+        Get the read-only array of move records (see MOVE_DTYPE), for scanning the log
+        without building a MoveVector for every move.
+        """
+        return self.__moves__
+
+    def getMove(self, k):
+        """Get move k of the log as a MoveVector."""
+        record = self.__moves__[k]
+        move_type = int(record["type"])
+        if move_type == movevector.TYPE_MOVE_UNIT:
+            return movevector.MoveVector(move_type, (tuple(record["from"].tolist()), tuple(record["to"].tolist())))
+        elif move_type == movevector.TYPE_MAKE_UNIT:
+            return movevector.MoveVector(move_type, tuple(record["to"].tolist()))
+        else:
+            return movevector.MoveVector(move_type)
+
+    def getTurnStart(self, turn):
+        """Get the index of the first move of the input turn."""
+        if type(turn) is not int:
+            raise TypeError( "The turn must be of type int." )
+        elif turn < 0 or turn > self.getNumTurns():
+            raise IndexError( "Turn " + str(turn) + " is not in the log." )
+        return 0 if turn == 0 else int(self.__turnEnds__()[turn - 1]) + 1
+
+    def getGame(self, turn=0):
+        """
+        Rebuild the game at the start of the input turn, from the last snapshot taken
+        at or before that turn and the moves that were made after it. The players of
+        the game are plain Player objects.
+        """
+        end = self.getTurnStart(turn)
+        k = int(np.searchsorted(self.__snapshots__["turn"], turn, side="right")) - 1
+        snapshot = self.__snapshots__[k]
+        game_map = map.Map(self.__numrows__, self.__numcols__, grid=self.__grid__, packed=self.__packed__)
+        game_map.__loadPlanes__(snapshot["colors"], snapshot["types"], snapshot["strengths"],
+                                snapshot["cellresources"], snapshot["isdisabled"])
+        rotation = [int(color) for color in snapshot["rotation"] if color != cell.EMPTY]
+        replayed_game = gamemod.Game(game_map, rotation=rotation)
+        for i in range(len(rotation)):
+            replayed_game.getPlayer(i).setResources(int(snapshot["resources"][i]))
+        replayed_game.makeMoves(self.getMove(j) for j in range(int(snapshot["move"]), end))
+        return replayed_game
+
+    def __turnEnds__(self):
+        """Get the indices of the END_TURN records, computing them on first use."""
+        if self.__turnends__ is None:
+            self.__turnends__ = np.flatnonzero(self.__moves__["type"] == movevector.TYPE_END_TURN)
+        return self.__turnends__
@@ -8,9 +8,13 @@
 
 from . import cell as cellmod
 from . import map  as mapmod
+from . import batched as batchedmod
+from . import chunked as chunkedmod
 
 import re, sys, os
 
 Map = mapmod.Map
 Cell = cellmod.Cell
+BatchedMap = batchedmod.BatchedMap
+ChunkedMap = chunkedmod.ChunkedMap
 
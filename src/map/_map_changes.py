@@ -0,0 +1,32 @@
+"""
+   .. module: _map_changes
+    :synopsis: Tracking of the cells of a map that have changed, so that a
+    view of the map (for instance the game UI) only has to redraw those cells.
+    All of these functions are stored as methods in the Map class; see map.py.
+"""
+
+def trackChanges(self):
+    """
+    Start recording the position of every cell whose color, type, strength, resources
+    or disabled status changes. The positions are collected with popChanges.
+    """
+    self.__changes__ = set()
+
+def stopTrackingChanges(self):
+    """Stop recording changed cells and discard the ones not yet collected."""
+    self.__changes__ = None
+
+def popChanges(self):
+    """
+    Get the set of (i,j) positions of the cells that have changed since the last call
+    (or since trackChanges was called), and start a new empty set.
+    """
+    if self.__changes__ is None:
+        raise RuntimeError( "The map is not tracking changes; call trackChanges first." )
+    changes, self.__changes__ = self.__changes__, set()
+    return changes
+
+def __markChanged__(self, i, j):
+    """Record that cell (i,j) has changed, if changes are being tracked."""
+    if self.__changes__ is not None:
+        self.__changes__.add( (i, j) )
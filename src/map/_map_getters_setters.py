@@ -5,6 +5,8 @@
 """
 
 from . import cell
+from . import zobrist
+from ._map_private import NO_NEIGHBOR
 import itertools
 import numpy as np
 
@@ -37,7 +39,8 @@ def setColor(self, pos, color):
     elif not cell.validColor(color):
         raise ValueError("setColor received an invalid color.")
     else:
-        self.__colors__[pos[0]][pos[1]] = color
+        i, j = pos
+        self.__writeCell__(i, j, color, self.__types__[i, j], self.__strengths__[i, j])
 
 def setType(self, pos, cell_type):
     """Sets the type of cell (i,j); possible types are EMPTY, UNIT, and TOWER."""
@@ -50,14 +53,8 @@ def setType(self, pos, cell_type):
     elif cell_type not in (cell.EMPTY, cell.UNIT, cell.TOWER):
         raise ValueError("setType received an invalid unit ID.")
     else:
-        # If the type of the cell that is being set is currently TOWER, we
-        # have to remove it from the set of tower indices.
-        if self.__types__[i][j] == cell.TOWER:
-            self.__towerIndices__.remove( pos )
-        self.__types__[i][j] = cell_type
-        # If the type is tower, add the indices to the list of tower units
-        if cell_type == cell.TOWER:
-            self.__towerIndices__.add( pos )
+        # Writing the cell moves it between the sets of tower and unit indices.
+        self.__writeCell__(i, j, self.__colors__[i, j], cell_type, self.__strengths__[i, j])
 
 def setStrength(self, pos, strength):
     """Sets the strength of cell (i,j)."""
@@ -68,7 +65,12 @@ def setStrength(self, pos, strength):
         raise TypeError("setStrength received a non-integer value.")
     elif strength < 0:
         raise ValueError("setStrength received a negative value.")
-    else: self.__strengths__[ pos[0] ][ pos[1] ] = strength
+    elif strength > self.__maxstrength__:
+        raise OverflowError("setStrength received a value larger than the maximum " +
+                            "strength (" + str(self.__maxstrength__) + ") of this map.")
+    else:
+        i, j = pos
+        self.__writeCell__(i, j, self.__colors__[i, j], self.__types__[i, j], strength)
 
 def setResources(self, pos, resources):
     """Sets the resources of cell (i,j)."""
@@ -79,7 +81,15 @@ def setResources(self, pos, resources):
         raise TypeError( "setResources received a non-integer value." )
     elif resources < 0:
         raise ValueError( "setResources received a negative value." )
-    else: self.__resources__[ pos[0] ][ pos[1] ] = resources
+    elif resources > self.__maxresources__:
+        raise OverflowError( "setResources received a value larger than the maximum " +
+                             "resources (" + str(self.__maxresources__) + ") of this map." )
+    else:
+        self.__detach__("__resources__")
+        self.__unindexCell__(pos[0], pos[1])
+        self.__resources__[pos[0], pos[1]] = resources
+        self.__indexCell__(pos[0], pos[1])
+        self.__markChanged__(pos[0], pos[1])
 
 def setDisabled(self, pos, isdisabled):
     """Toggle the enabled/disabled status of an input cell."""
@@ -89,16 +99,15 @@ def setDisabled(self, pos, isdisabled):
     if isdisabled is None: return
     if type( isdisabled ) is not bool:
         raise TypeError( "setDisabled received a non-boolean value." )
-    if isdisabled:
-        self.__isdisabled__[i][j] = True
-        for cell in self.__adjacent__[i][j]:
-            self.__setAdjacent__( cell )
-    else:
-        self.__isdisabled__[i][j] = False
-        # Reset all adjacencies of this cell
-        self.__setAdjacent__( pos )
-        for cell in self.getAdjacent( pos ):
-            self.__setAdjacent__( cell )
+    self.__detach__("__isdisabled__")
+    self.__isdisabled__[i, j] = isdisabled
+    self.__markChanged__(i, j)
+    # Patch the adjacency bitmask of every cell next to this one, since this cell
+    # has become (un)reachable from them.
+    n = self.__numcols__
+    for k in self.__neighbors__[i * n + j].tolist():
+        if k != NO_NEIGHBOR:
+            self.__setAdjacent__( (k // n, k % n) )
 
 def getCellDict(self, pos):
     """
@@ -107,93 +116,110 @@ def getCellDict(self, pos):
     """
     self.__checkIndices__(pos)
     i, j = pos; celldict = {}
-    celldict['color']      = self.__colors__[i][j]
-    celldict['strength']   = self.__strengths__[i][j]
-    celldict['resources']  = self.__resources__[i][j]
-    celldict['type']       = self.__types__[i][j]
-    celldict['isdisabled'] = self.__isdisabled__[i][j]
-    celldict['adjacent']   = self.__adjacent__[i][j]
+    celldict['color']      = int(self.__colors__[i, j])
+    celldict['strength']   = int(self.__strengths__[i, j])
+    celldict['resources']  = int(self.__resources__[i, j])
+    celldict['type']       = int(self.__types__[i, j])
+    celldict['isdisabled'] = bool(self.__isdisabled__[i, j])
+    celldict['adjacent']   = self.getAdjacent(pos)
     return celldict
 
 def getCell(self, pos):
     """Gets a Cell object representing the cell in the ith row and jth column."""
     i, j = pos
     self.__checkIndices__(pos)
-    color      = self.__colors__[i][j]
-    strength   = self.__strengths__[i][j]
-    resources  = self.__resources__[i][j]
-    type       = self.__types__[i][j]
-    isdisabled = self.__isdisabled[i][j]
-    adjacent   = self.__adjacent__[i][j]
-    return Cell(color=color, strength=strength, resources=resources, type=type, 
+    color      = int(self.__colors__[i, j])
+    strength   = int(self.__strengths__[i, j])
+    resources  = int(self.__resources__[i, j])
+    type       = int(self.__types__[i, j])
+    isdisabled = bool(self.__isdisabled__[i, j])
+    adjacent   = self.getAdjacent(pos)
+    return cell.Cell(color=color, strength=strength, resources=resources, type=type, 
                 isdisabled=isdisabled, adjacent=adjacent)
 
 def getDimensions(self):
     """Gets the number of rows and columns of the map"""
     return (self.__numrows__, self.__numcols__)
+
+def getGrid(self):
+    """Gets the grid type of the map"""
+    return self.__grid__
     
 def getColor(self, pos):
     """Get the color of cell (i,j)"""
     self.__checkIndices__(pos)
-    return self.__colors__[pos[0]][pos[1]]
+    return int(self.__colors__[pos[0], pos[1]])
 
 def getType(self, pos):
     """Get the type of whatever is occupying cell (i,j)."""
     self.__checkIndices__(pos)
-    return self.__types__[pos[0]][pos[1]]
+    return int(self.__types__[pos[0], pos[1]])
 
 def getStrength(self, pos):
     """Get the strength of cell (i,j)."""
     self.__checkIndices__(pos)
-    return self.__strengths__[pos[0]][pos[1]]
+    return int(self.__strengths__[pos[0], pos[1]])
 
 def getResources(self, pos):
     """Get the resource generation rate in cell (i,j)."""
     self.__checkIndices__(pos)
-    return self.__resources__[pos[0]][pos[1]]
+    return int(self.__resources__[pos[0], pos[1]])
 
 def getDisabled(self, pos):
     """Get a boolean representing whether or not cell (i,j) is disabled."""
     self.__checkIndices__(pos)
-    return self.__isdisabled__[pos[0]][pos[1]]
-
-def getAdjacent(self, pos):
-    """Get all cells adjacent to cell (i,j)"""
-    self.__checkIndices__(pos)
-    return self.__adjacent__[ pos[0] ][ pos[1] ]
+    return bool(self.__isdisabled__[pos[0], pos[1]])
 
 def getRGB(self, pos):
     """Get the RGB value corresponding to a given cell."""
     self.__checkIndices__(pos)
-    if self.__isdisabled__[ pos[0] ][ pos[1] ]: return cell.RGB_BLACK
-    else: return RGB_DICT[ self.__colors__[ pos[0] ][ pos[1] ] ]
+    if self.__isdisabled__[pos[0], pos[1]]: return cell.RGB_BLACK
+    else: return RGB_DICT[ self.__colors__[pos[0], pos[1]] ]
 
 def getAdjacent(self, pos):
     """Get all cells adjacent to the cell at the input indices."""
     self.__checkIndices__( pos )
-    return self.__adjacent__[ pos[0] ][ pos[1] ]
+    index = pos[0] * self.__numcols__ + pos[1]
+    bits  = self.__adjmask__[index]
+    return [(k // self.__numcols__, k % self.__numcols__)
+            for slot, k in enumerate(self.__neighbors__[index].tolist()) if (bits >> slot) & 1]
 
 def getTower(self, color):
     """Gets the player tower that has the input color."""
     if not cell.validPlayerColor(color):
         raise ValueError( "The input color (id:" + str(color) + ") is not a valid player color." )
-    for (i,j) in self.__towerIndices__:
-        if self.__types__[i][j] != cell.TOWER:
+    for (i,j) in self.__towers__[color]:
+        if self.__types__[i, j] != cell.TOWER:
             raise RuntimeError( "Indices (" + str(i) + "," + str(j) + ") in "
-                                + "__towerIndices__, but cell does not contain a tower." )
-        elif self.__colors__[i][j] == color:
-            return (i,j)
+                                + "__towers__, but cell does not contain a tower." )
+        return (i,j)
     raise RuntimeError( "No tower found for color " + cell.COLOR_STRINGS[color] )
 
+def getHash(self):
+    """
+    Get the 64-bit Zobrist hash of the colors, types and strengths of the cells of
+    the map. Maps of the same size with the same units and towers have the same hash.
+    """
+    if self.__debugmode__:
+        expected = 0
+        for i, j in zip(*np.nonzero(self.__colors__ | self.__types__ | self.__strengths__)):
+            expected ^= zobrist.cellKey(int(i) * self.__numcols__ + int(j), int(self.__colors__[i, j]),
+                                        int(self.__types__[i, j]), int(self.__strengths__[i, j]))
+        if expected != self.__zobrist__:
+            raise RuntimeError( "The Zobrist hash of the map does not match the board." )
+    return self.__zobrist__
+
 def getUnits(self, color):
-    """Get all units of a given color."""
+    """
+    Get all units of a given color, ordered by row and then by column. The map keeps
+    an index of the units of each color, so this does not scan the board.
+    """
     if not cell.validPlayerColor(color):
         raise ValueError("The input to getUnits was not a valid player color.")
-    # Find all indices with the input color and with type unit
-    indices = np.unravel_index(np.where( (self.__colors__.ravel()==color) &
-                                         (self.__types__.ravel()==color) ), self.__colors__.shape)
-    # We concatenate the indices vertically and take the transpose so that every
-    # row of the array contains a pair of indices into the map. We then convert this
-    # to a list and then a tuple.
-    return tuple(map(tuple,
-                     np.concatenate((indices[0],indices[1]),axis=0).transpose().tolist()))
+    units = tuple(sorted(self.__units__[color]))
+    if self.__debugmode__:
+        rows, cols = np.nonzero( (self.__colors__ == color) & (self.__types__ == cell.UNIT) )
+        if units != tuple(zip(rows.tolist(), cols.tolist())):
+            raise RuntimeError( "The unit index for color " + cell.getColorString(color) +
+                                " does not match the board." )
+    return units
@@ -0,0 +1,117 @@
+"""
+   .. module: _map_io
+    :synopsis: Saving and loading maps in a versioned binary format. The file
+    holds the raw planes of the map, its grid type and the indexes and running
+    totals that the map keeps, so that loading does not have to scan the board.
+    Every section starts at an aligned offset, so that the planes can be
+    memory-mapped. save is stored as a method and load as a class method in the
+    Map class; see map.py.
+"""
+
+from . import cell
+from ._map_private import neighborTable
+import numpy as np
+
+# Version of the file format.
+FORMAT_VERSION = 1
+
+# First bytes of a map file.
+MAGIC = b"HXMAP"
+
+# Sections of the file, in the order in which they are written. The planes are
+# followed by the positions of all units and towers, as (color, i, j) rows.
+SECTIONS = ("__colors__", "__types__", "__strengths__", "__resources__", "__isdisabled__",
+            "__adjmask__", "__neighbors__", "units", "towers")
+
+# Every section starts at a multiple of this many bytes.
+ALIGNMENT = 64
+
+HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<u2"), ("rows", "<u8"), ("cols", "<u8"),
+                         ("grid", "S16"), ("dtypes", "S8", (len(SECTIONS),)),
+                         ("offsets", "<u8", (len(SECTIONS),)), ("sizes", "<u8", (len(SECTIONS),)),
+                         ("income", "<i8", (cell.MAX_PLAYERS + 1,)), ("zobrist", "<u8")])
+
+def save(self, path, adjacency=False):
+    """
+    Save the map to a file. If adjacency is True the neighbor table is saved as well,
+    so that loading does not have to rebuild it; this takes 24 bytes per cell.
+    """
+    sections = dict((name, getattr(self, name)) for name in SECTIONS[:6])
+    sections["__neighbors__"] = self.__neighbors__ if adjacency else np.zeros(0, dtype=self.__neighbors__.dtype)
+    sections["units"]  = np.array([(color, i, j) for color in range(cell.MAX_PLAYERS + 1)
+                                   for (i, j) in sorted(self.__units__[color])], dtype=np.int64).reshape(-1, 3)
+    sections["towers"] = np.array([(color, i, j) for color in range(cell.MAX_PLAYERS + 1)
+                                   for (i, j) in sorted(self.__towers__[color])], dtype=np.int64).reshape(-1, 3)
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header["magic"], header["version"] = MAGIC, FORMAT_VERSION
+    header["rows"], header["cols"], header["grid"] = self.__numrows__, self.__numcols__, self.__grid__
+    header["income"], header["zobrist"] = self.__income__, self.__zobrist__
+    offset = -(-HEADER_DTYPE.itemsize // ALIGNMENT) * ALIGNMENT
+    for k, name in enumerate(SECTIONS):
+        header["dtypes"][0, k]  = sections[name].dtype.str
+        header["offsets"][0, k] = offset
+        header["sizes"][0, k]   = sections[name].size
+        offset += -(-sections[name].nbytes // ALIGNMENT) * ALIGNMENT
+    with open(path, "wb") as f:
+        f.write(header.tobytes())
+        for k, name in enumerate(SECTIONS):
+            f.seek(int(header["offsets"][0, k]))
+            f.write(np.ascontiguousarray(sections[name]).tobytes())
+        # Pad the file to the end of the last section.
+        f.truncate(offset)
+
+def load(cls, path, mmap=True, debug=False):
+    """
+    Load a map saved with save. If mmap is True the planes are memory-mapped instead of
+    read in, so that only the parts of the board that are used are read from disk;
+    changes to the map are never written back to the file.
+    """
+    header = np.fromfile(path, dtype=HEADER_DTYPE, count=1)
+    if len(header) != 1 or header[0]["magic"] != MAGIC:
+        raise ValueError( "The file " + path + " is not a map file." )
+    header = header[0]
+    if header["version"] != FORMAT_VERSION:
+        raise ValueError( "The file " + path + " has version " + str(header["version"]) +
+                          "; only version " + str(FORMAT_VERSION) + " can be read." )
+    m, n = int(header["rows"]), int(header["cols"])
+    def section(k, shape):
+        dtype, offset, size = np.dtype(header["dtypes"][k].decode()), int(header["offsets"][k]), int(header["sizes"][k])
+        if mmap and size > 0:
+            return np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=shape)
+        # np.fromfile only takes an offset from numpy 1.17 on, so seek to the section first.
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return np.fromfile(f, dtype=dtype, count=size).reshape(shape)
+    game_map = object.__new__(cls)
+    game_map.__numrows__      = m
+    game_map.__numcols__      = n
+    game_map.__grid__         = header["grid"].decode()
+    game_map.__colors__       = section(0, (m, n))
+    game_map.__types__        = section(1, (m, n))
+    game_map.__strengths__    = section(2, (m, n))
+    game_map.__resources__    = section(3, (m, n))
+    game_map.__isdisabled__   = section(4, (m, n))
+    game_map.__adjmask__      = section(5, (m * n,))
+    if header["sizes"][6] > 0:
+        game_map.__neighbors__ = section(6, (m * n, int(header["sizes"][6]) // (m * n)))
+    else:
+        game_map.__neighbors__ = neighborTable(game_map.__grid__, m, n)
+    game_map.__maxstrength__  = int(np.iinfo(game_map.__strengths__.dtype).max)
+    game_map.__maxresources__ = int(np.iinfo(game_map.__resources__.dtype).max)
+    game_map.__units__        = [set() for color in range(cell.MAX_PLAYERS + 1)]
+    game_map.__towers__       = [set() for color in range(cell.MAX_PLAYERS + 1)]
+    game_map.__towerIndices__ = set()
+    for color, i, j in section(7, (int(header["sizes"][7]) // 3, 3)).tolist():
+        game_map.__units__[color].add( (i, j) )
+    for color, i, j in section(8, (int(header["sizes"][8]) // 3, 3)).tolist():
+        game_map.__towers__[color].add( (i, j) )
+        game_map.__towerIndices__.add( (i, j) )
+    game_map.__income__       = [int(x) for x in header["income"]]
+    game_map.__debugmode__    = debug
+    game_map.__zobrist__      = int(header["zobrist"])
+    game_map.__journal__      = None
+    game_map.__marks__        = None
+    game_map.__changes__      = None
+    game_map.__stats__        = None
+    game_map.__shared__       = set()
+    return game_map
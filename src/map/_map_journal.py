@@ -0,0 +1,65 @@
+"""
+   .. module: _map_journal
+    :synopsis: A journal of the changes made to the cells of a map, so that
+    moves can be undone without copying the map. All of these functions are
+    stored as methods in the Map class; see map.py.
+"""
+
+def startJournal(self):
+    """
+    Start recording the previous state of every cell whose color, type or strength
+    changes, so that moves can be undone with unmakeMove and rollback. Changes to the
+    resources or the disabled status of a cell are not recorded.
+    """
+    self.__journal__ = []
+    self.__marks__   = []
+
+def stopJournal(self):
+    """Stop recording changes and discard the journal."""
+    self.__journal__ = None
+    self.__marks__   = None
+
+def journalLength(self):
+    """
+    Get the number of changes in the journal. Passing the result to rollbackJournal
+    undoes every change made after this call.
+    """
+    if self.__journal__ is None:
+        raise RuntimeError( "The map is not keeping a journal; call startJournal first." )
+    return len(self.__journal__)
+
+def rollbackJournal(self, length):
+    """Undo the most recent changes in the journal until it has the input length."""
+    if self.__journal__ is None:
+        raise RuntimeError( "The map is not keeping a journal; call startJournal first." )
+    elif length < 0 or length > len(self.__journal__):
+        raise ValueError( "Cannot roll the journal back to length " + str(length) + "." )
+    journal = self.__journal__
+    # Switch the journal off while restoring cells so the restores are not recorded.
+    self.__journal__ = None
+    while len(journal) > length:
+        i, j, color, cell_type, strength = journal.pop()
+        self.__writeCell__(i, j, color, cell_type, strength)
+    self.__journal__ = journal
+    while self.__marks__ and self.__marks__[-1] >= length:
+        self.__marks__.pop()
+
+def unmakeMove(self):
+    """
+    Undo the most recent move made through makeMove or applyMoves, along with every
+    other change made after it (for instance a call to removeColor).
+    """
+    if self.__journal__ is None:
+        raise RuntimeError( "The map is not keeping a journal; call startJournal first." )
+    elif not self.__marks__:
+        raise RuntimeError( "There are no moves in the journal to undo." )
+    self.rollbackJournal( self.__marks__[-1] )
+
+def rollback(self, n):
+    """Undo the n most recent moves."""
+    if type(n) is not int:
+        raise TypeError( "The input to rollback must be of type int." )
+    elif self.__marks__ is None or n > len(self.__marks__):
+        raise ValueError( "Cannot undo " + str(n) + " moves." )
+    for k in range(n):
+        self.unmakeMove()
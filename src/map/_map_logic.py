@@ -6,6 +6,7 @@
 """
 
 from . import cell
+from ._map_private import MAX_NEIGHBORS, NO_NEIGHBOR
 import numpy as np
 
 def collectResources(self):
@@ -21,15 +22,20 @@ def collectResources(self):
 def collectPlayerResources(self, color):
     """
     Returns the number of resources a single player can claim at the end of a round.
+    The total is kept up to date as cells change (see __indexCell__), so this takes
+    constant time; in debug mode it is checked against a scan of the whole board.
     """
     if type(color) is not int:
         raise TypeError( "Input to this function should be a valid color (see cell.py) of type int." )
     if not cell.validColor(color):
         raise ValueError( "Input color not recognized (received: " + str(color) + ")" )
-    # Get all the indices on the map where the color of a cell is equal to <color>
-    color_indices = np.unravel_index(np.where(self.__colors__.ravel()==color),self.__colors__.shape)
-    tower_resources = cell.TOWER_RESOURCES * np.sum(self.__types__[color_indices] == cell.TOWER)
-    return int(np.round(np.sum(self.__resources__[color_indices]) + tower_resources))
+    if self.__debugmode__:
+        expected = self.__countPlayerResources__(color)
+        if self.__income__[color] != expected:
+            raise RuntimeError( "Resource total for color " + cell.getColorString(color) + " is " +
+                                str(self.__income__[color]) + ", but the board holds " +
+                                str(expected) + "." )
+    return self.__income__[color]
 
 def makeMove(self, from_position, to_position):
     """
@@ -38,61 +44,158 @@ def makeMove(self, from_position, to_position):
     from_x, from_y = from_position[0], from_position[1]
     to_x, to_y     = to_position[0], to_position[1]
     self.__checkAdjacent__(from_position, to_position)
-    if self.__isdisabled__[ to_x ][ to_y ]:
+    if self.__isdisabled__[to_x, to_y]:
         raise RuntimeError( "Cannot move a unit into a disabled cell." )
-    if self.__types__[ from_x ][ from_y ] != cell.UNIT:
+    self.__resolveMove__(from_x, from_y, to_x, to_y)
+
+def applyMoves(self, from_positions, to_positions, color=None, stop_on_capture=False, moved=None):
+    """
+    Moves the units in from_positions[k] to to_positions[k] for every k, in order.
+    The result is the same as calling makeMove on each pair in turn, but the
+    positions and adjacencies of the whole batch are checked at once before any unit
+    is moved. If color is given, every move is checked as a move of the player with
+    that color (see __checkUnitMove__): units at the positions in moved, or that were
+    moved earlier in the batch, cannot move again. If stop_on_capture is True, no
+    further moves are made after a tower is destroyed.
+    Returns a list of (k, color) pairs: move k destroyed the tower of that color.
+    If move k turns out to be invalid, moves 0,...,k-1 stay applied and the exception
+    that is raised has its num_applied attribute set to k.
+    """
+    from_positions = np.asarray(from_positions, dtype=np.int64).reshape(-1, 2)
+    to_positions   = np.asarray(to_positions, dtype=np.int64).reshape(-1, 2)
+    if from_positions.shape != to_positions.shape:
+        raise ValueError( "applyMoves received different numbers of start and end positions." )
+    shape = np.array([self.__numrows__, self.__numcols__])
+    for positions in (from_positions, to_positions):
+        if np.any(positions < 0):
+            raise ValueError( "Received a negative index." )
+        elif np.any(positions >= shape):
+            raise IndexError( "Index out of bounds." )
+    from_indices = from_positions[:,0] * self.__numcols__ + from_positions[:,1]
+    to_indices   = to_positions[:,0] * self.__numcols__ + to_positions[:,1]
+    # A pair of cells is adjacent if the end cell appears in a slot of the start
+    # cell's row of the neighbor table whose bit is set in the adjacency bitmask.
+    bits = (self.__adjmask__[from_indices][:,None] >> np.arange(MAX_NEIGHBORS)) & 1
+    is_adjacent = np.any((self.__neighbors__[from_indices] == to_indices[:,None]) & (bits == 1), axis=1)
+    if not np.all(is_adjacent):
+        k = int(np.argmin(is_adjacent))
+        raise RuntimeError( "Cells " + str(tuple(from_positions[k].tolist())) + " and " +
+                            str(tuple(to_positions[k].tolist())) + " are not adjacent." )
+    moved = set() if moved is None else set(tuple(pos) for pos in moved)
+    captured = []
+    for k, (from_x, from_y, to_x, to_y) in enumerate(np.hstack((from_positions, to_positions)).tolist()):
+        tower_color = None
+        if self.__types__[to_x, to_y] == cell.TOWER:
+            tower_color = int(self.__colors__[to_x, to_y])
+        try:
+            if color is not None:
+                self.__checkUnitMove__(from_x, from_y, color, moved)
+            self.__resolveMove__(from_x, from_y, to_x, to_y)
+        except (RuntimeError, OverflowError) as error:
+            error.num_applied = k
+            raise
+        moved.add((to_x, to_y))
+        if tower_color is not None and self.__types__[to_x, to_y] != cell.TOWER:
+            captured += [(k, tower_color)]
+            if stop_on_capture:
+                break
+    return captured
+
+def legalMoves(self, color, moved=()):
+    """
+    Get every move that the player with the input color can make, computed for all of
+    its units at once. Returns three integer arrays with one (i,j) pair per row:
+    the start and end positions of every legal unit move, and the empty cells next to
+    the player's tower where a new unit can be made. Units at the positions in moved
+    are left out, since a unit can only move once per turn.
+    """
+    if not cell.validPlayerColor(color):
+        raise ValueError( "The input to legalMoves was not a valid player color." )
+    n = self.__numcols__
+    units = [pos for pos in self.__units__[color] if pos not in moved]
+    unit_indices = np.array([i * n + j for (i,j) in sorted(units)], dtype=np.int64)
+    colors, types = self.__colors__.ravel(), self.__types__.ravel()
+    # A unit can move into every enabled neighbor except the tower of its own color.
+    neighbors = self.__neighbors__[unit_indices]
+    bits      = (self.__adjmask__[unit_indices][:,None] >> np.arange(MAX_NEIGHBORS)) & 1
+    targets   = np.where(neighbors == NO_NEIGHBOR, 0, neighbors)
+    own_tower = (colors[targets] == color) & (types[targets] == cell.TOWER)
+    is_legal  = (bits == 1) & ~own_tower
+    from_indices = np.repeat(unit_indices, MAX_NEIGHBORS)[is_legal.ravel()]
+    to_indices   = neighbors[is_legal]
+    # New units are made in the empty, enabled cells around the player's tower.
+    build_indices = np.zeros(0, dtype=np.int64)
+    for (i,j) in sorted(self.__towers__[color]):
+        neighbors = self.__neighbors__[i * n + j]
+        bits      = (self.__adjmask__[i * n + j] >> np.arange(MAX_NEIGHBORS)) & 1
+        neighbors = neighbors[bits == 1]
+        build_indices = np.union1d(build_indices, neighbors[types[neighbors] == cell.EMPTY])
+    def positions(indices):
+        return np.stack((indices // n, indices % n), axis=1).astype(np.int64)
+    return positions(from_indices), positions(to_indices), positions(build_indices)
+
+def __checkUnitMove__(self, from_x, from_y, color, moved):
+    """
+    Checks that the player with the input color can move the unit in cell
+    (from_x,from_y), given the positions of the units that have already moved this
+    turn. Game.moveUnit and applyMoves make the same checks in the same order, so that
+    they raise the same errors. The indices are assumed to have been checked already.
+    """
+    if self.getColorUnchecked(from_x, from_y) != color:
+        raise RuntimeError( "Trying to move a piece from a different player, or an empty square." )
+    elif self.getTypeUnchecked(from_x, from_y) != cell.UNIT:
+        raise RuntimeError( "The piece that is attempting to be moved is not of type cell.UNIT." )
+    elif (from_x, from_y) in moved:
+        raise RuntimeError( "That piece has already moved this turn." )
+
+def __resolveMove__(self, from_x, from_y, to_x, to_y):
+    """
+    Moves the unit in cell (from_x,from_y) into the adjacent cell (to_x,to_y),
+    merging it with a unit of the same color or fighting a unit of another color.
+    The indices are assumed to have been checked already.
+    """
+    if self.__types__[from_x, from_y] != cell.UNIT:
         raise RuntimeError( "Only units can be moved." )
-    start_color    = self.__colors__[ from_x ][ from_y ]
-    end_color      = self.__colors__[ to_x ][ to_y ]
-    start_strength = self.__strengths__[ from_x ][ from_y ]
+    start_color    = int(self.__colors__[from_x, from_y])
+    end_color      = int(self.__colors__[to_x, to_y])
+    start_strength = int(self.__strengths__[from_x, from_y])
+    end_strength   = int(self.__strengths__[to_x, to_y])
     # Deal with two cases:
     #    1. The colors of the start and end tiles are the same
     #    2. The colors of the start and end tiles are different.
     if start_color == end_color:
-        if self.__types__[ to_x ][ to_y ] == cell.TOWER:
+        if self.__types__[to_x, to_y] == cell.TOWER:
             raise RuntimeError( "Moving unit into its own tower." )
         # We combine the strengths of units if they have the same color
-        self.__strengths__[to_x][to_y] += start_strength
+        if end_strength + start_strength > self.__maxstrength__:
+            raise OverflowError( "The combined strength of the units is larger than the " +
+                                 "maximum strength (" + str(self.__maxstrength__) + ") of this map." )
+        final_color, final_type = end_color, int(self.__types__[to_x, to_y])
+        final_strength = end_strength + start_strength
     else:
-        final_strength = self.__strengths__[to_x][to_y] - start_strength
+        final_strength = end_strength - start_strength
         # We take abs(strength of #1 - strength of #2) and set the color
         # of the end square to be that of the stronger unit.
         if final_strength > 0:
-            self.__strengths__[ to_x ][ to_y ] = final_strength
-            self.__types__[ to_x ][ to_y ]     = cell.UNIT
+            final_color, final_type = end_color, cell.UNIT
         elif final_strength < 0:
-            self.__strengths__[ to_x ][ to_y ] = -final_strength
-            self.__colors__[ to_x ][ to_y ]    = start_color
-            self.__types__[ to_x ][ to_y ]     = cell.UNIT
+            final_color, final_type = start_color, cell.UNIT
+            final_strength = -final_strength
         else:
-            self.__colors__[ to_x ][ to_y ] = cell.EMPTY
-            self.__types__[ to_x ][ to_y ]  = cell.EMPTY
+            final_color, final_type = cell.EMPTY, cell.EMPTY
+            final_strength = end_strength
+    # Everything written from here on is undone together by unmakeMove.
+    if self.__journal__ is not None:
+        self.__marks__.append( len(self.__journal__) )
+    self.__writeCell__( to_x, to_y, final_color, final_type, final_strength )
     # Make the starting cell empty
-    self.__colors__[ from_x ][ from_y ]    = cell.EMPTY
-    self.__types__[ from_x ][ from_y ]     = cell.EMPTY
-    self.__strengths__[ from_x ][ from_y ] = cell.EMPTY
-    
-
-
-        
-    
-    
-"""
-Remove all units of a specified color from the board. Also removes indices of towers
-from map's __towerIndices__ field.
-"""
+    self.__writeCell__( from_x, from_y, cell.EMPTY, cell.EMPTY, cell.EMPTY )
 
 def removeColor(self, color):
     """
     Remove all units of a specified color from the board. Also removes indices of towers
     from map's __towerIndices__ field.
     """
-    self.__towerIndices__ = set([pos for pos in self.__towerIndices__ if
-                                 self.__colors__[pos[0]][pos[1]] != color])
-    is_destroyed_color = self.__colors__ == color
-    for i in range(self.__numrows__):
-        for j in range(self.__numcols__):
-            if is_destroyed_color[i][j]:
-                self.__colors__[i][j] = cell.EMPTY
-                self.__types__[i][j] = cell.EMPTY
-                self.__strengths__[i][j] = cell.EMPTY
+    rows, cols = np.nonzero(self.__colors__ == color)
+    for i, j in zip(rows.tolist(), cols.tolist()):
+        self.__writeCell__(i, j, cell.EMPTY, cell.EMPTY, cell.EMPTY)
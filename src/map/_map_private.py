@@ -5,85 +5,93 @@
 """
 
 from . import cell
+from . import zobrist
+import numpy as np
 
-def __setAllAdjacencies__(self):
+# Offsets (di,dj) from a cell to each of its neighbors, in the order in which the
+# neighbors are stored in a row of the neighbor table. On hexagonal maps the two
+# diagonal neighbors depend on whether the row index is even or odd.
+HEX_OFFSETS_EVEN = ((-1,0), (1,0), (0,1), (0,-1), (-1,-1), (1,-1))
+HEX_OFFSETS_ODD  = ((-1,0), (1,0), (0,1), (0,-1), (-1,1),  (1,1))
+SQUARE_OFFSETS   = ((1,0), (-1,0), (0,1), (0,-1))
+
+# Every row of the neighbor table has MAX_NEIGHBORS slots; unused slots are
+# padded with NO_NEIGHBOR.
+MAX_NEIGHBORS = 6
+NO_NEIGHBOR   = -1
+
+def neighborOffsets(grid, i):
+    """Get the neighbor offsets for a cell in row i of a map with the input grid type."""
+    if grid in cell.HEX_MAP_TYPE:
+        return HEX_OFFSETS_ODD if i % 2 else HEX_OFFSETS_EVEN
+    elif grid in cell.SQUARE_MAP_TYPE:
+        return SQUARE_OFFSETS
+    else:
+        raise ValueError( "Grid type not found." )
+
+def neighborTable(grid, m, n):
     """
-    Get an m x n array where entry (i,j) is a list of tuples (k,l) representing the indices of
-    a cell adjacent to (i,j).
-    This function loops over all of the cells in the map and uses the __setAdjacent__ function
-    to find adjacent cells.
-    There are two types of grids: hexagonal and square.
+    Build an (m*n) x MAX_NEIGHBORS array whose row k contains the flat indices
+    (i*n + j) of the cells adjacent to cell k = i*n + j, padded with NO_NEIGHBOR.
+    The table only depends on the shape of the map, not on which cells are disabled.
     """
-    self.__adjacent__ = []
-    for i in range(0,self.__numrows__):
-        self.__adjacent__ += [[]]
-        for j in range(0,self.__numcols__):
-            self.__adjacent__[i] += [[]]
-    # Set grid for hexagonal maps
-    if self.__grid__ in cell.HEX_MAP_TYPE:
-        for i in range(0,self.__numrows__):
-            for j in range(0,self.__numcols__):
-                self.__setAdjacent_hex__( (i,j) )
-    # Set grid for square maps
-    elif self.__grid__ in cell.SQUARE_MAP_TYPE:
-        for i in range(0,self.__numrows__):
-            for j in range(0,self.__numcols__):
-                self.__setAdjacent_square__( (i,j) )
-    else:
+    if grid not in cell.HEX_MAP_TYPE + cell.SQUARE_MAP_TYPE:
         raise ValueError( "Grid type not found." )
+    dtype   = np.int32 if m * n < 2**31 else np.int64
+    indices = np.arange(m * n, dtype=dtype).reshape(m, n)
+    table   = np.full((m, n, MAX_NEIGHBORS), NO_NEIGHBOR, dtype=dtype)
+    # Fill the table one slot at a time for the even and the odd rows, copying the
+    # block of indices that lies inside the map after shifting it by the offset.
+    for parity in (0, 1):
+        for slot, (di, dj) in enumerate(neighborOffsets(grid, parity)):
+            rows = np.arange(parity, m, 2)
+            rows = rows[(rows + di >= 0) & (rows + di < m)]
+            start, stop = max(0, -dj), min(n, n - dj)
+            if stop > start:
+                table[rows, start:stop, slot] = indices[rows + di, start + dj:stop + dj]
+    table = table.reshape(m * n, MAX_NEIGHBORS)
+    return table
 
-def __setAdjacent__(self, pos):
+def adjacencyMask(table, isdisabled):
     """
-    Generalized setAdjacent function. Sets the adjacencies based on the type of
-    grid that we are using.
+    Get the adjacency bitmask for a neighbor table: bit s of entry k is set if and
+    only if slot s of row k holds a cell that is not disabled.
     """
-    if type(pos) not in (list, tuple):
-        raise TypeError( "The input to __setAdjacent__ must be of type list or tuple." )
-    elif len(pos) != 2:
-        raise ValueError( "The input to __setAdjacent__ must have length 2." )
-    if self.__grid__ in cell.HEX_MAP_TYPE:
-        self.__setAdjacent_hex__( pos )
-    elif self.__grid__ in cell.SQUARE_MAP_TYPE:
-        self.__setAdjacent_square__( pos )
-    else:
-        raise ValueError( "The grid type was not recognized." )
+    enabled = np.concatenate((~isdisabled.ravel(), [False]))
+    mask = np.zeros(table.shape[0], dtype=np.uint8)
+    for slot in range(table.shape[1]):
+        # NO_NEIGHBOR (-1) indexes the trailing False entry of <enabled>.
+        mask |= enabled[table[:, slot]].astype(np.uint8) << slot
+    return mask
 
-def __setAdjacent_hex__(self, pos):
+def __setAllAdjacencies__(self):
     """
-    Get all the cells that are adjacent to the cell with the input row and column. Sets
-    entry (i,j) to be equal to the list of adjacent cells in self.adjacent. Used for
-    hexagonal grids.
+    Set up the neighbor table and the adjacency bitmask of the map. Row k of
+    __neighbors__ lists the flat indices of the cells next to cell k = i*numcols + j,
+    and bit s of __adjmask__[k] records whether slot s of that row is a cell that
+    units can move into.
+    There are two types of grids: hexagonal and square.
     """
-    self.__checkIndices__(pos)
-    i, j = pos; adjacent = []
-    # Create a function that will take a list of cells that are possible adjacent
-    # to cell (i,j) and filters out the ones that are disabled or lay outside
-    # of the map.
-    def filterfn(p):
-        do_not_filter = 0 <= p[0] < self.__numrows__ and 0 <= p[1] < self.__numcols__
-        return do_not_filter and not self.__isdisabled__[p[0]][p[1]]
-    possibly_adjacent = [(i-1,j),(i+1,j),(i,j+1),(i,j-1)]
-    if i % 2 == 0:
-        possibly_adjacent += [(i-1,j-1),(i+1,j-1)]
-    else:
-        possibly_adjacent += [(i-1,j+1),(i+1,j+1)]
-    for cell in filter(filterfn, possibly_adjacent):
-        adjacent += [cell]
-    self.__adjacent__[i][j] = adjacent
+    self.__neighbors__ = neighborTable(self.__grid__, self.__numrows__, self.__numcols__)
+    self.__adjmask__   = adjacencyMask(self.__neighbors__, self.__isdisabled__)
 
-def __setAdjacent_square__(self, pos):
+def __setAdjacent__(self, pos):
     """
-    Sets all adjacencies in the map for a map with square tiles.
+    Recompute the row of the adjacency bitmask belonging to the input cell, based on
+    which of its neighbors are currently disabled.
     """
+    if type(pos) not in (list, tuple):
+        raise TypeError( "The input to __setAdjacent__ must be of type list or tuple." )
+    elif len(pos) != 2:
+        raise ValueError( "The input to __setAdjacent__ must have length 2." )
     self.__checkIndices__(pos)
-    i, j = pos; adjacent = []
-    # Function to filter out nonexistent cells.
-    def filterfn(p):
-        do_not_filter = 0 <= p[0] < self.__numrows__ and 0 <= p[1] < self.__numcols__
-        return do_not_filter and not self.__isdisabled__[p[0]][p[1]]
-    for cell in filter(filterfn, ( (i+1,j), (i-1,j), (i,j+1), (i,j-1) )):
-        adjacent += [cell]
-    self.__adjacent__[i][j] = adjacent
+    n = self.__numcols__
+    bits = 0
+    for slot, k in enumerate(self.__neighbors__[pos[0] * n + pos[1]].tolist()):
+        if k != NO_NEIGHBOR and not self.__isdisabled__[k // n, k % n]:
+            bits |= 1 << slot
+    self.__detach__("__adjmask__")
+    self.__adjmask__[pos[0] * n + pos[1]] = bits
 
 def __checkIndices__(self,pos):
     """
@@ -104,9 +112,115 @@ def __checkAdjacent__(self,from_position,to_position):
     Takes two tuples with two values, representing the x and y coordinates of the
     positions on the map.
     """
-    from_x, from_y = from_position[0], from_position[1]
     self.__checkIndices__( from_position )
     self.__checkIndices__( to_position )
-    if to_position not in self.__adjacent__[from_x][from_y]:
-        raise RuntimeError("Cells " + str( from_position ) + " and " + str( to_position ) 
+    n = self.__numcols__
+    from_index = from_position[0] * n + from_position[1]
+    to_index   = to_position[0] * n + to_position[1]
+    row = self.__neighbors__[from_index].tolist()
+    if to_index not in row or not (self.__adjmask__[from_index] >> row.index(to_index)) & 1:
+        raise RuntimeError("Cells " + str( from_position ) + " and " + str( to_position )
                            + " are not adjacent.")
+
+def __indexCell__(self, i, j):
+    """
+    Add cell (i,j) to the running totals, the unit and tower indexes and the Zobrist
+    hash that the map keeps about the board. Every function that changes the color,
+    type, strength or resources of a cell calls __unindexCell__ before the change and
+    __indexCell__ after it.
+    """
+    color, cell_type = int(self.__colors__[i, j]), int(self.__types__[i, j])
+    self.__zobrist__ ^= zobrist.cellKey(i * self.__numcols__ + j, color, cell_type,
+                                        int(self.__strengths__[i, j]))
+    income = int(self.__resources__[i, j])
+    if cell_type == cell.UNIT:
+        self.__units__[color].add( (int(i), int(j)) )
+    elif cell_type == cell.TOWER:
+        income += cell.TOWER_RESOURCES
+        self.__towerIndices__.add( (int(i), int(j)) )
+        self.__towers__[color].add( (int(i), int(j)) )
+    self.__income__[color] += income
+
+def __unindexCell__(self, i, j):
+    """Remove cell (i,j) from the running totals, indexes and hash of the map."""
+    color, cell_type = int(self.__colors__[i, j]), int(self.__types__[i, j])
+    self.__zobrist__ ^= zobrist.cellKey(i * self.__numcols__ + j, color, cell_type,
+                                        int(self.__strengths__[i, j]))
+    income = int(self.__resources__[i, j])
+    if cell_type == cell.UNIT:
+        self.__units__[color].discard( (int(i), int(j)) )
+    elif cell_type == cell.TOWER:
+        income += cell.TOWER_RESOURCES
+        self.__towerIndices__.discard( (int(i), int(j)) )
+        self.__towers__[color].discard( (int(i), int(j)) )
+    self.__income__[color] -= income
+
+def __writeCell__(self, i, j, color, cell_type, strength):
+    """
+    Set the color, type and strength of cell (i,j), keeping the running totals and
+    indexes of the map up to date and recording the previous state of the cell in
+    the journal if one is being kept. No checks are performed on the input values.
+    """
+    self.__detach__("__colors__", "__types__", "__strengths__")
+    if self.__journal__ is not None:
+        self.__journal__.append( (i, j, int(self.__colors__[i, j]), int(self.__types__[i, j]),
+                                  int(self.__strengths__[i, j])) )
+    self.__unindexCell__(i, j)
+    self.__colors__[i, j]    = color
+    self.__types__[i, j]     = cell_type
+    self.__strengths__[i, j] = strength
+    self.__indexCell__(i, j)
+    self.__markChanged__(i, j)
+
+def __getPlanes__(self):
+    """
+    Get the m x n arrays of the colors, types, strengths, resources and disabled cells
+    of the map, in the order taken by __loadPlanes__. The arrays are not copied, so
+    they must not be changed.
+    """
+    return (self.__colors__, self.__types__, self.__strengths__, self.__resources__,
+            self.__isdisabled__)
+
+def __loadPlanes__(self, colors, types, strengths, resources, isdisabled):
+    """
+    Replace the whole board with the input m x n arrays and rebuild the running
+    totals, indexes, hash and adjacency bitmask of the map. Values that do not fit
+    in the map's planes raise an OverflowError. The change is not journaled, so any
+    journal that is being kept is cleared.
+    """
+    planes = (("__colors__", colors), ("__types__", types), ("__strengths__", strengths),
+              ("__resources__", resources), ("__isdisabled__", isdisabled))
+    for name, values in planes:
+        values, dtype = np.asarray(values), getattr(self, name).dtype
+        if values.shape != (self.__numrows__, self.__numcols__):
+            raise ValueError( "The input planes must have the same dimensions as the map." )
+        elif values.size and dtype != bool and (values.min() < np.iinfo(dtype).min or
+                                                values.max() > np.iinfo(dtype).max):
+            raise OverflowError( "The values of " + name + " do not fit in the planes of this map." )
+    for name, values in planes:
+        setattr(self, name, np.array(values, dtype=getattr(self, name).dtype))
+        self.__shared__.discard(name)
+    self.__towerIndices__ = set()
+    self.__units__        = [set() for color in range(cell.MAX_PLAYERS + 1)]
+    self.__towers__       = [set() for color in range(cell.MAX_PLAYERS + 1)]
+    self.__income__       = [0] * (cell.MAX_PLAYERS + 1)
+    self.__zobrist__      = 0
+    occupied = (self.__colors__ != 0) | (self.__types__ != 0) | (self.__strengths__ != 0) | \
+               (self.__resources__ != 0)
+    for i, j in zip(*[x.tolist() for x in np.nonzero(occupied)]):
+        self.__indexCell__(i, j)
+    self.__adjmask__ = adjacencyMask(self.__neighbors__, self.__isdisabled__)
+    self.__shared__.discard("__adjmask__")
+    if self.__journal__ is not None:
+        self.__journal__, self.__marks__ = [], []
+    if self.__changes__ is not None:
+        self.__changes__.update( (i, j) for i in range(self.__numrows__) for j in range(self.__numcols__) )
+
+def __countPlayerResources__(self, color):
+    """
+    Compute the resources that the input color can claim by scanning the whole board.
+    Used to check the running totals in debug mode.
+    """
+    is_color = self.__colors__ == color
+    tower_resources = cell.TOWER_RESOURCES * int(np.sum(self.__types__[is_color] == cell.TOWER))
+    return int(np.sum(self.__resources__[is_color])) + tower_resources
@@ -0,0 +1,52 @@
+"""
+   .. module: _map_snapshot
+    :synopsis: Copy-on-write snapshots of a map. A snapshot shares the NumPy
+    planes of the map it was taken from; whichever of the two maps writes to a
+    shared plane first makes its own copy of that plane. All of these functions
+    are stored as methods in the Map class; see map.py.
+"""
+
+# Planes that a snapshot shares with the map it was taken from. The neighbor
+# table is never written to after the map is built, so it is always shared.
+SHARED_PLANES = ("__colors__", "__types__", "__strengths__", "__resources__",
+                 "__isdisabled__", "__adjmask__")
+
+def snapshot(self):
+    """
+    Get a copy-on-write copy of the map. No data is copied until either the map or
+    the snapshot writes to one of its planes, at which point only that plane is
+    copied. Changes to one map are never visible from the other.
+    """
+    copy = object.__new__(type(self))
+    copy.__dict__.update(self.__dict__)
+    for name in SHARED_PLANES:
+        # Both maps hold read-only views of the plane until they detach from it, so
+        # that a write that bypasses __detach__ raises instead of leaking through.
+        plane = getattr(self, name).view()
+        plane.flags.writeable = False
+        setattr(self, name, plane)
+        setattr(copy, name, plane)
+    self.__shared__ = set(SHARED_PLANES)
+    copy.__shared__ = set(SHARED_PLANES)
+    copy.__towerIndices__ = set(self.__towerIndices__)
+    copy.__income__       = list(self.__income__)
+    copy.__units__        = [set(units) for units in self.__units__]
+    copy.__towers__       = [set(towers) for towers in self.__towers__]
+    copy.__journal__      = None
+    copy.__marks__        = None
+    copy.__changes__      = None
+    # The timing wrappers of the map are bound to it, not to the copy.
+    copy.stopStats()
+    return copy
+
+def __detach__(self, *names):
+    """
+    Make a private copy of each of the input planes that the map still shares with
+    a snapshot, so that the plane can be written to.
+    """
+    if not self.__shared__:
+        return
+    for name in names:
+        if name in self.__shared__:
+            setattr(self, name, getattr(self, name).copy())
+            self.__shared__.discard(name)
@@ -0,0 +1,36 @@
+"""
+   .. module: _map_stats
+    :synopsis: Timing of the hot paths of a map (see stats.py). All of these
+    functions are stored as methods in the Map class; see map.py.
+"""
+
+from . import stats as statsmod
+
+# Methods that are timed while stats are on. Calls between them are timed too, so
+# the time of makeMove includes the time of the __checkIndices__ calls it makes. The
+# moves of a Game go through makeMoveUnchecked.
+TIMED_METHODS = ("makeMove", "makeMoveUnchecked", "getUnits", "collectPlayerResources",
+                 "__checkIndices__")
+
+def startStats(self, stats=None):
+    """
+    Start timing the methods in TIMED_METHODS, under the names "map.<method>". The
+    times are added to the input Stats object, or to a new one if it is None. Returns
+    the Stats object. Snapshots of the map are not timed.
+    """
+    self.stopStats()
+    self.__stats__ = statsmod.Stats() if stats is None else stats
+    for name in TIMED_METHODS:
+        method = getattr(type(self), name).__get__(self, type(self))
+        setattr(self, name, self.__stats__.wrap("map." + name, method))
+    return self.__stats__
+
+def stopStats(self):
+    """Stop timing the map's methods. The Stats object keeps what it has recorded."""
+    for name in TIMED_METHODS:
+        self.__dict__.pop(name, None)
+    self.__stats__ = None
+
+def getStats(self):
+    """Get the Stats object that the map is recording to, or None if stats are off."""
+    return self.__stats__
@@ -0,0 +1,47 @@
+"""
+   .. module: _map_unchecked
+    :synopsis: Unchecked accessors for trusted engine code. These read and
+    write single cells by their (i,j) indices without checking the indices or
+    the values, so callers that have already validated a position (or got it
+    from the map itself, for instance from getAdjacent, getUnits or legalMoves)
+    do not pay for the checks again. Out of range indices are not caught, and
+    negative indices wrap around as they do in NumPy. The getters and setters
+    in _map_getters_setters.py stay the checked API for everyone else. All of
+    these functions are stored as methods in the Map class; see map.py.
+"""
+
+def getColorUnchecked(self, i, j):
+    """Get the color of cell (i,j) without checking the indices."""
+    return int(self.__colors__[i, j])
+
+def getTypeUnchecked(self, i, j):
+    """Get the type of cell (i,j) without checking the indices."""
+    return int(self.__types__[i, j])
+
+def getStrengthUnchecked(self, i, j):
+    """Get the strength of cell (i,j) without checking the indices."""
+    return int(self.__strengths__[i, j])
+
+def getResourcesUnchecked(self, i, j):
+    """Get the resources of cell (i,j) without checking the indices."""
+    return int(self.__resources__[i, j])
+
+def getDisabledUnchecked(self, i, j):
+    """Get whether cell (i,j) is disabled without checking the indices."""
+    return bool(self.__isdisabled__[i, j])
+
+def setCellUnchecked(self, i, j, color, cell_type, strength):
+    """
+    Set the color, type and strength of cell (i,j) without checking the indices or the
+    values. The indexes, totals, hash, journal and changed cells of the map are kept
+    up to date as for setCell.
+    """
+    self.__writeCell__(i, j, color, cell_type, strength)
+
+def makeMoveUnchecked(self, from_x, from_y, to_x, to_y):
+    """
+    Move the unit in cell (from_x,from_y) to (to_x,to_y) without checking the indices
+    or that the cells are adjacent and enabled. The rules of the move itself are still
+    enforced, as in makeMove.
+    """
+    self.__resolveMove__(from_x, from_y, to_x, to_y)
@@ -0,0 +1,179 @@
+"""
+   .. module: batched
+    :synopsis: Defines the BatchedMap class, which stores many boards of the
+    same size in stacked arrays so that the game rules can be applied to all
+    of them at once. Used for running many rollouts or training episodes in
+    parallel.
+"""
+
+from . import cell
+from . import map as mapmod
+from ._map_private import neighborTable
+import numpy as np
+
+"""
+Stores B boards with the same shape and grid type. Each cell has the same meaning as
+in the Map class; plane[b,i,j] is cell (i,j) of board b.
+"""
+class BatchedMap(object):
+
+    def __init__(self, B, m, n, grid="hex", packed=False):
+        """Create B empty boards with m rows and n columns."""
+        if type(B) is not int or B <= 0:
+            raise ValueError( "The number of boards must be a positive integer." )
+        elif grid not in cell.HEX_MAP_TYPE + cell.SQUARE_MAP_TYPE:
+            raise ValueError( "Grid type not found." )
+        dtypes = mapmod.PACKED_DTYPES if packed else mapmod.DEFAULT_DTYPES
+        self.__numboards__   = B
+        self.__numrows__     = m
+        self.__numcols__     = n
+        self.__grid__        = grid
+        self.__colors__      = np.zeros((B,m,n), dtype=dtypes["colors"])
+        self.__types__       = np.zeros((B,m,n), dtype=dtypes["types"])
+        self.__strengths__   = np.zeros((B,m,n), dtype=dtypes["strengths"])
+        self.__resources__   = np.zeros((B,m,n), dtype=dtypes["resources"])
+        self.__isdisabled__  = np.zeros((B,m,n), dtype=bool)
+        self.__maxstrength__ = int(np.iinfo(dtypes["strengths"]).max)
+        # All boards have the same shape, so they share one neighbor table.
+        self.__neighbors__   = neighborTable(grid, m, n)
+
+    @classmethod
+    def fromMap(cls, game_map, B):
+        """Create B copies of the input map."""
+        m, n = game_map.getDimensions()
+        packed = game_map.__getPlanes__()[2].dtype == mapmod.PACKED_DTYPES["strengths"]
+        batch = cls(B, m, n, grid=game_map.getGrid(), packed=packed)
+        for b in range(B):
+            batch.setBoard(b, game_map)
+        return batch
+
+    def setBoard(self, b, game_map):
+        """Overwrite board b with the contents of the input map."""
+        if game_map.getDimensions() != (self.__numrows__, self.__numcols__):
+            raise ValueError( "The map does not have the same dimensions as the boards." )
+        colors, types, strengths, resources, isdisabled = game_map.__getPlanes__()
+        self.__colors__[b]     = colors
+        self.__types__[b]      = types
+        self.__strengths__[b]  = strengths
+        self.__resources__[b]  = resources
+        self.__isdisabled__[b] = isdisabled
+
+    def getBoard(self, b):
+        """Get a Map with the contents of board b."""
+        packed = self.__strengths__.dtype == mapmod.PACKED_DTYPES["strengths"]
+        game_map = mapmod.Map(self.__numrows__, self.__numcols__, grid=self.__grid__, packed=packed)
+        game_map.__loadPlanes__(self.__colors__[b], self.__types__[b], self.__strengths__[b],
+                                self.__resources__[b], self.__isdisabled__[b])
+        return game_map
+
+    def getNumBoards(self):
+        """Get the number of boards B."""
+        return self.__numboards__
+
+    def getDimensions(self):
+        """Gets the number of rows and columns of each board"""
+        return (self.__numrows__, self.__numcols__)
+
+    def getColors(self):
+        """Get a read-only B x m x n array with the colors of all cells."""
+        return self.__readOnly__(self.__colors__)
+
+    def getTypes(self):
+        """Get a read-only B x m x n array with the types of all cells."""
+        return self.__readOnly__(self.__types__)
+
+    def getStrengths(self):
+        """Get a read-only B x m x n array with the strengths of all cells."""
+        return self.__readOnly__(self.__strengths__)
+
+    def step(self, from_positions, to_positions):
+        """
+        Make one unit move on every board: the unit in cell from_positions[b] of board
+        b moves into cell to_positions[b], following the same rules as Map.makeMove.
+        Boards whose start position is (-1,-1), or whose move is not legal, are left
+        unchanged. When a move destroys a tower, all cells of that tower's color are
+        emptied on that board, as in Game.moveUnit.
+        Returns two arrays of length B: whether the move on each board was made, and
+        the color whose tower was destroyed on each board (cell.EMPTY if none).
+        """
+        B, m, n = self.__numboards__, self.__numrows__, self.__numcols__
+        from_positions = np.asarray(from_positions, dtype=np.int64).reshape(B, 2)
+        to_positions   = np.asarray(to_positions, dtype=np.int64).reshape(B, 2)
+        inside = np.all((from_positions >= 0) & (from_positions < (m, n)) &
+                        (to_positions >= 0) & (to_positions < (m, n)), axis=1)
+        boards = np.arange(B)
+        # Boards with moves that are out of bounds are pointed at cell 0 and masked out.
+        f = np.where(inside, from_positions[:,0] * n + from_positions[:,1], 0)
+        t = np.where(inside, to_positions[:,0] * n + to_positions[:,1], 0)
+        colors, types = self.__colors__.reshape(B,-1), self.__types__.reshape(B,-1)
+        strengths     = self.__strengths__.reshape(B,-1)
+        start_color,    end_color    = colors[boards,f].astype(np.int64), colors[boards,t].astype(np.int64)
+        start_strength, end_strength = strengths[boards,f].astype(np.int64), strengths[boards,t].astype(np.int64)
+        end_type = types[boards,t].astype(np.int64)
+        same_color = start_color == end_color
+        valid = (inside & np.any(self.__neighbors__[f] == t[:,None], axis=1)
+                 & ~self.__isdisabled__.reshape(B,-1)[boards,t]
+                 & (types[boards,f] == cell.UNIT)
+                 & ~(same_color & (end_type == cell.TOWER))
+                 & ~(same_color & (end_strength + start_strength > self.__maxstrength__)))
+        # Work out the new contents of the end cell, as in Map.__resolveMove__.
+        difference = end_strength - start_strength
+        final_color = np.where(same_color | (difference > 0), end_color,
+                               np.where(difference < 0, start_color, cell.EMPTY))
+        final_type  = np.where(same_color, end_type,
+                               np.where(difference != 0, cell.UNIT, cell.EMPTY))
+        final_strength = np.where(same_color, end_strength + start_strength,
+                                  np.where(difference != 0, np.abs(difference), end_strength))
+        moved = boards[valid]
+        colors[moved, t[valid]]    = final_color[valid]
+        types[moved, t[valid]]     = final_type[valid]
+        strengths[moved, t[valid]] = final_strength[valid]
+        colors[moved, f[valid]]    = cell.EMPTY
+        types[moved, f[valid]]     = cell.EMPTY
+        strengths[moved, f[valid]] = cell.EMPTY
+        # Remove the players whose towers were destroyed.
+        captured = np.where(valid & (end_type == cell.TOWER) & (final_type != cell.TOWER),
+                            end_color, cell.EMPTY)
+        self.removeColors(captured)
+        return valid, captured
+
+    def removeColors(self, colors):
+        """
+        Remove every cell of color colors[b] from board b, for all b; entries equal to
+        cell.EMPTY are ignored.
+        """
+        colors = np.asarray(colors).reshape(-1, 1, 1)
+        removed = (self.__colors__ == colors) & (colors != cell.EMPTY)
+        self.__colors__[removed]    = cell.EMPTY
+        self.__types__[removed]     = cell.EMPTY
+        self.__strengths__[removed] = cell.EMPTY
+
+    def collectResources(self):
+        """
+        Get a B x (MAX_PLAYERS+1) array whose entry (b,color) is the amount of resources
+        the player with that color can claim at the end of a round on board b (see
+        Map.collectPlayerResources).
+        """
+        B, num_colors = self.__numboards__, cell.MAX_PLAYERS + 1
+        income = self.__resources__.astype(np.int64) + cell.TOWER_RESOURCES * (self.__types__ == cell.TOWER)
+        keys = np.arange(B).reshape(-1, 1, 1) * num_colors + self.__colors__
+        totals = np.bincount(keys.ravel(), weights=income.ravel(), minlength=B * num_colors)
+        return np.round(totals).astype(np.int64).reshape(B, num_colors)
+
+    def alivePlayers(self):
+        """
+        Get a B x (MAX_PLAYERS+1) boolean array whose entry (b,color) says whether the
+        player with that color still has a tower on board b. Column 0 (EMPTY) is False.
+        """
+        B, num_colors = self.__numboards__, cell.MAX_PLAYERS + 1
+        keys = np.arange(B).reshape(-1, 1, 1) * num_colors + self.__colors__
+        towers = np.bincount(keys[self.__types__ == cell.TOWER], minlength=B * num_colors)
+        alive = towers.reshape(B, num_colors) > 0
+        alive[:, cell.EMPTY] = False
+        return alive
+
+    def __readOnly__(self, plane):
+        """Get a read-only view of a plane."""
+        view = plane.view()
+        view.flags.writeable = False
+        return view
@@ -0,0 +1,318 @@
+"""
+   .. module: chunked
+    :synopsis: Defines the ChunkedMap class, a map for very large and mostly
+    empty worlds. Its planes are split into square tiles, and a tile is only
+    allocated once one of its cells holds something other than the default
+    value, so memory grows with the occupied area rather than with the board.
+"""
+
+from . import cell
+from . import map as mapmod
+from . import _map_logic, _map_getters_setters, _map_private, _map_snapshot, _map_journal, _map_changes, _map_stats, _map_unchecked
+from ._map_private import neighborOffsets
+import numpy as np
+
+# Default number of rows and columns of a tile.
+DEFAULT_TILE_SIZE = 64
+
+"""
+A row of a ChunkedPlane, so that cells can be read and written as plane[i][j] like
+the cells of a NumPy plane.
+"""
+class __chunkedrow__(object):
+
+    def __init__(self, plane, i):
+        self.__plane__ = plane
+        self.__row__   = i
+
+    def __getitem__(self, j):
+        return self.__plane__.get(self.__row__, j)
+
+    def __setitem__(self, j, value):
+        self.__plane__.set(self.__row__, j, value)
+
+"""
+Sparse m x n plane made of tile_size x tile_size tiles. Tiles in which every cell holds
+the default value are not stored.
+"""
+class ChunkedPlane(object):
+
+    def __init__(self, m, n, dtype, default=0, tile_size=DEFAULT_TILE_SIZE):
+        """Create a plane in which every cell holds the default value."""
+        if type(tile_size) is not int or tile_size <= 0:
+            raise ValueError( "The tile size must be a positive integer." )
+        self.shape      = (m, n)
+        self.dtype      = np.dtype(dtype)
+        self.__default__  = self.dtype.type(default)
+        self.__tilesize__ = tile_size
+        self.__tiles__    = {}
+        # Number of cells of each tile that do not hold the default value
+        self.__counts__   = {}
+
+    def get(self, i, j):
+        """Get the value of cell (i,j)."""
+        size = self.__tilesize__
+        tile = self.__tiles__.get( (i // size, j // size) )
+        return self.__default__ if tile is None else tile[i % size, j % size]
+
+    def set(self, i, j, value):
+        """Set the value of cell (i,j), allocating or freeing its tile as needed."""
+        size = self.__tilesize__
+        key  = (i // size, j // size)
+        tile = self.__tiles__.get(key)
+        if tile is None:
+            if value == self.__default__:
+                return
+            tile = self.__tiles__[key] = np.full((size, size), self.__default__, dtype=self.dtype)
+            self.__counts__[key] = 0
+        was_default = tile[i % size, j % size] == self.__default__
+        tile[i % size, j % size] = value
+        is_default = tile[i % size, j % size] == self.__default__
+        if was_default != is_default:
+            self.__counts__[key] += 1 if was_default else -1
+            if self.__counts__[key] == 0:
+                del self.__tiles__[key], self.__counts__[key]
+
+    def find(self, value):
+        """Get the positions of all cells that hold the input value, which must not be the default."""
+        if value == self.__default__:
+            raise ValueError( "Cannot search a ChunkedPlane for its default value." )
+        size, positions = self.__tilesize__, []
+        for (ti, tj), tile in self.__tiles__.items():
+            rows, cols = np.nonzero(tile == value)
+            positions += zip((rows + ti * size).tolist(), (cols + tj * size).tolist())
+        return sorted(positions)
+
+    def copy(self):
+        """Get a copy of the plane that does not share any tiles with it."""
+        plane = ChunkedPlane(self.shape[0], self.shape[1], self.dtype, self.__default__, self.__tilesize__)
+        plane.__tiles__  = dict((key, tile.copy()) for key, tile in self.__tiles__.items())
+        plane.__counts__ = dict(self.__counts__)
+        return plane
+
+    def getNumTiles(self):
+        """Get the number of tiles that are allocated."""
+        return len(self.__tiles__)
+
+    def getMemoryUsage(self):
+        """Get the number of bytes taken by the allocated tiles."""
+        return sum(tile.nbytes for tile in self.__tiles__.values())
+
+    def __getitem__(self, index):
+        if type(index) is tuple:
+            return self.get(*index)
+        return __chunkedrow__(self, index)
+
+    def __setitem__(self, index, value):
+        if type(index) is not tuple:
+            raise TypeError( "Cells of a ChunkedPlane are written as plane[i,j] or plane[i][j]." )
+        self.set(index[0], index[1], value)
+
+"""
+Map whose planes are ChunkedPlanes. Supports the same getters, setters, moves, unit
+and tower indexes, resource totals, hashes and journal as the Map class, and can be
+used in a Game. Adjacency is computed from the grid's neighbor offsets whenever it
+is needed instead of being stored per cell.
+"""
+class ChunkedMap(object):
+
+    def __init__(self, m, n, grid="hex", resources=0, packed=False, tile_size=DEFAULT_TILE_SIZE):
+        """
+        Initialize an m x n map in which every cell is empty, enabled and produces the
+        input amount of resources. packed selects the plane types as for Map.
+        """
+        if type(grid) is not str:
+            raise TypeError( "The grid keywork input must be of type string." )
+        elif grid not in cell.HEX_MAP_TYPE + cell.SQUARE_MAP_TYPE:
+            raise ValueError( "Grid type not found." )
+        dtypes = mapmod.PACKED_DTYPES if packed else mapmod.DEFAULT_DTYPES
+        self.__maxstrength__  = int(np.iinfo(dtypes["strengths"]).max)
+        self.__maxresources__ = int(np.iinfo(dtypes["resources"]).max)
+        if type(resources) is not int or not 0 <= resources <= self.__maxresources__:
+            raise ValueError( "The default resources must be an integer between 0 and " +
+                              str(self.__maxresources__) + "." )
+        self.__colors__       = ChunkedPlane(m, n, dtypes["colors"], cell.EMPTY, tile_size)
+        self.__types__        = ChunkedPlane(m, n, dtypes["types"], cell.EMPTY, tile_size)
+        self.__strengths__    = ChunkedPlane(m, n, dtypes["strengths"], 0, tile_size)
+        self.__resources__    = ChunkedPlane(m, n, dtypes["resources"], resources, tile_size)
+        self.__isdisabled__   = ChunkedPlane(m, n, bool, False, tile_size)
+        self.__numrows__      = m
+        self.__numcols__      = n
+        self.__grid__         = grid
+        self.__towerIndices__ = set()
+        self.__units__        = [set() for color in range(cell.MAX_PLAYERS + 1)]
+        self.__towers__       = [set() for color in range(cell.MAX_PLAYERS + 1)]
+        # Every cell starts out empty, so the resources of the board belong to EMPTY.
+        self.__income__       = [0] * (cell.MAX_PLAYERS + 1)
+        self.__income__[cell.EMPTY] = resources * m * n
+        # The totals are never checked against a scan of the board, which could be huge.
+        self.__debugmode__    = False
+        self.__zobrist__      = 0
+        self.__journal__      = None
+        self.__marks__        = None
+        self.__changes__      = None
+        self.__stats__        = None
+        self.__shared__       = set()
+
+    def getAdjacent(self, pos):
+        """Get all cells adjacent to the cell at the input indices."""
+        self.__checkIndices__( pos )
+        i, j = pos
+        adjacent = []
+        for di, dj in neighborOffsets(self.__grid__, i):
+            k, l = i + di, j + dj
+            if 0 <= k < self.__numrows__ and 0 <= l < self.__numcols__ and not self.__isdisabled__.get(k, l):
+                adjacent += [(k, l)]
+        return adjacent
+
+    def setDisabled(self, pos, isdisabled):
+        """Toggle the enabled/disabled status of an input cell."""
+        self.__checkIndices__( pos )
+        if isdisabled is None: return
+        if type( isdisabled ) is not bool:
+            raise TypeError( "setDisabled received a non-boolean value." )
+        self.__isdisabled__.set(pos[0], pos[1], isdisabled)
+        self.__markChanged__(pos[0], pos[1])
+
+    def removeColor(self, color):
+        """Remove all units and towers of a specified color from the board."""
+        if color == cell.EMPTY:
+            raise ValueError( "Cannot remove the empty color from a ChunkedMap." )
+        for i, j in self.__colors__.find(color):
+            self.__writeCell__(i, j, cell.EMPTY, cell.EMPTY, cell.EMPTY)
+
+    def applyMoves(self, from_positions, to_positions, color=None, stop_on_capture=False, moved=None):
+        """
+        Moves the units in from_positions[k] to to_positions[k] for every k, in order,
+        with the same checks and return value as Map.applyMoves.
+        """
+        from_positions = [tuple(pos) for pos in np.asarray(from_positions, dtype=np.int64).reshape(-1, 2).tolist()]
+        to_positions   = [tuple(pos) for pos in np.asarray(to_positions, dtype=np.int64).reshape(-1, 2).tolist()]
+        if len(from_positions) != len(to_positions):
+            raise ValueError( "applyMoves received different numbers of start and end positions." )
+        for from_position, to_position in zip(from_positions, to_positions):
+            self.__checkAdjacent__(from_position, to_position)
+        moved = set() if moved is None else set(tuple(pos) for pos in moved)
+        captured = []
+        for k, ((from_x, from_y), (to_x, to_y)) in enumerate(zip(from_positions, to_positions)):
+            tower_color = None
+            if self.__types__.get(to_x, to_y) == cell.TOWER:
+                tower_color = int(self.__colors__.get(to_x, to_y))
+            try:
+                if color is not None:
+                    self.__checkUnitMove__(from_x, from_y, color, moved)
+                self.__resolveMove__(from_x, from_y, to_x, to_y)
+            except (RuntimeError, OverflowError) as error:
+                error.num_applied = k
+                raise
+            moved.add((to_x, to_y))
+            if tower_color is not None and self.__types__.get(to_x, to_y) != cell.TOWER:
+                captured += [(k, tower_color)]
+                if stop_on_capture:
+                    break
+        return captured
+
+    def legalMoves(self, color, moved=()):
+        """
+        Get every move that the player with the input color can make, in the same format
+        and order as Map.legalMoves.
+        """
+        if not cell.validPlayerColor(color):
+            raise ValueError( "The input to legalMoves was not a valid player color." )
+        moves = []
+        for pos in sorted(self.__units__[color]):
+            if pos in moved:
+                continue
+            for target in self.getAdjacent(pos):
+                if not (self.__colors__.get(*target) == color and self.__types__.get(*target) == cell.TOWER):
+                    moves += [pos + target]
+        builds = set()
+        for tower in self.__towers__[color]:
+            builds.update(pos for pos in self.getAdjacent(tower) if self.__types__.get(*pos) == cell.EMPTY)
+        moves = np.array(moves, dtype=np.int64).reshape(-1, 4)
+        return moves[:,:2], moves[:,2:], np.array(sorted(builds), dtype=np.int64).reshape(-1, 2)
+
+    def snapshot(self):
+        """Get a copy of the map. Only the allocated tiles are copied."""
+        copy = object.__new__(type(self))
+        copy.__dict__.update(self.__dict__)
+        for name in ("__colors__", "__types__", "__strengths__", "__resources__", "__isdisabled__"):
+            setattr(copy, name, getattr(self, name).copy())
+        copy.__towerIndices__ = set(self.__towerIndices__)
+        copy.__income__       = list(self.__income__)
+        copy.__units__        = [set(units) for units in self.__units__]
+        copy.__towers__       = [set(towers) for towers in self.__towers__]
+        copy.__journal__      = None
+        copy.__marks__        = None
+        copy.__changes__      = None
+        copy.stopStats()
+        return copy
+
+    def getMemoryUsage(self):
+        """Get the number of bytes taken by the allocated tiles of all planes."""
+        return sum(getattr(self, name).getMemoryUsage() for name in
+                   ("__colors__", "__types__", "__strengths__", "__resources__", "__isdisabled__"))
+
+    def __checkAdjacent__(self, from_position, to_position):
+        """Raise an exception if the two input cells are not adjacent."""
+        if tuple(to_position) not in self.getAdjacent(from_position):
+            self.__checkIndices__( to_position )
+            raise RuntimeError("Cells " + str( from_position ) + " and " + str( to_position )
+                               + " are not adjacent.")
+
+    # The rest of the interface is shared with the Map class.
+    setCell      = _map_getters_setters.setCell
+    setColor     = _map_getters_setters.setColor
+    setType      = _map_getters_setters.setType
+    setStrength  = _map_getters_setters.setStrength
+    setResources = _map_getters_setters.setResources
+
+    getCellDict   = _map_getters_setters.getCellDict
+    getCell       = _map_getters_setters.getCell
+    getDimensions = _map_getters_setters.getDimensions
+    getGrid       = _map_getters_setters.getGrid
+    getColor      = _map_getters_setters.getColor
+    getType       = _map_getters_setters.getType
+    getStrength   = _map_getters_setters.getStrength
+    getResources  = _map_getters_setters.getResources
+    getDisabled   = _map_getters_setters.getDisabled
+    getRGB        = _map_getters_setters.getRGB
+    getTower      = _map_getters_setters.getTower
+    getUnits      = _map_getters_setters.getUnits
+    getHash       = _map_getters_setters.getHash
+
+    collectResources       = _map_logic.collectResources
+    collectPlayerResources = _map_logic.collectPlayerResources
+    makeMove               = _map_logic.makeMove
+
+    startJournal    = _map_journal.startJournal
+    stopJournal     = _map_journal.stopJournal
+    journalLength   = _map_journal.journalLength
+    rollbackJournal = _map_journal.rollbackJournal
+    unmakeMove      = _map_journal.unmakeMove
+    rollback        = _map_journal.rollback
+
+    trackChanges        = _map_changes.trackChanges
+    stopTrackingChanges = _map_changes.stopTrackingChanges
+    popChanges          = _map_changes.popChanges
+
+    startStats = _map_stats.startStats
+    stopStats  = _map_stats.stopStats
+    getStats   = _map_stats.getStats
+
+    getColorUnchecked     = _map_unchecked.getColorUnchecked
+    getTypeUnchecked      = _map_unchecked.getTypeUnchecked
+    getStrengthUnchecked  = _map_unchecked.getStrengthUnchecked
+    getResourcesUnchecked = _map_unchecked.getResourcesUnchecked
+    getDisabledUnchecked  = _map_unchecked.getDisabledUnchecked
+    setCellUnchecked      = _map_unchecked.setCellUnchecked
+    makeMoveUnchecked     = _map_unchecked.makeMoveUnchecked
+
+    __checkIndices__  = _map_private.__checkIndices__
+    __checkUnitMove__ = _map_logic.__checkUnitMove__
+    __resolveMove__   = _map_logic.__resolveMove__
+    __detach__        = _map_snapshot.__detach__
+    __writeCell__     = _map_private.__writeCell__
+    __indexCell__     = _map_private.__indexCell__
+    __unindexCell__   = _map_private.__unindexCell__
+    __markChanged__   = _map_changes.__markChanged__
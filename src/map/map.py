@@ -5,30 +5,61 @@
 """
 
 from . import cell
-from . import _map_logic, _map_getters_setters, _map_private
-from numpy import zeros
+from . import _map_logic, _map_getters_setters, _map_private, _map_snapshot, _map_journal, _map_io, _map_changes, _map_stats, _map_unchecked
+from numpy import zeros, iinfo, int8, int16
+
+# Data types of the planes that store the board. By default every plane uses the
+# platform integer; a map constructed with packed=True uses the narrowest types
+# that fit the values instead, so that the planes take 7 bytes per cell rather than 33.
+DEFAULT_DTYPES = {"colors": int,  "types": int,  "strengths": int,   "resources": int}
+PACKED_DTYPES  = {"colors": int8, "types": int8, "strengths": int16, "resources": int16}
 
 """
 Used to store the current state of the game.
 """
 class Map(object):
 
-    def __init__(self, m, n, grid="hex"):
-        """Initialize the map's data fields."""
+    def __init__(self, m, n, grid="hex", packed=False, debug=False):
+        """
+        Initialize the map's data fields. If packed is True, the board is stored in
+        narrow integer planes (see PACKED_DTYPES); strengths and resources are then
+        limited to the range of an int16. If debug is True, the running totals that
+        the map keeps are checked against the board whenever they are read.
+        """
         # Create an m x n grid
         if type(grid) is not str:
             raise TypeError( "The grid keywork input must be of type string." )
         elif grid not in cell.HEX_MAP_TYPE + cell.SQUARE_MAP_TYPE:
             raise ValueError( "Grid type not found." )
-        self.__colors__       = zeros((m,n), dtype=int)
-        self.__strengths__    = zeros((m,n), dtype=int)
-        self.__resources__    = zeros((m,n), dtype=int)
-        self.__types__        = zeros((m,n), dtype=int)
-        self.__isdisabled__   = zeros((m,n), dtype=int) != 0
+        dtypes = PACKED_DTYPES if packed else DEFAULT_DTYPES
+        self.__colors__       = zeros((m,n), dtype=dtypes["colors"])
+        self.__strengths__    = zeros((m,n), dtype=dtypes["strengths"])
+        self.__resources__    = zeros((m,n), dtype=dtypes["resources"])
+        self.__types__        = zeros((m,n), dtype=dtypes["types"])
+        self.__isdisabled__   = zeros((m,n), dtype=bool)
+        self.__maxstrength__  = int(iinfo(dtypes["strengths"]).max)
+        self.__maxresources__ = int(iinfo(dtypes["resources"]).max)
         self.__numrows__      = m
         self.__numcols__      = n
         self.__grid__         = grid
         self.__towerIndices__ = set()
+        # Positions of the units and towers of each color, indexed by color ID
+        self.__units__        = [set() for color in range(cell.MAX_PLAYERS + 1)]
+        self.__towers__       = [set() for color in range(cell.MAX_PLAYERS + 1)]
+        # Resources that each color (indexed by color ID) can claim at the end of a turn
+        self.__income__       = [0] * (cell.MAX_PLAYERS + 1)
+        self.__debugmode__    = debug
+        # Zobrist hash of the colors, types and strengths of all cells (see zobrist.py)
+        self.__zobrist__      = 0
+        # Journal of cell changes, kept only after startJournal is called
+        self.__journal__      = None
+        self.__marks__        = None
+        # Cells changed since the last call to popChanges, kept only after trackChanges
+        self.__changes__      = None
+        # Receives the timings of the hot paths, kept only after startStats
+        self.__stats__        = None
+        # Names of the planes that are shared with a snapshot (see _map_snapshot.py)
+        self.__shared__       = set()
         self.__setAllAdjacencies__()
 
     setCell      = _map_getters_setters.setCell
@@ -41,6 +72,7 @@ class Map(object):
     getCellDict   = _map_getters_setters.getCellDict
     getCell       = _map_getters_setters.getCell
     getDimensions = _map_getters_setters.getDimensions
+    getGrid       = _map_getters_setters.getGrid
     getColor      = _map_getters_setters.getColor
     getType       = _map_getters_setters.getType
     getStrength   = _map_getters_setters.getStrength
@@ -48,18 +80,56 @@ class Map(object):
     getDisabled   = _map_getters_setters.getDisabled
     getAdjacent   = _map_getters_setters.getAdjacent
     getRGB        = _map_getters_setters.getRGB
-    getAdjacent   = _map_getters_setters.getAdjacent
     getTower      = _map_getters_setters.getTower
     getUnits      = _map_getters_setters.getUnits
+    getHash       = _map_getters_setters.getHash
 
     collectResources = _map_logic.collectResources
     collectPlayerResources = _map_logic.collectPlayerResources
     makeMove = _map_logic.makeMove
+    applyMoves = _map_logic.applyMoves
+    legalMoves = _map_logic.legalMoves
     removeColor = _map_logic.removeColor
+
+    snapshot = _map_snapshot.snapshot
+
+    save = _map_io.save
+    load = classmethod(_map_io.load)
+
+    startJournal    = _map_journal.startJournal
+    stopJournal     = _map_journal.stopJournal
+    journalLength   = _map_journal.journalLength
+    rollbackJournal = _map_journal.rollbackJournal
+    unmakeMove      = _map_journal.unmakeMove
+    rollback        = _map_journal.rollback
+
+    trackChanges        = _map_changes.trackChanges
+    stopTrackingChanges = _map_changes.stopTrackingChanges
+    popChanges          = _map_changes.popChanges
+
+    startStats = _map_stats.startStats
+    stopStats  = _map_stats.stopStats
+    getStats   = _map_stats.getStats
+
+    getColorUnchecked     = _map_unchecked.getColorUnchecked
+    getTypeUnchecked      = _map_unchecked.getTypeUnchecked
+    getStrengthUnchecked  = _map_unchecked.getStrengthUnchecked
+    getResourcesUnchecked = _map_unchecked.getResourcesUnchecked
+    getDisabledUnchecked  = _map_unchecked.getDisabledUnchecked
+    setCellUnchecked      = _map_unchecked.setCellUnchecked
+    makeMoveUnchecked     = _map_unchecked.makeMoveUnchecked
     
     __setAllAdjacencies__   = _map_private.__setAllAdjacencies__
     __setAdjacent__         = _map_private.__setAdjacent__
-    __setAdjacent_hex__     = _map_private.__setAdjacent_hex__
-    __setAdjacent_square__  = _map_private.__setAdjacent_square__
     __checkIndices__        = _map_private.__checkIndices__
     __checkAdjacent__       = _map_private.__checkAdjacent__
+    __checkUnitMove__       = _map_logic.__checkUnitMove__
+    __resolveMove__         = _map_logic.__resolveMove__
+    __detach__              = _map_snapshot.__detach__
+    __writeCell__           = _map_private.__writeCell__
+    __indexCell__           = _map_private.__indexCell__
+    __unindexCell__         = _map_private.__unindexCell__
+    __countPlayerResources__ = _map_private.__countPlayerResources__
+    __getPlanes__           = _map_private.__getPlanes__
+    __loadPlanes__          = _map_private.__loadPlanes__
+    __markChanged__         = _map_changes.__markChanged__
@@ -0,0 +1,95 @@
+"""
+   .. module: stats
+    :synopsis: Counters and timers for the hot paths of the map and the game.
+    A Stats object records how many times each timed operation ran and how long
+    it took in total. Nothing is recorded, and nothing is paid, unless stats
+    are switched on with Map.startStats or Game.startStats: timing is done by
+    wrappers installed on the instance, so the methods of an untimed map are
+    the plain class methods.
+"""
+
+import functools
+import time
+
+"""
+Number of calls and total time of named operations, plus plain counters.
+"""
+class Stats(object):
+
+    def __init__(self):
+        """Create an empty set of counters and timers."""
+        self.__calls__   = {}
+        self.__seconds__ = {}
+        self.__counts__  = {}
+
+    def count(self, name, n=1):
+        """Add n to the counter with the input name."""
+        self.__counts__[name] = self.__counts__.get(name, 0) + n
+
+    def addTime(self, name, seconds, calls=1):
+        """Add a number of calls taking seconds in total to the timer with the input name."""
+        self.__calls__[name]   = self.__calls__.get(name, 0) + calls
+        self.__seconds__[name] = self.__seconds__.get(name, 0.0) + seconds
+
+    def wrap(self, name, function):
+        """Get a function that calls the input function and adds each call to a timer."""
+        calls, seconds, clock = self.__calls__, self.__seconds__, time.perf_counter
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[name] = seconds.get(name, 0.0) + clock() - start
+                calls[name] = calls.get(name, 0) + 1
+        return timed
+
+    def wrapIterator(self, name, iterable):
+        """
+        Get an iterator over the input iterable that adds the time spent producing each
+        item to a timer, but not the time that the caller spends between items.
+        """
+        iterator, clock = iter(iterable), time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.addTime(name, clock() - start)
+                return
+            self.addTime(name, clock() - start)
+            yield item
+
+    def snapshot(self):
+        """
+        Get the counters and timers as a dictionary that can be stored as JSON:
+        {"counters": {name: count}, "timers": {name: {"calls": calls, "seconds":
+        seconds}}}. The times of nested operations are included in the times of the
+        operations that called them.
+        """
+        timers = dict((name, {"calls": self.__calls__[name], "seconds": self.__seconds__[name]})
+                      for name in sorted(self.__calls__))
+        return {"counters": dict(sorted(self.__counts__.items())), "timers": timers}
+
+    def reset(self):
+        """Set every counter and timer back to zero."""
+        self.__calls__.clear()
+        self.__seconds__.clear()
+        self.__counts__.clear()
+
+def difference(after, before):
+    """
+    Get the counters and timers that were recorded between two snapshots of the same
+    Stats object, in the same form as Stats.snapshot. Entries that did not change are
+    left out.
+    """
+    counters = dict((name, count - before["counters"].get(name, 0))
+                    for name, count in after["counters"].items()
+                    if count != before["counters"].get(name, 0))
+    timers = {}
+    for name, timer in after["timers"].items():
+        previous = before["timers"].get(name, {"calls": 0, "seconds": 0.0})
+        if timer["calls"] != previous["calls"]:
+            timers[name] = {"calls": timer["calls"] - previous["calls"],
+                            "seconds": timer["seconds"] - previous["seconds"]}
+    return {"counters": counters, "timers": timers}
@@ -0,0 +1,56 @@
+"""
+   .. module: zobrist
+    :synopsis: Keys for Zobrist hashing of the board state. The hash of a map
+    is the XOR of the keys of all of its cells, so it can be updated in constant
+    time whenever a cell changes.
+"""
+
+MASK64 = (1 << 64) - 1
+
+# Seeds that separate the keys of cells from the keys of other parts of the game state.
+CELL_SEED     = 0x243F6A8885A308D3
+PLAYER_SEED   = 0x13198A2E03707344
+RESOURCE_SEED = 0xA4093822299F31D0
+MOVED_SEED    = 0x082EFA98EC4E6C89
+SEARCHER_SEED = 0x452821E638D01377
+
+def mix(x):
+    """
+    Scramble a 64-bit integer (the finalizer of the splitmix64 generator). Keys are
+    computed with this function instead of being drawn from a random table, which
+    would take 120 bytes for every cell of the map.
+    """
+    x = (x + 0x9E3779B97F4A7C15) & MASK64
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & MASK64
+    return x ^ (x >> 31)
+
+def cellKey(index, color, cell_type, strength):
+    """
+    Get the key of the cell with flat index <index> (i * numcols + j) when it holds
+    the input color, type and strength. Empty cells have the key 0, so that the hash
+    of a new map is 0.
+    """
+    if color == 0 and cell_type == 0 and strength == 0:
+        return 0
+    return mix( mix(CELL_SEED ^ (index * 15 + color * 3 + cell_type)) ^ strength )
+
+def playerKey(color):
+    """Get the key recording that it is the turn of the player with the input color."""
+    return mix(PLAYER_SEED ^ color)
+
+def resourceKey(color, resources):
+    """Get the key recording that the player with the input color has <resources>."""
+    return mix( mix(RESOURCE_SEED ^ color) ^ resources )
+
+def movedKey(pos):
+    """Get the key recording that the unit at pos has already moved this turn."""
+    return mix( mix(MOVED_SEED ^ pos[0]) ^ pos[1] )
+
+def searcherKey(color):
+    """
+    Get the key recording that a search is run for the player with the input color.
+    Search agents XOR it into the hash of a state, since the value that they store
+    for a state depends on whose point of view it was searched from.
+    """
+    return mix(SEARCHER_SEED ^ color)
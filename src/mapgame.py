@@ -4,6 +4,7 @@
 """
 
 import sys, os
+import argparse
 import pygame
 import numpy as np
 import time
@@ -17,6 +18,8 @@ import map
 import map.cell as cell
 import game.game as game
 import game.player as player
+import ui
+import selfplay
 
 pygame.init()
 gameDisplay = pygame.display.set_mode((1280,720), pygame.RESIZABLE)
@@ -41,54 +44,47 @@ def IDtoColor(ID):#Take player ID return color
 
 buttonPosition = np.zeros((8), dtype = (int,2)) #Array for button x,y coordinates, statically defined so change size for new buttons
 myfont = pygame.font.SysFont("monospace", 15)
+textCache = ui.TextCache(myfont)
 color_dict = {cell.RED: RED, cell.EMPTY: WHITE}
+boardWidth = 740 #The board is drawn left of this x coordinate, the buttons and labels right of it
+aiMoveDelay = 0.15 #Seconds between the moves of AI players, so that they can be followed
+AI_MOVE_EVENT = pygame.USEREVENT + 1 #Posted by the AI worker when a move is ready
 
-#draws screen
-def draw_map(dMap,posGrid):
-	draw_grid(dMap,40,100,50,posGrid)
-	pygame.display.update()
+#Redraws the cells and HUD widgets that changed, and sends only those parts of the screen to the display
+def draw_frame(renderer, curPlayer, dialog):
+	renderer.drawBoard()
+	renderer.drawWidget("controls", True, draw_controls)
+	renderer.drawWidget("turn", curPlayer.getColor(),
+				    lambda surface: pygame.draw.rect(surface,IDtoColor(curPlayer.getColor()),[800, 200, 50, 50]))
+	renderer.drawWidget("resources", curPlayer.getResources(), lambda surface: disp_resources(curPlayer))
+	renderer.drawWidget("dialog", dialog, lambda surface: draw_dialog(dialog))
+	renderer.present()
 
-#creates x by y grid of hexagons starting at startX, startY
-def draw_grid(dMap,sideLength,startX,startY,posGrid):
-	lead_x = startX
-	yDisp = np.sin(np.deg2rad(60))*sideLength
-	xDisp = np.cos(np.deg2rad(60))*sideLength
-	#i is collumn number q is row number
-	for i in range(dMap.getDimensions()[0]):
-		if (i % 2) == 0:
-			 lead_y = startY
-		else:
-			lead_y = startY + yDisp + 5
-		for q in range(dMap.getDimensions()[1]):
-			draw_hex(dMap,sideLength,lead_x,lead_y,i,q)
-			posGrid[i,q][0] = lead_x#Sets pixel coordinates for hexs in posGrid
-			posGrid[i,q][1] = lead_y
-			lead_y += (yDisp*2) + 10
-			
-		lead_x += sideLength + xDisp + 10
-		
-	
-#Draw individual hexagon
-def draw_hex(dMap, sideLength, lead_x, lead_y, hex_x, hex_y):
-	xDisp = np.cos(np.deg2rad(60))*sideLength 
-	yDisp = np.sin(np.deg2rad(60))*sideLength
-	#Shape defined by array of points
-	pygame.draw.polygon(gameDisplay,dMap.getRGB((hex_x, hex_y)),
-			    [(lead_x,lead_y), (lead_x+sideLength,lead_y),
-			     (lead_x+sideLength+xDisp,lead_y+yDisp), (lead_x+sideLength,lead_y+(yDisp*2)),
-			     (lead_x,lead_y+(yDisp*2)), (lead_x-xDisp,lead_y+yDisp)])
-	if (dMap.getType((hex_x, hex_y)) == 2):
-		drawText("T", lead_x + 17, lead_y + (sideLength/2), BLACK)
+def draw_controls(surface):#Draw the buttons and labels of the game screen
+	return [button("Move", 750, 300, buttonPosition, 2),
+		button("Attack", 925, 300, buttonPosition, 4),
+		button("End Turn", 750, 375, buttonPosition, 3),
+		button("Build Unit", 925, 375, buttonPosition, 7),
+		drawText("Turn:", 800, 175, WHITE)]
+
+def draw_dialog(dialog):#Draw or erase the "Would you like to combine?" dialog
+	if not dialog:
+		return pygame.draw.rect(gameDisplay, BLACK, [800, 500, 400, 200])
+	rect = pygame.draw.rect(gameDisplay,WHITE,[800, 500, 400, 200])
+	drawText("Would you like to combine?", 800, 500, BLACK)
+	button("Yes", 800, 550, buttonPosition, 5)
+	button("No", 1000,550, buttonPosition, 6)
+	return rect
 
 def button(msg, buttonx, buttony, bPos, buttonID):#Draw Button
-	pygame.draw.rect(gameDisplay,WHITE,[buttonx, buttony, 150, 50])
+	rect = pygame.draw.rect(gameDisplay,WHITE,[buttonx, buttony, 150, 50])
 	drawText(msg, buttonx, buttony, BLACK)
 	bPos[buttonID][0] = buttonx
 	bPos[buttonID][1] = buttony
+	return rect
 	
 def drawText(msg, msg_x, msg_y, color):
-	label = myfont.render(msg, 5, color)
-	gameDisplay.blit(label, (msg_x, msg_y))
+	return gameDisplay.blit(textCache.render(msg, color), (msg_x, msg_y))
 	
 def bChecker(startx, starty, bPos):#Check if click on button
 	for i in range(len(bPos)):
@@ -103,35 +99,36 @@ def mapResources(Map):#Allocates resources to tiles
 			Map.setResources((row, col), 1)
 
 def disp_resources(player): #Display curPlayer resources in top right corner
-	pygame.draw.rect(gameDisplay, BLACK, [1190, 75, 50, 50])
+	rect = pygame.draw.rect(gameDisplay, BLACK, [1100, 75, 180, 50])
 	res = player.getResources()
 	label = ('Resources: %g' % (res))
 	drawText(label, 1100, 100, WHITE)
+	return rect
 			
-def game_start():
+def game_start(aiPlayers):#aiPlayers maps colors to the names of the agents that play them
 	button("Start", 885, 515, buttonPosition, 0)
 	button("Exit", 885, 580, buttonPosition, 1)
 	pygame.display.update()
 	
+	scheduler = ui.FrameScheduler()
 	gameExit = False
-	while not gameExit:#Menu event handler
-		for event in pygame.event.get():
+	while not gameExit:#Menu event handler, which sleeps until there is an event
+		for event in scheduler.waitEvents():
 			if event.type == pygame.MOUSEBUTTONUP:
-				pos = pygame.mouse.get_pos()
+				pos = event.pos
 				if (bChecker(pos[0], pos[1], buttonPosition) == 0):#Check if mouse is on start button
 					gameRun = game.Game(None)
-					game_loop()
+					gameExit = game_loop(aiPlayers)
 				if (bChecker(pos[0], pos[1], buttonPosition) == 1):#Check if mouse is on quit button
 					gameExit = True
 			if event.type == pygame.QUIT:
 				gameExit = True
 
-def game_loop():
+def game_loop(aiPlayers):#Returns True if the window was closed
 	#Build map for tests
 	dimX = 8 
 	dimY = 7
 	map1 = map.Map(dimX, dimY)
-	posGrid = np.zeros((dimX,dimY), dtype = (int,2))
 
 	map1.setCell((1,1),color=cell.RED, type=cell.TOWER, strength=2)
 	map1.setCell((2,1),color=cell.RED, type=cell.UNIT, strength=1)
@@ -149,91 +146,128 @@ def game_loop():
 	moving = False
 	building = False
 	pos = (-1,-1)
+	combining = None #Start and end of a move waiting on the "Would you like to combine?" dialog
+	showStats = False #F3 shows the frame times
 	
 	#Game Objects
-	game1 = game.Game(map1)
+	rotation = [selfplay.AGENTS[aiPlayers[color]](color) if color in aiPlayers else color
+		    for color in (cell.RED, cell.GREEN, cell.BLUE, cell.YELLOW)]
+	game1 = game.Game(map1, rotation=rotation)
+	worker = ui.AIWorker(AI_MOVE_EVENT) #Runs the turns of AI players in the background
+	lastAIMove = 0
 	curPlayer = game1.getCurrentPlayer()
+	renderer = ui.BoardRenderer(gameDisplay, map1, myfont, viewport=(0, 0, boardWidth, gameDisplay.get_height()))
+	camera = renderer.getCamera() #Drag with the right mouse button or use the arrow keys to pan, the wheel or +/- to zoom
+	scheduler = ui.FrameScheduler()
 	
 	#Draw Buttons and map
 	gameDisplay.fill(BLACK)
-	button("Move", 750, 300, buttonPosition, 2)
-	button("Attack", 925, 300, buttonPosition, 4)
-	button("End Turn", 750, 375, buttonPosition, 3)
-	button("Build Unit", 925, 375, buttonPosition, 7)
-	drawText("Turn:", 800, 175, WHITE)
-	pygame.draw.rect(gameDisplay,IDtoColor(curPlayer.getColor()),[800, 200, 50, 50])
-	disp_resources(curPlayer)
-	draw_map(map1,posGrid)
+	renderer.invalidate()
+	draw_frame(renderer, curPlayer, False)
 	
+	events = []
 	while not gameExit:#Game event handler
-		for event in pygame.event.get():
-			if event.type == pygame.QUIT:
-				gameExit = True
-			if event.type == pygame.MOUSEBUTTONUP:
-				mPos = pygame.mouse.get_pos()
-				
-				if pos != (-1, -1) and (bChecker(mPos[0], mPos[1], buttonPosition) == 2): #Move button
-					moving = True
-					building = False
-					attacking = False
-								
-				if (bChecker(mPos[0], mPos[1], buttonPosition) == 3): #End Turn
-					game1.endTurn()
-					curPlayer = game1.getCurrentPlayer()
-					pygame.draw.rect(gameDisplay,IDtoColor(curPlayer.getColor()),[800, 200, 50, 50])
-					moving = False
-					disp_resources(curPlayer)
-					pygame.display.update()
+		aiTurn = curPlayer.getColor() in aiPlayers
+		with scheduler.measure("update"):
+			for event in events:
+				if event.type == pygame.QUIT:
+					gameExit = True
+				if event.type == pygame.VIDEORESIZE:#The window contents may be lost, so draw everything again
+					gameDisplay.fill(BLACK)
+					renderer.setViewport((0, 0, boardWidth, gameDisplay.get_height()))
+					renderer.invalidate()
+				if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+					showStats = not showStats
+					if not showStats:#Erase the overlay
+						gameDisplay.fill(BLACK)
+						renderer.invalidate()
+				camera.handleEvent(event)
+				if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and not aiTurn:
+					mPos = event.pos #Where the click happened, which may differ from where the mouse is now
 					
-				if pos != (-1,-1) and (bChecker(mPos[0],mPos[1], buttonPosition) == 4): #Attack button
-					attacking = True
-					moving = False
+					if combining is not None:#Only the dialog's buttons can be clicked while it is shown
+						if (bChecker(mPos[0], mPos[1], buttonPosition) == 5):
+							map1.makeMove(combining[0], combining[1])
+							combining = None
+						if (bChecker(mPos[0], mPos[1], buttonPosition) == 6):
+							combining = None
+						continue
 					
-				if (bChecker(mPos[0], mPos[1], buttonPosition) == 7): #Build unit button
-					if ((map1.getType(pos) == 2) and map1.getRGB(pos) == IDtoColor(curPlayer.getColor())): #Only towers can build units and only during their turn
-						if (curPlayer.getResources() > 0):
-							building = True
-							moving = False
-							
-				for i in range(dimX):#Checks every hex to see if clicked
-					for q in range(dimY):
-						if (mPos[0] >= posGrid[i,q][0] and mPos[0] <= 40 + posGrid[i,q][0]) and (mPos[1] >= posGrid[i,q][1] and mPos[1] <= 80 + posGrid[i,q][1]):#Checks if clicked on hex i,q
-							if moving and pos != (-1,-1):
-								if map1.getRGB(pos) == IDtoColor(curPlayer.getColor()):#Only able to move units whose turn it is
-									if map1.getType((i,q)) == 1:
-										if map1.getColor(pos) == map1.getColor((i,q)):
-											pygame.draw.rect(gameDisplay,WHITE,[800, 500, 400, 200])
-											drawText("Would you like to combine?", 800, 500, BLACK)
-											button("Yes", 800, 550, buttonPosition, 5)
-											button("No", 1000,550, buttonPosition, 6)
-											pygame.display.update()
-											while(moving):
-											    for event in pygame.event.get():
-													if event.type == pygame.MOUSEBUTTONUP:
-														mPos = pygame.mouse.get_pos()
-														if (bChecker(mPos[0], mPos[1], buttonPosition) == 5):
-															map1.makeMove(pos, (i,q))
-															pygame.draw.rect(gameDisplay, BLACK, [800, 500, 400, 200])
-															moving = False
-														if (bChecker(mPos[0], mPos[1], buttonPosition) == 6):
-															pygame.draw.rect(gameDisplay, BLACK, [800, 500, 400, 200])
-															moving = False
-															
-							if moving:
-								map1.makeMove(pos, (i,q))
-								moving = False
+					if pos != (-1, -1) and (bChecker(mPos[0], mPos[1], buttonPosition) == 2): #Move button
+						moving = True
+						building = False
+						attacking = False
 									
-							if building and map1.getType((i,q)) == 0: #Only Builds on empty 
-								if (i,q) in map1.getAdjacent(pos): #Only builds on adjacent 
-									curPlayer.changeResources(-1) #Subtract from players resources
-									map1.setCell((i,q),color=cell.RED, type=cell.UNIT, strength=1)
-									draw_map(map1, posGrid)
-									disp_resources(curPlayer)
-									pygame.display.update()
-									building = False
-							
-							pos = (i,q)	
-							draw_map(map1, posGrid)
-							pygame.display.update()
-							
-game_start()
+					if (bChecker(mPos[0], mPos[1], buttonPosition) == 3): #End Turn
+						game1.endTurn()
+						curPlayer = game1.getCurrentPlayer()
+						moving = False
+						
+					if pos != (-1,-1) and (bChecker(mPos[0],mPos[1], buttonPosition) == 4): #Attack button
+						attacking = True
+						moving = False
+						
+					if (bChecker(mPos[0], mPos[1], buttonPosition) == 7): #Build unit button
+						if ((map1.getType(pos) == 2) and map1.getRGB(pos) == IDtoColor(curPlayer.getColor())): #Only towers can build units and only during their turn
+							if (curPlayer.getResources() > 0):
+								building = True
+								moving = False
+								
+					clicked = renderer.cellAt(mPos)#Finds the hex under the mouse, if there is one
+					if clicked is not None:
+						i, q = clicked
+						if moving and pos != (-1,-1):
+							if map1.getRGB(pos) == IDtoColor(curPlayer.getColor()):#Only able to move units whose turn it is
+								if map1.getType((i,q)) == 1:
+									if map1.getColor(pos) == map1.getColor((i,q)):
+										combining = (pos, (i,q))
+										moving = False
+														
+						if moving:
+							map1.makeMove(pos, (i,q))
+							moving = False
+								
+						if building and map1.getType((i,q)) == 0: #Only Builds on empty 
+							if (i,q) in map1.getAdjacent(pos): #Only builds on adjacent 
+								curPlayer.changeResources(-1) #Subtract from players resources
+								map1.setCell((i,q),color=cell.RED, type=cell.UNIT, strength=1)
+								building = False
+						
+						pos = (i,q)
+			
+			if curPlayer.getColor() in aiPlayers and not game1.gameOver():#Start the AI's turn, and make its moves one at a time
+				if not worker.isBusy():
+					worker.start(curPlayer, map1)
+				if time.perf_counter() >= lastAIMove + aiMoveDelay:
+					for vect in worker.poll(1):
+						game1.makeMove(vect)
+						curPlayer = game1.getCurrentPlayer()
+						lastAIMove = time.perf_counter()
+		with scheduler.measure("draw"):
+			if showStats:
+				scheduler.drawOverlay(renderer, 1100, 10)
+			draw_frame(renderer, curPlayer, combining is not None)
+		#Sleep until there is an event, or until the next move of an AI player is due
+		timeout = None
+		if worker.hasMoves() or (curPlayer.getColor() in aiPlayers and not worker.isBusy() and not game1.gameOver()):
+			timeout = max(lastAIMove + aiMoveDelay - time.perf_counter(), 0.001)
+		events = scheduler.waitEvents(timeout)
+	worker.cancel()
+	scheduler.dumpStats()
+	return True
+
+def parse_ai(spec):#Parses "green=mcts,blue=random" into {cell.GREEN: "mcts", cell.BLUE: "random"}
+	aiPlayers = {}
+	for entry in spec.split(","):
+		if entry:
+			color, name = entry.split("=")
+			if color not in COLOR_NAMES or name not in selfplay.AGENTS:
+				raise ValueError( "Unknown player color or agent in " + entry + "." )
+			aiPlayers[COLOR_NAMES[color]] = name
+	return aiPlayers
+
+COLOR_NAMES = {"red": cell.RED, "green": cell.GREEN, "blue": cell.BLUE, "yellow": cell.YELLOW}
+parser = argparse.ArgumentParser(description="Play HexTowns.")
+parser.add_argument("--ai", default="", help="players controlled by the computer, as comma-separated " +
+		    "COLOR=AGENT pairs, e.g. green=mcts,blue=random (agents: " + ", ".join(sorted(selfplay.AGENTS)) + ")")
+game_start(parse_ai(parser.parse_args().ai))
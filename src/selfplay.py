@@ -0,0 +1,188 @@
+"""
+   .. module: selfplay
+    :synopsis: Headless self-play runner. Plays complete games between AI agents
+    across a pool of worker processes and reports throughput and per-game
+    results. Run ``python src/selfplay.py --help`` for the available options.
+"""
+
+import sys, os
+import argparse
+import cProfile
+import json
+import multiprocessing
+import time
+
+src_path = os.path.dirname(os.path.abspath(__file__))
+if src_path not in sys.path:
+    sys.path.append( src_path )
+
+import map
+import map.cell as cell
+import game.game as game
+import game.replay as replay
+import agents.gameai as gameai
+import agents.mcts as mcts
+import agents.alphabeta as alphabeta
+
+# Agents that can be selected from the command line.
+AGENTS = {"random": gameai.RandomAgent, "mcts": mcts.MCTSAgent,
+          "alphabeta": alphabeta.AlphaBetaAgent}
+
+# Player colors in the order in which they take their turns.
+PLAYER_COLORS = (cell.RED, cell.GREEN, cell.BLUE, cell.YELLOW)
+
+def buildMap(rows, cols, num_players=cell.MAX_PLAYERS, packed=False):
+    """
+    Build the standard starting map: every cell produces one resource, and every
+    player starts with a tower near one of the corners and a unit next to it.
+    """
+    if rows < 4 or cols < 4:
+        raise ValueError( "Self-play maps must have at least 4 rows and 4 columns." )
+    game_map = map.Map(rows, cols, packed=packed)
+    for i in range(rows):
+        for j in range(cols):
+            game_map.setResources((i, j), 1)
+    corners = [(1, 1), (rows - 2, 1), (1, cols - 2), (rows - 2, cols - 2)]
+    for color, (i, j) in zip(PLAYER_COLORS[:num_players], corners):
+        unit_i = i + 1 if i < rows // 2 else i - 1
+        game_map.setCell((i, j), color=color, type=cell.TOWER, strength=2)
+        game_map.setCell((unit_i, j), color=color, type=cell.UNIT, strength=1)
+    return game_map
+
+def playGame(task):
+    """
+    Play one complete game. task is a dictionary with the game's index and seed, the
+    map size, the names of the agents, the turn limit and the directories to write the
+    game's replay log and per-turn trace to (or None). Returns a dictionary with the
+    results of the game; the winner is None if the turn limit was reached. Traced games
+    also report the counters and timers of the game (see Game.stats).
+    """
+    start = time.perf_counter()
+    game_map = buildMap(task["rows"], task["cols"], len(task["agents"]), task["packed"])
+    players = [AGENTS[name](color, seed=task["seed"] * cell.MAX_PLAYERS + k)
+               for k, (name, color) in enumerate(zip(task["agents"], PLAYER_COLORS))]
+    current_game = game.Game(game_map, rotation=players)
+    writer = None
+    if task.get("replays") is not None:
+        writer = replay.ReplayWriter(os.path.join(task["replays"], "game%06d.log" % task["game"]), current_game)
+        current_game.setRecorder(writer)
+    trace = None
+    if task.get("trace") is not None:
+        trace = open(os.path.join(task["trace"], "game%06d.jsonl" % task["game"]), "w")
+        current_game.startStats(trace)
+    turns = 0
+    try:
+        while not current_game.gameOver() and turns < task["max_turns"]:
+            current_game.queryCurrentPlayer()
+            turns += 1
+    finally:
+        if writer is not None:
+            writer.close()
+        if trace is not None:
+            trace.close()
+    winner = current_game.getCurrentColor() if current_game.gameOver() else None
+    # Search agents report how fast they search, so that their budgets can be tuned.
+    search_stats = dict((cell.getColorString(agent.getColor()), agent.getStats())
+                        for agent in players if hasattr(agent, "getStats"))
+    result = {"game": task["game"], "seed": task["seed"], "turns": turns,
+              # A recorded game streams its moves to the replay log instead of storing them.
+              "moves": len(current_game.getStoredMoves()) if writer is None else writer.getNumMoves(),
+              "winner": None if winner is None else cell.getColorString(winner),
+              "seconds": time.perf_counter() - start, "search": search_stats}
+    if trace is not None:
+        result["stats"] = current_game.stats()
+    return result
+
+def runGames(num_games, rows, cols, agents, seed=0, max_turns=1000, workers=None, packed=False,
+             replays=None, trace=None):
+    """
+    Play num_games games across a pool of worker processes. Game k uses the seed
+    seed + k, so a run can be reproduced from its base seed. Yields the result of
+    every game as it finishes.
+    """
+    tasks = [{"game": k, "seed": seed + k, "rows": rows, "cols": cols, "agents": agents,
+              "max_turns": max_turns, "packed": packed, "replays": replays, "trace": trace}
+             for k in range(num_games)]
+    if workers == 1:
+        for task in tasks:
+            yield playGame(task)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(playGame, tasks):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def parseArgs(argv):
+    """Parse the command line arguments of the runner."""
+    parser = argparse.ArgumentParser(description="Play HexTowns games between AI agents.")
+    parser.add_argument("--games", type=int, default=100, help="number of games to play")
+    parser.add_argument("--size", default="8x7", help="map size as ROWSxCOLS")
+    parser.add_argument("--agents", default="random,random,random,random",
+                        help="comma-separated agents, one per player (" + ", ".join(sorted(AGENTS)) + ")")
+    parser.add_argument("--seed", type=int, default=0, help="base seed of the run")
+    parser.add_argument("--max-turns", type=int, default=1000, help="turn limit per game")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--packed", action="store_true", help="use the packed map layout")
+    parser.add_argument("--output", default=None, help="write per-game results to this JSON lines file")
+    parser.add_argument("--replays", default=None, help="write a replay log of every game to this directory")
+    parser.add_argument("--trace", default=None,
+                        help="write a per-turn trace of every game to this directory, as JSON lines")
+    parser.add_argument("--profile", default=None,
+                        help="profile the run with cProfile and write the profile to this file; " +
+                             "the games are then played in this process")
+    parser.add_argument("--quiet", action="store_true", help="only print the summary")
+    args = parser.parse_args(argv)
+    args.rows, args.cols = [int(x) for x in args.size.lower().split("x")]
+    args.agents = args.agents.split(",")
+    for name in args.agents:
+        if name not in AGENTS:
+            parser.error("unknown agent " + repr(name))
+    if not 2 <= len(args.agents) <= cell.MAX_PLAYERS:
+        parser.error("between 2 and " + str(cell.MAX_PLAYERS) + " agents are required")
+    return args
+
+def main(argv=None):
+    args = parseArgs(sys.argv[1:] if argv is None else argv)
+    for directory in (args.replays, args.trace):
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory)
+    # A profiler only sees the process it runs in, so profiled games are not farmed out.
+    profiler = None
+    if args.profile is not None:
+        args.workers = 1
+        profiler = cProfile.Profile()
+    output = open(args.output, "w") if args.output else None
+    wins, total_turns, results = {}, 0, 0
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        for result in runGames(args.games, args.rows, args.cols, args.agents, args.seed,
+                               args.max_turns, args.workers, args.packed, args.replays, args.trace):
+            results += 1
+            total_turns += result["turns"]
+            wins[result["winner"]] = wins.get(result["winner"], 0) + 1
+            if output is not None:
+                output.write(json.dumps(result) + "\n")
+            if not args.quiet:
+                print("game %d (seed %d): winner %s after %d turns, %d moves, %.3fs" %
+                      (result["game"], result["seed"], result["winner"], result["turns"],
+                       result["moves"], result["seconds"]))
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if output is not None:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print("%d games in %.2fs: %.2f games/sec, %.1f turns/sec" %
+          (results, elapsed, results / elapsed, total_turns / elapsed))
+    print("wins: " + ", ".join("%s %d" % (winner, count) for winner, count in
+                               sorted(wins.items(), key=lambda item: str(item[0]))))
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,43 @@ import map
 import map._map_getters_setters
 import numpy
 import map.cell as cell
+import map.zobrist as zobrist
+import game.game as game
+import game.movevector as movevector
+import game.replay as replay
+import agents.transposition as transposition
+import agents.gameai as gameai
+import agents.mcts as mcts
+import agents.alphabeta as alphabeta
+import selfplay
+import benchmark
+import tempfile
+import random
+import os
+import time
+import io
+import json
+
+# The UI tests draw onto surfaces that are never shown.
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import pygame
+import ui
 
 mapTesting = map.Map(8,7)
 posGrid = numpy.zeros((8,7), dtype = (int,2))
 mapTesting.setCell((0,0),color=cell.RED, type=cell.UNIT, strength=1, resources=20, isdisabled=True)
 
+# A small three player game that the game tests start from.
+def buildGame():
+    testMap = map.Map(8,7)
+    testMap.setCell((1,1), color=cell.RED, type=cell.TOWER, strength=2)
+    testMap.setCell((2,1), color=cell.RED, type=cell.UNIT, strength=3)
+    testMap.setCell((1,2), color=cell.RED, type=cell.UNIT, strength=5)
+    testMap.setCell((1,3), color=cell.BLUE, type=cell.TOWER, strength=2)
+    testMap.setCell((2,4), color=cell.BLUE, type=cell.UNIT, strength=1)
+    testMap.setCell((6,5), color=cell.GREEN, type=cell.TOWER, strength=2)
+    return game.Game(testMap, rotation=(cell.RED,cell.BLUE,cell.GREEN))
+
 class TestingCases(unittest.TestCase):
 
  
@@ -31,6 +63,700 @@ class TestingCases(unittest.TestCase):
     def testGetRGB(self):
                 self.assertEqual(mapTesting.getRGB((0,0)), (0,0,0)) 
 
+
+
+class AdjacencyCases(unittest.TestCase):
+
+    def testDisablePatchesNeighbors(self):
+        testMap = map.Map(8,7)
+        testMap.setDisabled((2,2), True)
+        self.assertNotIn((2,2), testMap.getAdjacent((1,2)))
+        self.assertRaises(RuntimeError, testMap.__checkAdjacent__, (1,2), (2,2))
+        testMap.setDisabled((2,2), False)
+        self.assertIn((2,2), testMap.getAdjacent((1,2)))
+    def testSquareAdjacent(self):
+        testMap = map.Map(3,3, grid="square")
+        self.assertEqual(testMap.getAdjacent((1,1)), [(2,1),(0,1),(1,2),(1,0)])
+        self.assertEqual(testMap.getAdjacent((0,0)), [(1,0),(0,1)])
+
+class PackedMapCases(unittest.TestCase):
+
+    def testPackedGetters(self):
+        testMap = map.Map(8,7, packed=True)
+        testMap.setCell((3,3), color=cell.BLUE, type=cell.TOWER, strength=2, resources=4)
+        self.assertEqual(testMap.getColor((3,3)), cell.BLUE)
+        self.assertEqual(testMap.getType((3,3)), cell.TOWER)
+        self.assertEqual(testMap.getTower(cell.BLUE), (3,3))
+        self.assertEqual(testMap.collectPlayerResources(cell.BLUE), 4 + cell.TOWER_RESOURCES)
+    def testPackedStrengthOverflow(self):
+        testMap = map.Map(8,7, packed=True)
+        testMap.setCell((1,1), color=cell.RED, type=cell.UNIT, strength=30000)
+        testMap.setCell((1,2), color=cell.RED, type=cell.UNIT, strength=30000)
+        self.assertRaises(OverflowError, testMap.makeMove, (1,1), (1,2))
+        self.assertRaises(OverflowError, testMap.setStrength, (1,1), 2**15)
+
+class SnapshotCases(unittest.TestCase):
+
+    def testSnapshotIsolation(self):
+        testMap = map.Map(8,7)
+        testMap.setCell((1,1), color=cell.RED, type=cell.UNIT, strength=2)
+        snapshot = testMap.snapshot()
+        snapshot.makeMove((1,1), (1,2))
+        self.assertEqual(testMap.getColor((1,2)), cell.EMPTY)
+        testMap.setResources((0,0), 3)
+        self.assertEqual(snapshot.getResources((0,0)), 0)
+        self.assertEqual(snapshot.getColor((1,2)), cell.RED)
+
+class ResourceTotalCases(unittest.TestCase):
+
+    def testTotalsFollowMoves(self):
+        testMap = map.Map(8,7, debug=True)
+        for pos in [(1,1),(1,2),(2,2)]:
+            testMap.setResources(pos, 2)
+        testMap.setCell((1,1), color=cell.RED, type=cell.TOWER, strength=2)
+        testMap.setCell((2,1), color=cell.RED, type=cell.UNIT, strength=3)
+        testMap.setCell((2,2), color=cell.BLUE, type=cell.UNIT, strength=1)
+        self.assertEqual(testMap.collectPlayerResources(cell.RED), 2 + cell.TOWER_RESOURCES)
+        testMap.makeMove((2,1), (2,2))
+        self.assertEqual(testMap.collectPlayerResources(cell.RED), 4 + cell.TOWER_RESOURCES)
+        self.assertEqual(testMap.collectPlayerResources(cell.BLUE), 0)
+        testMap.removeColor(cell.RED)
+        self.assertEqual(testMap.collectResources()[cell.RED], 0)
+        self.assertEqual(testMap.collectPlayerResources(cell.EMPTY), 6)
+
+class UnitIndexCases(unittest.TestCase):
+
+    def testUnitsAndTowers(self):
+        testMap = map.Map(8,7, debug=True)
+        testMap.setCell((1,1), color=cell.GREEN, type=cell.TOWER, strength=2)
+        testMap.setCell((4,2), color=cell.GREEN, type=cell.UNIT, strength=1)
+        testMap.setCell((2,1), color=cell.GREEN, type=cell.UNIT, strength=1)
+        self.assertEqual(testMap.getUnits(cell.GREEN), ((2,1),(4,2)))
+        self.assertEqual(testMap.getTower(cell.GREEN), (1,1))
+        testMap.makeMove((2,1), (2,2))
+        self.assertEqual(testMap.getUnits(cell.GREEN), ((2,2),(4,2)))
+        testMap.removeColor(cell.GREEN)
+        self.assertEqual(testMap.getUnits(cell.GREEN), ())
+        self.assertRaises(RuntimeError, testMap.getTower, cell.GREEN)
+
+class BatchedMoveCases(unittest.TestCase):
+
+    def testMatchesSequentialMoves(self):
+        moves = [movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(2,2))),
+                 movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((1,2),(1,3))),
+                 movevector.MoveVector(movevector.TYPE_END_TURN)]
+        batched, sequential = buildGame(), buildGame()
+        batched.makeMoves(moves)
+        for move in moves:
+            sequential.makeMove(move)
+        for testGame in (batched, sequential):
+            self.assertEqual(testGame.getNumPlayers(), 2)
+            self.assertEqual(testGame.getCurrentColor(), cell.GREEN)
+            self.assertEqual(testGame.getMap().getUnits(cell.RED), ((1,3),(2,2)))
+    def testErrorsMatchSequentialMoves(self):
+        again = [movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(2,2))),
+                 movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,2),(3,2)))]
+        far   = [movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(2,2))),
+                 movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((1,2),(4,2)))]
+        tower = [movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(2,2))),
+                 movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((1,1),(2,1)))]
+        for moves in (again, far, tower):
+            batched, sequential = buildGame(), buildGame()
+            with self.assertRaises(RuntimeError) as batched_error:
+                batched.makeMoves(moves)
+            with self.assertRaises(RuntimeError) as sequential_error:
+                for move in moves:
+                    sequential.makeMove(move)
+            self.assertEqual(str(batched_error.exception), str(sequential_error.exception))
+            for testGame in (batched, sequential):
+                self.assertEqual(testGame.getMap().getUnits(cell.RED), ((1,2),(2,2)))
+                self.assertEqual(testGame.getStoredMoves(), moves[:1])
+                self.assertTrue(testGame.hasMoved((2,2)))
+
+    def testRejectsNonAdjacentBatch(self):
+        testGame = buildGame()
+        self.assertRaises(RuntimeError, testGame.getMap().applyMoves, [(2,1),(1,2)], [(2,2),(4,2)])
+        self.assertEqual(testGame.getMap().getColor((2,2)), cell.EMPTY)
+
+class JournalCases(unittest.TestCase):
+
+    def testRollbackRestoresGame(self):
+        testGame = buildGame()
+        testMap = testGame.getMap()
+        testMap.setResources((2,2), 3)
+        testGame.startJournal()
+        testGame.makeMove(movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(2,2))))
+        testGame.makeMove(movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((1,2),(1,3))))
+        testGame.makeMove(movevector.MoveVector(movevector.TYPE_END_TURN))
+        self.assertEqual(testGame.getNumPlayers(), 2)
+        self.assertEqual(testGame.getPlayer(1).getResources(), 3 + cell.TOWER_RESOURCES)
+        testGame.rollback(3)
+        self.assertEqual(testGame.getNumPlayers(), 3)
+        self.assertEqual(testGame.getCurrentColor(), cell.RED)
+        self.assertEqual(testGame.getPlayer(0).getResources(), 0)
+        self.assertEqual(testMap.getTower(cell.BLUE), (1,3))
+        self.assertEqual(testMap.getUnits(cell.RED), ((1,2),(2,1)))
+        self.assertFalse(testGame.hasMoved((2,2)))
+        self.assertEqual(testGame.getStoredMoves(), [])
+    def testMapUnmakeMove(self):
+        testMap = map.Map(8,7)
+        testMap.setCell((2,1), color=cell.RED, type=cell.UNIT, strength=3)
+        testMap.setCell((2,2), color=cell.BLUE, type=cell.UNIT, strength=1)
+        testMap.startJournal()
+        testMap.makeMove((2,1), (2,2))
+        testMap.unmakeMove()
+        self.assertEqual(testMap.getColor((2,2)), cell.BLUE)
+        self.assertEqual(testMap.getStrength((2,1)), 3)
+        self.assertRaises(RuntimeError, testMap.unmakeMove)
+
+class HashCases(unittest.TestCase):
+
+    def testMoveOrderTransposes(self):
+        first, second = buildGame(), buildGame()
+        moveA = movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(3,1)))
+        moveB = movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((1,2),(0,2)))
+        first.makeMoves([moveA, moveB])
+        second.makeMoves([moveB, moveA])
+        self.assertEqual(first.getHash(), second.getHash())
+        second.makeMove(movevector.MoveVector(movevector.TYPE_END_TURN))
+        self.assertNotEqual(first.getHash(), second.getHash())
+    def testRollbackRestoresHash(self):
+        testGame = buildGame()
+        testGame.getMap().__debugmode__ = True
+        before = testGame.getHash()
+        testGame.startJournal()
+        testGame.makeMove(movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((1,2),(1,3))))
+        self.assertNotEqual(testGame.getHash(), before)
+        testGame.unmakeMove()
+        self.assertEqual(testGame.getHash(), before)
+    def testTranspositionTable(self):
+        table = transposition.TranspositionTable(size=4)
+        table.store(5, depth=3, value=1.5)
+        table.store(9, depth=1, value=2.0)
+        self.assertEqual(table.lookup(5), (3, 1.5, transposition.EXACT, None))
+        self.assertIsNone(table.lookup(9))
+        table.newSearch()
+        table.store(9, depth=1, value=2.0)
+        self.assertIsNone(table.lookup(5))
+        # A shallower bound for the same state does not replace a deeper result.
+        table.store(9, depth=3, value=4.0, flag=transposition.LOWER_BOUND)
+        table.store(9, depth=2, value=3.0, flag=transposition.UPPER_BOUND)
+        self.assertEqual(table.lookup(9), (3, 4.0, transposition.LOWER_BOUND, None))
+        table.store(9, depth=2, value=3.0)
+        self.assertEqual(table.lookup(9), (2, 3.0, transposition.EXACT, None))
+
+class LegalMoveCases(unittest.TestCase):
+
+    def testLegalMoves(self):
+        testGame = buildGame()
+        testGame.getMap().setDisabled((3,1), True)
+        from_positions, to_positions, build_positions = testGame.legalMoves()
+        moves = set((tuple(a), tuple(b)) for a, b in zip(from_positions.tolist(), to_positions.tolist()))
+        self.assertIn(((1,2),(1,3)), moves)
+        self.assertNotIn(((2,1),(1,1)), moves)
+        self.assertNotIn(((2,1),(3,1)), moves)
+        self.assertEqual(len(moves), 9)
+        self.assertEqual(len(build_positions), 0)
+        testGame.getCurrentPlayer().changeResources(game.NEW_UNIT_COST)
+        build_positions = testGame.legalMoves()[2]
+        self.assertEqual(sorted(tuple(pos) for pos in build_positions.tolist()), [(0,1),(0,2),(1,0),(2,2)])
+
+    def testMakeUnitNeedsButDoesNotSpendResources(self):
+        testGame = buildGame()
+        self.assertRaises(RuntimeError, testGame.makeUnit, (0,1))
+        testGame.getCurrentPlayer().changeResources(game.NEW_UNIT_COST)
+        testGame.makeUnit((0,1))
+        self.assertEqual(testGame.getMap().getType((0,1)), cell.UNIT)
+        self.assertEqual(testGame.getCurrentPlayer().getResources(), game.NEW_UNIT_COST)
+
+class SelfPlayCases(unittest.TestCase):
+
+    def testGamesAreReproducible(self):
+        task = {"game": 0, "seed": 3, "rows": 8, "cols": 7, "agents": ["random"] * 4,
+                "max_turns": 60, "packed": False}
+        first, second = selfplay.playGame(task), selfplay.playGame(task)
+        self.assertEqual(first["moves"], second["moves"])
+        self.assertEqual(first["winner"], second["winner"])
+        self.assertGreater(first["turns"], 0)
+
+class BatchedMapCases(unittest.TestCase):
+
+    def testStepMatchesMap(self):
+        testMap = selfplay.buildMap(8, 7)
+        batch = map.BatchedMap.fromMap(testMap, 3)
+        # Board 0 attacks a tower, board 1 moves into its own tower, board 2 passes.
+        testMap.setCell((2,2), color=cell.GREEN, type=cell.UNIT, strength=3)
+        batch.setBoard(0, testMap)
+        valid, captured = batch.step([(2,2),(2,1),(-1,-1)], [(1,1),(1,1),(-1,-1)])
+        self.assertEqual(valid.tolist(), [True, False, False])
+        self.assertEqual(captured.tolist(), [cell.RED, cell.EMPTY, cell.EMPTY])
+        self.assertEqual(batch.getBoard(0).getColor((1,1)), cell.GREEN)
+        self.assertEqual(batch.getBoard(0).getUnits(cell.RED), ())
+        alive = batch.alivePlayers()
+        self.assertEqual(alive[:,cell.RED].tolist(), [False, True, True])
+        income = batch.collectResources()
+        self.assertEqual(income[1,cell.RED], testMap.collectPlayerResources(cell.BLUE))
+        self.assertEqual(income[0,cell.RED], 0)
+    def testPackedSquareBoards(self):
+        testMap = map.Map(4, 5, grid=cell.SQUARE_MAP_TYPE[0], packed=True)
+        testMap.setCell((1,1), color=cell.RED, type=cell.UNIT, strength=2)
+        batch = map.BatchedMap.fromMap(testMap, 2)
+        board = batch.getBoard(1)
+        self.assertEqual(board.getGrid(), testMap.getGrid())
+        self.assertEqual(board.getStrength((1,1)), 2)
+        self.assertEqual(batch.getStrengths().dtype, map.map.PACKED_DTYPES["strengths"])
+
+class MCTSCases(unittest.TestCase):
+
+    def testPlaysLegalTurns(self):
+        agent = mcts.MCTSAgent(cell.RED, seed=1, playouts=20)
+        testGame = game.Game(selfplay.buildMap(6, 6, 2),
+                             rotation=[agent, gameai.RandomAgent(cell.GREEN, seed=2)])
+        for turn in range(4):
+            testGame.queryCurrentPlayer()
+        stats = agent.getStats()
+        self.assertGreaterEqual(stats["playouts"], 40)
+        self.assertGreater(stats["nodes"], 0)
+        self.assertEqual(testGame.getStoredMoves()[-1].getMoveType(), movevector.TYPE_END_TURN)
+
+    def testTakesWinningMove(self):
+        testMap = selfplay.buildMap(6, 6, 2)
+        testMap.setCell((4,2), color=cell.RED, type=cell.UNIT, strength=5)
+        agent = mcts.MCTSAgent(cell.RED, seed=0, playouts=200)
+        testGame = game.Game(testMap, rotation=[agent, cell.GREEN])
+        testGame.queryCurrentPlayer()
+        self.assertTrue(testGame.gameOver())
+
+class AlphaBetaCases(unittest.TestCase):
+
+    def testTakesWinningMove(self):
+        testMap = selfplay.buildMap(6, 6, 2)
+        testMap.setCell((4,2), color=cell.RED, type=cell.UNIT, strength=5)
+        agent = alphabeta.AlphaBetaAgent(cell.RED, seed=0, seconds=0.2)
+        testGame = game.Game(testMap, rotation=[agent, cell.GREEN])
+        testGame.queryCurrentPlayer()
+        self.assertTrue(testGame.gameOver())
+
+    def testSearchLeavesGameUnchanged(self):
+        agent = alphabeta.AlphaBetaAgent(cell.RED, seed=0, seconds=0.2)
+        testGame = gameai.buildSearchGame(selfplay.buildMap(8, 7), cell.RED, game.NEW_UNIT_COST)
+        testGame.startJournal()
+        key = testGame.getHash()
+        move = agent.search(testGame, 0.2)
+        self.assertEqual(testGame.getHash(), key)
+        self.assertIn(move, gameai.legalActions(testGame))
+        self.assertGreaterEqual(agent.getStats()["average_depth"], 1)
+
+    def testSharedTable(self):
+        table = transposition.TranspositionTable()
+        red = alphabeta.AlphaBetaAgent(cell.RED, seed=0, seconds=0.1, max_depth=2, table=table)
+        green = alphabeta.AlphaBetaAgent(cell.GREEN, seed=0, seconds=0.1, max_depth=2, table=table)
+        testGame = gameai.buildSearchGame(selfplay.buildMap(8, 7), cell.RED, game.NEW_UNIT_COST)
+        testGame.startJournal()
+        key = testGame.getHash()
+        red.search(testGame, 0.1)
+        self.assertIsNotNone(table.lookup(key ^ zobrist.searcherKey(cell.RED)))
+        self.assertIsNone(table.lookup(key ^ zobrist.searcherKey(cell.GREEN)))
+        green.search(testGame, 0.1)
+        self.assertIsNotNone(table.lookup(key ^ zobrist.searcherKey(cell.GREEN)))
+
+    def testWinScoresAreStoredFromTheNode(self):
+        # A win found 5 plies below a node at ply 3 is worth the same when the node is reached at ply 7.
+        stored = alphabeta.scoreToTable(alphabeta.WIN_SCORE - 8, 3)
+        self.assertEqual(stored, alphabeta.WIN_SCORE - 5)
+        self.assertEqual(alphabeta.scoreFromTable(stored, 7), alphabeta.WIN_SCORE - 12)
+        self.assertEqual(alphabeta.scoreFromTable(alphabeta.scoreToTable(-alphabeta.WIN_SCORE + 4, 2), 2),
+                         -alphabeta.WIN_SCORE + 4)
+        self.assertEqual(alphabeta.scoreToTable(37, 6), 37)
+
+class ReplayCases(unittest.TestCase):
+
+    def testSeekMatchesRecordedGame(self):
+        with tempfile.TemporaryDirectory() as directory:
+            task = {"game": 0, "seed": 5, "rows": 8, "cols": 7, "agents": ["random"] * 4,
+                    "max_turns": 30, "packed": False, "replays": directory}
+            result = selfplay.playGame(task)
+            log = replay.Replay(os.path.join(directory, "game000000.log"))
+            self.assertEqual(log.getNumMoves(), result["moves"])
+            self.assertEqual(log.getNumTurns(), result["turns"])
+            # Replaying the log from the first snapshot gives the same game as seeking.
+            start = log.getGame(0)
+            start.makeMoves(log.getMove(k) for k in range(log.getTurnStart(20)))
+            self.assertEqual(log.getGame(20).getHash(), start.getHash())
+
+    def testRecordedGameCannotUndo(self):
+        testGame = buildGame()
+        with tempfile.TemporaryDirectory() as directory:
+            with replay.ReplayWriter(os.path.join(directory, "game.log"), testGame) as writer:
+                testGame.setRecorder(writer)
+                testGame.startJournal()
+                testGame.makeMove(movevector.MoveVector(movevector.TYPE_END_TURN))
+                self.assertRaises(RuntimeError, testGame.unmakeMove)
+    def testFailedRecordedMoveLeavesJournal(self):
+        testGame = buildGame()
+        with tempfile.TemporaryDirectory() as directory:
+            with replay.ReplayWriter(os.path.join(directory, "game.log"), testGame) as writer:
+                testGame.setRecorder(writer)
+                testGame.startJournal()
+                testGame.makeMove(movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(2,2))))
+                # The error of the move itself is raised, not the error of unmakeMove.
+                with self.assertRaisesRegex(RuntimeError, "already moved"):
+                    testGame.makeMove(movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,2),(3,2))))
+                self.assertEqual(writer.getNumMoves(), 1)
+                self.assertEqual(testGame.getStoredMoves(), [])
+                testGame.setRecorder(None)
+                testGame.unmakeMove()
+                self.assertEqual(testGame.getMap().getUnits(cell.RED), ((1,2),(2,1)))
+                self.assertRaises(RuntimeError, testGame.unmakeMove)
+
+class SaveLoadCases(unittest.TestCase):
+
+    def testRoundTrip(self):
+        testMap = selfplay.buildMap(8, 7)
+        testMap.setDisabled((4,4), True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.map")
+            for adjacency in (False, True):
+                testMap.save(path, adjacency=adjacency)
+                for mmap in (False, True):
+                    loaded = map.Map.load(path, mmap=mmap, debug=True)
+                    self.assertEqual(loaded.getHash(), testMap.getHash())
+                    self.assertEqual(loaded.getUnits(cell.RED), testMap.getUnits(cell.RED))
+                    self.assertEqual(loaded.getTower(cell.BLUE), testMap.getTower(cell.BLUE))
+                    self.assertEqual(loaded.collectPlayerResources(cell.GREEN),
+                                     testMap.collectPlayerResources(cell.GREEN))
+                    self.assertEqual(loaded.getAdjacent((4,3)), testMap.getAdjacent((4,3)))
+                    del loaded
+
+    def testLoadWithoutMmap(self):
+        testMap = selfplay.buildMap(8, 7, packed=True)
+        testMap.setDisabled((4,4), True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.map")
+            testMap.save(path)
+            loaded = map.Map.load(path, mmap=False, debug=True)
+            self.assertNotIsInstance(loaded.__colors__, numpy.memmap)
+            self.assertEqual(loaded.getHash(), testMap.getHash())
+            self.assertTrue(loaded.getDisabled((4,4)))
+            self.assertEqual(loaded.getAdjacent((4,3)), testMap.getAdjacent((4,3)))
+            self.assertEqual(loaded.getStrength((1,1)), 2)
+            loaded.makeMove((2,1), (3,1))
+            self.assertEqual(map.Map.load(path, mmap=False).getHash(), testMap.getHash())
+
+    def testMappedChangesStayInMemory(self):
+        testMap = selfplay.buildMap(8, 7, packed=True)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.map")
+            testMap.save(path)
+            loaded = map.Map.load(path)
+            loaded.makeMove((2,1), (3,1))
+            self.assertEqual(loaded.getStrength((3,1)), 1)
+            self.assertEqual(map.Map.load(path).getHash(), testMap.getHash())
+            del loaded
+
+class ChunkedMapCases(unittest.TestCase):
+
+    def buildMaps(self):
+        denseMap = selfplay.buildMap(9, 8)
+        chunkedMap = map.ChunkedMap(9, 8, resources=1, tile_size=4)
+        for color in (cell.RED, cell.GREEN, cell.BLUE, cell.YELLOW):
+            for pos in [denseMap.getTower(color)] + sorted(denseMap.getUnits(color)):
+                chunkedMap.setCell(pos, color=color, type=denseMap.getType(pos),
+                                   strength=denseMap.getStrength(pos))
+        return denseMap, chunkedMap
+
+    def testMatchesMap(self):
+        denseMap, chunkedMap = self.buildMaps()
+        games = [game.Game(denseMap), game.Game(chunkedMap)]
+        rng = random.Random(5)
+        for k in range(300):
+            moves = [current.legalMoves() for current in games]
+            for dense, chunked in zip(moves[0], moves[1]):
+                self.assertEqual(dense.tolist(), chunked.tolist())
+            from_positions, to_positions, build_positions = moves[0]
+            choice = rng.randrange(len(from_positions) + len(build_positions) + 1)
+            if choice < len(from_positions):
+                vect = movevector.MoveVector(movevector.TYPE_MOVE_UNIT,
+                                             (tuple(from_positions[choice].tolist()), tuple(to_positions[choice].tolist())))
+            elif choice < len(from_positions) + len(build_positions):
+                vect = movevector.MoveVector(movevector.TYPE_MAKE_UNIT,
+                                             tuple(build_positions[choice - len(from_positions)].tolist()))
+            else:
+                vect = movevector.MoveVector(movevector.TYPE_END_TURN)
+            for current in games:
+                current.makeMove(vect)
+            self.assertEqual(games[0].getHash(), games[1].getHash())
+            if games[0].gameOver():
+                break
+        self.assertEqual(games[0].getMap().getAdjacent((4,4)), games[1].getMap().getAdjacent((4,4)))
+
+    def testMemoryFollowsOccupiedArea(self):
+        testMap = map.ChunkedMap(100000, 100000, resources=1, packed=True)
+        testMap.setCell((50000,50000), color=cell.RED, type=cell.TOWER, strength=2)
+        testMap.setCell((50001,50000), color=cell.RED, type=cell.UNIT, strength=1)
+        self.assertEqual(testMap.collectPlayerResources(cell.RED), 7)
+        self.assertLess(testMap.getMemoryUsage(), 100000)
+        testMap.makeMove((50001,50000), (50002,50000))
+        testMap.removeColor(cell.RED)
+        self.assertEqual(testMap.getMemoryUsage(), 0)
+
+class ChangeTrackingCases(unittest.TestCase):
+
+    def testPopChanges(self):
+        testMap = selfplay.buildMap(8, 7)
+        self.assertRaises(RuntimeError, testMap.popChanges)
+        testMap.trackChanges()
+        testMap.makeMove((2,1), (3,1))
+        testMap.setResources((0,0), 3)
+        self.assertEqual(testMap.popChanges(), {(2,1), (3,1), (0,0)})
+        self.assertEqual(testMap.popChanges(), set())
+        testMap.startJournal()
+        testMap.makeMove((3,1), (3,2))
+        testMap.unmakeMove()
+        self.assertEqual(testMap.popChanges(), {(3,1), (3,2)})
+        self.assertEqual(testMap.snapshot().__changes__, None)
+
+class StatsCases(unittest.TestCase):
+
+    def testGameStats(self):
+        testMap = selfplay.buildMap(8, 7)
+        testGame = game.Game(testMap, rotation=[gameai.RandomAgent(cell.RED, seed=1),
+                                                gameai.RandomAgent(cell.GREEN, seed=2)])
+        self.assertRaises(RuntimeError, testGame.stats)
+        trace = io.StringIO()
+        testGame.startStats(trace)
+        for k in range(6):
+            testGame.queryCurrentPlayer()
+        stats = testGame.stats()
+        self.assertEqual(stats["counters"]["game.turns"], 6)
+        self.assertEqual(stats["counters"]["game.moves"], len(testGame.getStoredMoves()))
+        self.assertEqual(stats["timers"]["game.snapshot"]["calls"], 6)
+        self.assertEqual(stats["timers"]["map.collectPlayerResources"]["calls"], 6)
+        self.assertGreater(stats["timers"]["map.makeMoveUnchecked"]["calls"], 0)
+        # RandomAgent gets its units from the snapshot it is passed.
+        self.assertGreater(stats["timers"]["map.getUnits"]["calls"], 0)
+        self.assertTrue(stats["timers"]["think.red"]["seconds"] > 0)
+        lines = [json.loads(line) for line in trace.getvalue().splitlines()]
+        self.assertEqual([line["color"] for line in lines], ["red", "green"] * 3)
+        self.assertEqual(sum(line["counters"]["game.moves"] for line in lines), stats["counters"]["game.moves"])
+        # Snapshots and stopped maps call the class methods directly.
+        self.assertFalse("makeMove" in testMap.snapshot().__dict__)
+        testGame.stopStats()
+        self.assertFalse("makeMove" in testMap.__dict__)
+        self.assertEqual(testMap.getStats(), None)
+    def testBatchedMovesAreCounted(self):
+        testGame = buildGame()
+        testGame.startStats()
+        testGame.makeMoves([movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((2,1),(2,2))),
+                            movevector.MoveVector(movevector.TYPE_MOVE_UNIT, ((1,2),(0,2))),
+                            movevector.MoveVector(movevector.TYPE_END_TURN)])
+        self.assertEqual(testGame.stats()["counters"]["game.moves"], 3)
+
+class BenchmarkCases(unittest.TestCase):
+
+    def testRunAndCompare(self):
+        results = list(benchmark.runBenchmarks([(8, 7)], ["makeMove", "gameTurn"], min_time=0.01))
+        self.assertEqual([(result["benchmark"], result["size"]) for result in results],
+                         [("makeMove", "8x7"), ("gameTurn", "8x7")])
+        self.assertTrue(all(result["ops_per_sec"] > 0 and result["peak_bytes"] > 0 for result in results))
+        baseline = [dict(results[0], ops_per_sec=results[0]["ops_per_sec"] * 2),
+                    dict(results[1], ops_per_sec=results[1]["ops_per_sec"] * 1.05)]
+        comparisons = benchmark.compareResults(results, baseline, threshold=0.1)
+        self.assertEqual([comparison["regressed"] for comparison in comparisons], [True, False])
+
+class UncheckedAccessCases(unittest.TestCase):
+
+    def testUncheckedMatchesChecked(self):
+        testMap = selfplay.buildMap(8, 7)
+        for (i, j) in [(1,1), (2,1), (0,0), (6,5)]:
+            self.assertEqual(testMap.getColorUnchecked(i, j), testMap.getColor((i,j)))
+            self.assertEqual(testMap.getTypeUnchecked(i, j), testMap.getType((i,j)))
+            self.assertEqual(testMap.getStrengthUnchecked(i, j), testMap.getStrength((i,j)))
+            self.assertEqual(testMap.getResourcesUnchecked(i, j), testMap.getResources((i,j)))
+            self.assertEqual(testMap.getDisabledUnchecked(i, j), testMap.getDisabled((i,j)))
+        checkedMap = testMap.snapshot()
+        testMap.setCellUnchecked(4, 4, cell.GREEN, cell.UNIT, 3)
+        checkedMap.setCell((4,4), color=cell.GREEN, type=cell.UNIT, strength=3)
+        testMap.makeMoveUnchecked(4, 4, 4, 3)
+        checkedMap.makeMove((4,4), (4,3))
+        self.assertEqual(testMap.getHash(), checkedMap.getHash())
+        self.assertEqual(testMap.getUnits(cell.GREEN), checkedMap.getUnits(cell.GREEN))
+
+    def testMoveUnitChecksOnce(self):
+        testGame = game.Game(selfplay.buildMap(8, 7))
+        self.assertRaises(IndexError, testGame.moveUnit, (2,1), (8,1))
+        self.assertRaises(RuntimeError, testGame.moveUnit, (2,1), (4,1))
+        stats = testGame.getMap().startStats()
+        testGame.moveUnit((2,1), (3,1))
+        self.assertEqual(stats.snapshot()["timers"]["map.__checkIndices__"]["calls"], 2)
+        self.assertEqual(testGame.getMap().getColor((3,1)), cell.RED)
+        self.assertRaises(RuntimeError, testGame.moveUnit, (3,1), (3,2))
+
+class RendererCases(unittest.TestCase):
+
+    def testOnlyChangedCellsAreDrawn(self):
+        pygame.init()
+        surface = pygame.display.set_mode((1280, 720))
+        testMap = selfplay.buildMap(8, 7)
+        renderer = ui.BoardRenderer(surface, testMap, pygame.font.Font(None, 15), viewport=(0, 0, 740, 720))
+        self.assertEqual(renderer.drawBoard(), 56)
+        renderer.drawWidget("turn", cell.RED, lambda surface: pygame.draw.rect(surface, cell.RGB_RED, [800, 200, 50, 50]))
+        self.assertEqual(renderer.present(), [pygame.Rect(0, 0, 740, 720), pygame.Rect(800, 200, 50, 50)])
+        testMap.makeMove((2,1), (3,1))
+        self.assertEqual(renderer.drawBoard(), 2)
+        self.assertFalse(renderer.drawWidget("turn", cell.RED, None))
+        rects = renderer.present()
+        self.assertEqual(len(rects), 2)
+        x, y = renderer.getCellOrigin((3,1))
+        self.assertTrue(any(rect.collidepoint(x + 20, y + 30) for rect in rects))
+        self.assertEqual(surface.get_at((int(x) + 20, int(y) + 30))[:3], cell.RGB_RED)
+        self.assertEqual(renderer.present(), [])
+
+    def testCameraCullsCells(self):
+        pygame.init()
+        surface = pygame.display.set_mode((640, 480))
+        testMap = map.ChunkedMap(100000, 100000)
+        renderer = ui.BoardRenderer(surface, testMap, pygame.font.Font(None, 15))
+        drawn = renderer.drawBoard()
+        self.assertLess(drawn, 100)
+        self.assertEqual(renderer.cellAt((140, 90)), (0,0))
+        camera = renderer.getCamera()
+        camera.pan(-7000, -8000)
+        i0, i1, j0, j1 = renderer.getVisibleWindow()
+        self.assertTrue(i0 > 0 and j0 > 0)
+        self.assertEqual(renderer.drawBoard(), (i1 - i0) * (j1 - j0))
+        testMap.setCell((i0, j0), color=cell.RED, type=cell.UNIT, strength=1)
+        testMap.setCell((0, 0), color=cell.RED, type=cell.UNIT, strength=1)
+        renderer.present()
+        self.assertEqual(renderer.drawBoard(), 1)
+        # Zoomed far out, every cell on the screen is a few pixels wide.
+        camera.zoomAt(0.05, (320, 240))
+        self.assertLess(renderer.drawBoard(), 640 * 480 / 4)
+        world = camera.toWorld((320, 240))
+        camera.zoomAt(2, (320, 240))
+        self.assertAlmostEqual(camera.toWorld((320, 240))[0], world[0])
+
+    def testCameraWheelWithoutMouseWheelEvents(self):
+        # pygame 1.9 reports the mouse wheel as presses of buttons 4 and 5.
+        import ui.camera
+        mousewheel, ui.camera.MOUSEWHEEL = ui.camera.MOUSEWHEEL, None
+        try:
+            camera = ui.Camera()
+            self.assertTrue(camera.handleEvent(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=4, pos=(10, 20))))
+            self.assertAlmostEqual(camera.getZoom(), ui.camera.ZOOM_STEP)
+            self.assertAlmostEqual(camera.toWorld((10, 20))[0], 10)
+            camera.handleEvent(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=5, pos=(10, 20)))
+            self.assertAlmostEqual(camera.getZoom(), 1.0)
+            self.assertFalse(camera.handleEvent(pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=1, pos=(10, 20))))
+        finally:
+            ui.camera.MOUSEWHEEL = mousewheel
+
+    def testCaches(self):
+        pygame.init()
+        texts = ui.TextCache(pygame.font.Font(None, 15), size=2)
+        label = texts.render("T", cell.RGB_BLACK)
+        self.assertIs(texts.render("T", cell.RGB_BLACK), label)
+        texts.render("a", cell.RGB_BLACK)
+        texts.render("b", cell.RGB_BLACK)
+        self.assertIsNot(texts.render("T", cell.RGB_BLACK), label)
+        self.assertEqual(texts.getStats(), {"size": 2, "hits": 1, "misses": 4})
+        sprites = ui.SpriteCache(40, texts)
+        sprite = sprites.getSprite(cell.RGB_RED, cell.UNIT)
+        self.assertIs(sprites.getSprite(cell.RGB_RED, cell.UNIT), sprite)
+        self.assertIsNot(sprites.getSprite(cell.RGB_RED, cell.TOWER), sprite)
+        self.assertEqual(sprite.get_at((int(sprites.getAnchor()) + 20, 30))[:3], cell.RGB_RED)
+
+class HexLayoutCases(unittest.TestCase):
+
+    def testPixelToCell(self):
+        layout = ui.HexLayout((8,7))
+        side = layout.getSide()
+        for i in range(8):
+            for j in range(7):
+                x, y = layout.cellOrigin((i,j))
+                # Center of the hexagon, and points just inside its left and right corners
+                self.assertEqual(layout.pixelToCell((x + side / 2, y + side * 0.866)), (i,j))
+                self.assertEqual(layout.pixelToCell((x - side / 2 + 1, y + side * 0.866)), (i,j))
+                self.assertEqual(layout.pixelToCell((x + side * 1.5 - 1, y + side * 0.866)), (i,j))
+        # Between the hexagons of a column, and outside the board
+        x, y = layout.cellOrigin((0,0))
+        self.assertEqual(layout.pixelToCell((x + side / 2, y + side * 1.732 + 5)), None)
+        self.assertEqual(layout.pixelToCell((0, 0)), None)
+        self.assertEqual(layout.pixelToCell(layout.cellOrigin((8,0))), None)
+
+    def testVectorized(self):
+        layout = ui.HexLayout((8,7), side=25, origin=(30,40))
+        rng = numpy.random.RandomState(3)
+        xs, ys = rng.uniform(0, 800, 500), rng.uniform(0, 600, 500)
+        cells = layout.pixelsToCells(xs, ys)
+        for k in range(500):
+            expected = layout.pixelToCell((xs[k], ys[k]))
+            self.assertEqual(tuple(cells[k].tolist()), (-1,-1) if expected is None else expected)
+
+class FrameSchedulerCases(unittest.TestCase):
+
+    def testWaitAndMeasure(self):
+        pygame.init()
+        pygame.display.set_mode((64, 64))
+        pygame.event.clear()
+        scheduler = ui.FrameScheduler(fps=20)
+        start = time.perf_counter()
+        self.assertEqual(scheduler.waitEvents(timeout=0.05), [])
+        self.assertGreater(time.perf_counter() - start, 0.04)
+        # The timer that ended the wait is stopped, and its events never reach the loop.
+        time.sleep(0.1)
+        self.assertEqual(scheduler.waitEvents(timeout=0.01), [])
+        pygame.event.post(pygame.event.Event(pygame.USEREVENT))
+        start = time.perf_counter()
+        events = scheduler.waitEvents(timeout=1)
+        self.assertEqual([event.type for event in events], [pygame.USEREVENT])
+        # Frames are at least 1/20 of a second apart.
+        self.assertGreater(time.perf_counter() - start, 0.03)
+        with scheduler.measure("update"):
+            time.sleep(0.01)
+        scheduler.waitEvents(timeout=0)
+        stats = scheduler.getStats()
+        self.assertEqual(stats["frames"], 1)
+        self.assertGreater(stats["update"]["mean_ms"], 9)
+        self.assertEqual(stats["frame"]["max_ms"], stats["update"]["max_ms"])
+
+class AIWorkerCases(unittest.TestCase):
+
+    def playTurn(self, worker, testGame):
+        worker.start(testGame.getCurrentPlayer(), testGame.getMap())
+        deadline = time.perf_counter() + 10
+        while time.perf_counter() < deadline:
+            for vect in worker.poll():
+                testGame.makeMove(vect)
+                if vect.getMoveType() == movevector.TYPE_END_TURN:
+                    return
+            time.sleep(0.001)
+        self.fail("The worker did not finish the turn.")
+
+    def testTurnsRunInBackground(self):
+        players = [gameai.RandomAgent(color, seed=color) for color in selfplay.PLAYER_COLORS]
+        testGame = game.Game(selfplay.buildMap(8, 7), rotation=players)
+        expected = game.Game(selfplay.buildMap(8, 7),
+                             rotation=[gameai.RandomAgent(color, seed=color) for color in selfplay.PLAYER_COLORS])
+        worker = ui.AIWorker()
+        for turn in range(8):
+            self.playTurn(worker, testGame)
+            expected.queryCurrentPlayer()
+            self.assertEqual(testGame.getHash(), expected.getHash())
+        self.assertFalse(worker.isBusy())
+
+    def testErrorsReachThePoller(self):
+        class BrokenAgent(gameai.Agent):
+            def makeMove(self, game_map):
+                yield movevector.MoveVector(movevector.TYPE_MAKE_UNIT, (0, 0))
+                raise ValueError("broken")
+        worker = ui.AIWorker()
+        worker.start(BrokenAgent(cell.RED), selfplay.buildMap(8, 7))
+        while worker.isRunning():
+            time.sleep(0.001)
+        self.assertEqual(len(worker.poll(1)), 1)
+        self.assertRaises(ValueError, worker.poll)
+
 		
 		
 if __name__ == '__main__':
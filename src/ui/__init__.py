@@ -0,0 +1,32 @@
+"""
+   .. module: ui
+    :synopsis: Drawing, input and scheduling for the pygame UI in mapgame.py.
+    The BoardRenderer class draws a Map onto a pygame surface and keeps track
+    of the parts of the screen that have to be sent to the display.
+"""
+
+from . import renderer as renderermod
+from . import cache as cachemod
+from . import layout as layoutmod
+from . import camera as cameramod
+from . import scheduler as schedulermod
+from . import worker as workermod
+
+# Allows the UI to draw a map by importing this module.
+BoardRenderer = renderermod.BoardRenderer
+
+# Caches of rendered text and hexagons.
+TextCache = cachemod.TextCache
+SpriteCache = cachemod.SpriteCache
+
+# Conversion between cells and screen positions.
+HexLayout = layoutmod.HexLayout
+
+# Pan and zoom.
+Camera = cameramod.Camera
+
+# Event-driven frame pacing and frame timing.
+FrameScheduler = schedulermod.FrameScheduler
+
+# Runs AI turns on a background thread.
+AIWorker = workermod.AIWorker
@@ -0,0 +1,121 @@
+"""
+   .. module: cache
+    :synopsis: Caches for the renderer. A SpriteCache pre-rasterizes one
+    hexagon per color and cell type at a given side length, so that drawing a
+    cell is a single blit, and a TextCache keeps the most recently rendered
+    text surfaces so that the same label is not rendered again every frame.
+"""
+
+import os, sys
+import collections
+import numpy as np
+import pygame
+
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+if src_path not in sys.path:
+    sys.path.append( src_path )
+
+import map.cell as cell
+
+# Default number of text surfaces kept by a TextCache.
+DEFAULT_TEXT_CACHE_SIZE = 256
+
+# Towers are only labelled in hexagons with at least this side length, in pixels.
+LABEL_SIDE = 20
+
+# Color of the transparent pixels of a sprite. No cell is drawn in this color.
+COLOR_KEY = (255, 0, 255)
+
+def hexVertices(side):
+    """
+    Get the six vertices of a hexagon with the input side length, relative to its top
+    left corner, as a (6, 2) array. The hexagon extends side * cos(60) to the left of
+    that corner.
+    """
+    x_disp = np.cos(np.deg2rad(60)) * side
+    y_disp = np.sin(np.deg2rad(60)) * side
+    return np.array([(0, 0), (side, 0), (side + x_disp, y_disp),
+                     (side, 2 * y_disp), (0, 2 * y_disp), (-x_disp, y_disp)])
+
+"""
+Least recently used cache of rendered text surfaces, keyed by the text and its color.
+"""
+class TextCache(object):
+
+    def __init__(self, font, size=DEFAULT_TEXT_CACHE_SIZE):
+        """Create a cache of text rendered with the input pygame font."""
+        if type(size) is not int or size <= 0:
+            raise ValueError( "The size of a TextCache must be a positive integer." )
+        self.__font__     = font
+        self.__size__     = size
+        self.__surfaces__ = collections.OrderedDict()
+        self.__hits__, self.__misses__ = 0, 0
+
+    def render(self, msg, color):
+        """Get a surface with the input text, rendering it only if it is not cached."""
+        key = (msg, tuple(color))
+        surface = self.__surfaces__.get(key)
+        if surface is not None:
+            self.__surfaces__.move_to_end(key)
+            self.__hits__ += 1
+            return surface
+        self.__misses__ += 1
+        surface = self.__surfaces__[key] = self.__font__.render(msg, 5, color)
+        if len(self.__surfaces__) > self.__size__:
+            self.__surfaces__.popitem(last=False)
+        return surface
+
+    def getStats(self):
+        """Get a dictionary with the number of cached surfaces, hits and misses."""
+        return {"size": len(self.__surfaces__), "hits": self.__hits__, "misses": self.__misses__}
+
+"""
+Pre-rasterized hexagons of one side length, one per (RGB color, cell type) pair.
+"""
+class SpriteCache(object):
+
+    def __init__(self, side, text_cache):
+        """
+        Create an empty cache for hexagons with the input side length. Tower labels are
+        rendered through text_cache.
+        """
+        self.__side__      = side
+        self.__textcache__ = text_cache
+        self.__vertices__  = hexVertices(side)
+        # Distance from the left edge of a sprite to the top left corner of its hexagon
+        self.__anchor__    = float(-self.__vertices__[:,0].min())
+        self.__spritesize__ = (int(np.ceil(self.__vertices__[:,0].max() + self.__anchor__)) + 1,
+                               int(np.ceil(self.__vertices__[:,1].max())) + 1)
+        self.__sprites__   = {}
+
+    def getSide(self):
+        """Get the side length of the hexagons."""
+        return self.__side__
+
+    def getAnchor(self):
+        """
+        Get the horizontal distance from the left edge of a sprite to the top left corner
+        of its hexagon. A hexagon whose corner is at (x,y) is blitted at (x - anchor, y).
+        """
+        return self.__anchor__
+
+    def getSprite(self, rgb, cell_type):
+        """Get the sprite of a cell of the input color and type, drawing it on first use."""
+        key = (tuple(rgb), cell_type)
+        sprite = self.__sprites__.get(key)
+        if sprite is None:
+            sprite = self.__sprites__[key] = self.__drawSprite__(rgb, cell_type)
+        return sprite
+
+    def __drawSprite__(self, rgb, cell_type):
+        """Rasterize the hexagon of a cell of the input color and type."""
+        sprite = pygame.Surface(self.__spritesize__)
+        sprite.fill(COLOR_KEY)
+        sprite.set_colorkey(COLOR_KEY)
+        pygame.draw.polygon(sprite, rgb, (self.__vertices__ + (self.__anchor__, 0)).tolist())
+        if cell_type == cell.TOWER and self.__side__ >= LABEL_SIDE:
+            label = self.__textcache__.render("T", cell.RGB_BLACK)
+            sprite.blit(label, (self.__anchor__ + self.__side__ * 17 / 40, self.__side__ / 2))
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()
+        return sprite
@@ -0,0 +1,112 @@
+"""
+   .. module: camera
+    :synopsis: A camera over the board, made of a zoom factor and an offset.
+    The board is laid out in world coordinates (see layout.py); a point p of
+    the world is drawn at p * zoom - offset on the screen. The camera is moved
+    with the mouse (dragging with the right or middle button, the wheel to
+    zoom) and the keyboard (arrow keys, + and -).
+"""
+
+import pygame
+
+from . import layout
+
+# Number of pixels that an arrow key moves the view by.
+PAN_STEP = 40
+
+# Factor that one step of the mouse wheel, or one press of + or -, zooms by.
+ZOOM_STEP = 1.25
+
+# Limits of the zoom factor.
+MIN_ZOOM = 0.05
+MAX_ZOOM = 4.0
+
+# Type of the mouse wheel events, which pygame 1.9 does not have; it reports the
+# wheel as presses of mouse buttons 4 (up) and 5 (down) instead.
+MOUSEWHEEL = getattr(pygame, "MOUSEWHEEL", None)
+WHEEL_UP, WHEEL_DOWN = 4, 5
+
+"""
+Maps world coordinates to screen coordinates with a zoom factor and an offset.
+"""
+class Camera(object):
+
+    def __init__(self, offset=(0, 0), zoom=1.0, min_zoom=MIN_ZOOM, max_zoom=MAX_ZOOM):
+        """Create a camera with the input offset (in screen pixels) and zoom factor."""
+        if not 0 < min_zoom <= zoom <= max_zoom:
+            raise ValueError( "The zoom factor must lie between the minimum and maximum zoom, " +
+                              "which must be positive." )
+        self.__offset__  = (float(offset[0]), float(offset[1]))
+        self.__zoom__    = float(zoom)
+        self.__minzoom__ = min_zoom
+        self.__maxzoom__ = max_zoom
+
+    def getOffset(self):
+        """Get the screen position of the origin of the world, negated."""
+        return self.__offset__
+
+    def getZoom(self):
+        """Get the zoom factor."""
+        return self.__zoom__
+
+    def getState(self):
+        """Get the offset and zoom factor together, to check whether the camera has moved."""
+        return self.__offset__, self.__zoom__
+
+    def toScreen(self, point):
+        """Get the screen position of a point in world coordinates."""
+        return (point[0] * self.__zoom__ - self.__offset__[0], point[1] * self.__zoom__ - self.__offset__[1])
+
+    def toWorld(self, pixel):
+        """Get the world coordinates of a screen position."""
+        return ((pixel[0] + self.__offset__[0]) / self.__zoom__, (pixel[1] + self.__offset__[1]) / self.__zoom__)
+
+    def pan(self, dx, dy):
+        """Move everything on the screen by (dx,dy) pixels."""
+        self.__offset__ = (self.__offset__[0] - dx, self.__offset__[1] - dy)
+
+    def zoomAt(self, factor, pixel):
+        """
+        Multiply the zoom factor by the input factor (within the limits of the camera),
+        keeping the point of the world under the input screen position in place.
+        """
+        world = self.toWorld(pixel)
+        self.__zoom__ = min(max(self.__zoom__ * factor, self.__minzoom__), self.__maxzoom__)
+        self.__offset__ = (world[0] * self.__zoom__ - pixel[0], world[1] * self.__zoom__ - pixel[1])
+
+    def project(self, dimensions, side=layout.DEFAULT_SIDE, origin=layout.DEFAULT_ORIGIN,
+                spacing=layout.SPACING):
+        """
+        Get the HexLayout of the board on the screen, given its layout in world
+        coordinates.
+        """
+        return layout.HexLayout(dimensions, side * self.__zoom__, self.toScreen(origin),
+                                spacing * self.__zoom__)
+
+    def handleEvent(self, event):
+        """
+        Move the camera in response to a pygame event. Returns True if the camera has
+        moved.
+        """
+        state = self.getState()
+        if MOUSEWHEEL is not None and event.type == MOUSEWHEEL:
+            self.zoomAt(ZOOM_STEP ** event.y, pygame.mouse.get_pos())
+        elif MOUSEWHEEL is None and event.type == pygame.MOUSEBUTTONDOWN and \
+                event.button in (WHEEL_UP, WHEEL_DOWN):
+            self.zoomAt(ZOOM_STEP if event.button == WHEEL_UP else 1 / ZOOM_STEP, event.pos)
+        elif event.type == pygame.MOUSEMOTION and (event.buttons[1] or event.buttons[2]):
+            self.pan(*event.rel)
+        elif event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_LEFT:
+                self.pan(PAN_STEP, 0)
+            elif event.key == pygame.K_RIGHT:
+                self.pan(-PAN_STEP, 0)
+            elif event.key == pygame.K_UP:
+                self.pan(0, PAN_STEP)
+            elif event.key == pygame.K_DOWN:
+                self.pan(0, -PAN_STEP)
+            elif event.key in (pygame.K_PLUS, pygame.K_EQUALS, pygame.K_KP_PLUS):
+                self.zoomAt(ZOOM_STEP, pygame.mouse.get_pos())
+            elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                self.zoomAt(1 / ZOOM_STEP, pygame.mouse.get_pos())
+        return self.getState() != state
@@ -0,0 +1,138 @@
+"""
+   .. module: layout
+    :synopsis: Geometry of the board on the screen. A HexLayout converts
+    between cells and screen positions in both directions: the position of
+    the hexagon of a cell, and the cell under a pixel. The pixel to cell
+    conversion is computed directly from the layout, in constant time per
+    point, rather than by testing every cell.
+"""
+
+import numpy as np
+
+# Default layout of the board: the side length of a hexagon, the position of the top
+# left corner of cell (0,0), and the gap between neighboring hexagons, in pixels.
+DEFAULT_SIDE = 40
+DEFAULT_ORIGIN = (100, 50)
+SPACING = 10
+
+"""
+Layout of an m x n board of hexagons. The i index of a cell is drawn as the column
+and the j index as the row; odd columns are shifted down by half a row. The top left
+corner of the hexagon of cell (i,j) is at
+
+    x = origin[0] + i * (side + side * cos(60) + spacing)
+    y = origin[1] + j * (2 * side * sin(60) + spacing) + (i % 2) * (side * sin(60) + spacing / 2)
+
+and the hexagon extends side * cos(60) to the left of that corner.
+"""
+class HexLayout(object):
+
+    def __init__(self, dimensions, side=DEFAULT_SIDE, origin=DEFAULT_ORIGIN, spacing=SPACING):
+        """Create the layout of a board with the input (rows, columns) dimensions."""
+        if side <= 0:
+            raise ValueError( "The side length of a hexagon must be positive." )
+        self.__dimensions__ = tuple(dimensions)
+        self.__side__    = side
+        self.__origin__  = tuple(origin)
+        self.__spacing__ = spacing
+        self.__xdisp__   = np.cos(np.deg2rad(60)) * side
+        self.__ydisp__   = np.sin(np.deg2rad(60)) * side
+        # Distance between the corners of neighboring columns and rows
+        self.__xstep__   = side + self.__xdisp__ + spacing
+        self.__ystep__   = 2 * self.__ydisp__ + spacing
+
+    def getDimensions(self):
+        """Get the number of rows and columns of the board."""
+        return self.__dimensions__
+
+    def getSide(self):
+        """Get the side length of the hexagons."""
+        return self.__side__
+
+    def getOrigin(self):
+        """Get the position of the top left corner of the hexagon of cell (0,0)."""
+        return self.__origin__
+
+    def getSpacing(self):
+        """Get the gap between neighboring hexagons."""
+        return self.__spacing__
+
+    def getSteps(self):
+        """Get the horizontal distance between columns and the vertical distance between rows."""
+        return self.__xstep__, self.__ystep__
+
+    def cellOrigin(self, pos):
+        """Get the screen position of the top left corner of the hexagon of a cell."""
+        i, j = pos
+        return (self.__origin__[0] + i * self.__xstep__,
+                self.__origin__[1] + j * self.__ystep__ + (i % 2) * self.__ystep__ / 2)
+
+    def cellOrigins(self, window=None):
+        """
+        Get the screen position of the top left corner of the hexagon of every cell in a
+        window of the board, given as (first row, last row + 1, first column, last
+        column + 1), as an array with one row of positions per row of the window. The
+        default window is the whole board.
+        """
+        if window is None:
+            window = (0, self.__dimensions__[0], 0, self.__dimensions__[1])
+        i0, i1, j0, j1 = window
+        i, j = np.arange(i0, i1)[:,None], np.arange(j0, j1)[None,:]
+        x = self.__origin__[0] + i * self.__xstep__
+        y = self.__origin__[1] + j * self.__ystep__ + (i % 2) * self.__ystep__ / 2
+        return np.stack(np.broadcast_arrays(x, y), axis=-1).astype(float)
+
+    def visibleWindow(self, rect):
+        """
+        Get the window of the board, as (first row, last row + 1, first column, last
+        column + 1), that holds every cell whose hexagon overlaps the input (x, y, width,
+        height) rectangle of the screen. Computed from the layout in constant time; the
+        window is empty (first >= last) if no cell is visible.
+        """
+        x, y, width, height = rect
+        x, y = x - self.__origin__[0], y - self.__origin__[1]
+        rows, cols = self.__dimensions__
+        # Column i spans [i * xstep - xdisp, i * xstep + side + xdisp] and row j spans
+        # [j * ystep, j * ystep + 2 * ydisp], or half a step lower in odd columns.
+        i0 = int(np.ceil((x - self.__side__ - self.__xdisp__) / self.__xstep__))
+        i1 = int(np.floor((x + width + self.__xdisp__) / self.__xstep__)) + 1
+        j0 = int(np.ceil((y - 2 * self.__ydisp__ - self.__ystep__ / 2) / self.__ystep__))
+        j1 = int(np.floor((y + height) / self.__ystep__)) + 1
+        return max(i0, 0), min(i1, rows), max(j0, 0), min(j1, cols)
+
+    def pixelToCell(self, pixel):
+        """
+        Get the (i,j) position of the cell whose hexagon contains the input pixel, or None
+        if the pixel lies between hexagons or outside the board.
+        """
+        cells = self.pixelsToCells([pixel[0]], [pixel[1]])
+        if cells[0,0] < 0:
+            return None
+        return tuple(cells[0].tolist())
+
+    def pixelsToCells(self, xs, ys):
+        """
+        Vectorized pixelToCell: get the cells under the pixels (xs[k], ys[k]) as an N x 2
+        integer array, with (-1,-1) for the pixels that are not on any hexagon.
+        """
+        xs = np.asarray(xs, dtype=float).ravel() - self.__origin__[0]
+        ys = np.asarray(ys, dtype=float).ravel() - self.__origin__[1]
+        rows, cols = self.__dimensions__
+        cells = np.full((len(xs), 2), -1, dtype=np.int64)
+        # A hexagon spans 2 * side horizontally, which is less than two column steps, so
+        # a pixel lies within the horizontal span of at most two neighboring columns.
+        first = np.ceil((xs - self.__side__ - self.__xdisp__) / self.__xstep__).astype(np.int64)
+        for i in (first, first + 1):
+            # Nearest row of that column, measured from the centers of its hexagons
+            v = ys - (i % 2) * self.__ystep__ / 2 - self.__ydisp__
+            j = np.round(v / self.__ystep__).astype(np.int64)
+            u = xs - i * self.__xstep__
+            v = np.abs(v - j * self.__ystep__)
+            # The slanted sides run from the middle corners (v = 0) to the top and bottom
+            # corners (v = ydisp), moving xdisp towards the center.
+            inset = self.__xdisp__ * (v / self.__ydisp__ - 1)
+            inside = (v <= self.__ydisp__) & (u >= inset) & (u <= self.__side__ - inset) & \
+                     (i >= 0) & (i < rows) & (j >= 0) & (j < cols) & (cells[:,0] < 0)
+            cells[inside, 0] = i[inside]
+            cells[inside, 1] = j[inside]
+        return cells
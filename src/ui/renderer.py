@@ -0,0 +1,233 @@
+"""
+   .. module: renderer
+    :synopsis: Draws a Map onto a pygame surface. The renderer asks the map
+    which cells have changed since the last frame and redraws only those, and
+    only redraws a HUD widget when the state it shows has changed. Everything
+    that is drawn is added to a list of dirty rectangles, and only those
+    rectangles are sent to the display. Cells are drawn as blits of cached
+    sprites (see cache.py), and only the cells that can be seen through the
+    camera are drawn.
+"""
+
+import os, sys
+import numpy as np
+import pygame
+
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+if src_path not in sys.path:
+    sys.path.append( src_path )
+
+import map.cell as cell
+from . import cache
+from . import layout
+from . import camera as cameramod
+
+# Below this side length, in pixels, cells are drawn as plain rectangles.
+LOD_SIDE = 8
+
+# When more rectangles than this are drawn in a frame, their union is sent to the
+# display instead.
+MAX_DIRTY_RECTS = 64
+
+"""
+Draws the cells of a map and the widgets around it onto a surface. The board is drawn
+inside a viewport rectangle of the surface, through a Camera; only the cells whose
+hexagons overlap the viewport are drawn, so the cost of a frame does not depend on the
+size of the board. The i index of a cell is drawn as the column and the j index as the
+row; odd columns are shifted down by half a hexagon.
+"""
+class BoardRenderer(object):
+
+    def __init__(self, surface, game_map, font, side=layout.DEFAULT_SIDE, origin=layout.DEFAULT_ORIGIN,
+                 viewport=None, camera=None, background=cell.RGB_BLACK):
+        """
+        Create a renderer that draws game_map onto surface with the input pygame font.
+        side and origin give the layout of the board in world coordinates (see
+        camera.py). The board is drawn inside the viewport rectangle (by default the
+        whole surface) on the background color. The map starts tracking its changed
+        cells (see Map.trackChanges).
+        """
+        self.__surface__    = surface
+        self.__textcache__  = cache.TextCache(font)
+        self.__viewport__   = surface.get_rect() if viewport is None else pygame.Rect(viewport)
+        self.__camera__     = cameramod.Camera() if camera is None else camera
+        self.__background__ = background
+        # Rectangles drawn since the last call to present
+        self.__dirty__      = []
+        # State last drawn by each widget, keyed by the widget's name
+        self.__widgets__    = {}
+        self.__sprites__    = None
+        self.__world__      = (side, origin)
+        self.setMap(game_map)
+
+    def setMap(self, game_map):
+        """Draw a different map from now on. The whole board is drawn on the next frame."""
+        self.__map__ = game_map
+        game_map.trackChanges()
+        # Compute the layout again on the next frame
+        self.__camerastate__ = None
+
+    def getMap(self):
+        """Get the map being drawn."""
+        return self.__map__
+
+    def setLayout(self, side, origin):
+        """Lay the board out with a different side length or origin in world coordinates."""
+        self.__world__ = (side, origin)
+        self.__camerastate__ = None
+
+    def setViewport(self, viewport):
+        """Draw the board inside a different rectangle of the surface from now on."""
+        self.__viewport__ = pygame.Rect(viewport)
+        self.__camerastate__ = None
+
+    def getViewport(self):
+        """Get the rectangle of the surface that the board is drawn in."""
+        return self.__viewport__
+
+    def getCamera(self):
+        """Get the camera that the board is seen through."""
+        return self.__camera__
+
+    def getLayout(self):
+        """Get the HexLayout of the board on the screen, for the current position of the camera."""
+        self.__updateLayout__()
+        return self.__layout__
+
+    def getVisibleWindow(self):
+        """
+        Get the window of cells that overlap the viewport, as (first row, last row + 1,
+        first column, last column + 1).
+        """
+        self.__updateLayout__()
+        return self.__window__
+
+    def getCellOrigin(self, pos):
+        """Get the screen position of the top left corner of the hexagon of a cell."""
+        return self.getLayout().cellOrigin(pos)
+
+    def cellAt(self, pixel):
+        """
+        Get the cell under the input pixel, or None if there is none or the pixel is
+        outside the viewport (see HexLayout.pixelToCell).
+        """
+        if not self.__viewport__.collidepoint(pixel):
+            return None
+        return self.getLayout().pixelToCell(pixel)
+
+    def drawBoard(self):
+        """
+        Draw the visible cells that have changed since the last frame, or every visible
+        cell if the map, the layout or the camera has changed. Returns the number of cells
+        drawn.
+        """
+        self.__updateLayout__()
+        changes = self.__map__.popChanges()
+        self.__surface__.set_clip(self.__viewport__)
+        if self.__redrawall__:
+            i0, i1, j0, j1 = self.__window__
+            cells = [(i, j) for i in range(i0, i1) for j in range(j0, j1)]
+            positions = self.__layout__.cellOrigins(self.__window__).reshape(-1, 2).tolist()
+            self.__surface__.fill(self.__background__, self.__viewport__)
+            self.__drawCells__(cells, positions)
+            self.markDirty(self.__viewport__)
+            self.__redrawall__ = False
+        else:
+            cells = [pos for pos in changes if self.__isVisible__(pos)]
+            rects = self.__drawCells__(cells, [self.__layout__.cellOrigin(pos) for pos in cells])
+            self.__dirty__ += [rect.clip(self.__viewport__) for rect in rects]
+        self.__surface__.set_clip(None)
+        return len(cells)
+
+    def drawCell(self, pos):
+        """Draw the hexagon of a single cell, if it is visible."""
+        self.__updateLayout__()
+        if self.__isVisible__(pos):
+            self.__surface__.set_clip(self.__viewport__)
+            for rect in self.__drawCells__([pos], [self.__layout__.cellOrigin(pos)]):
+                self.markDirty( rect.clip(self.__viewport__) )
+            self.__surface__.set_clip(None)
+
+    def drawText(self, msg, x, y, color):
+        """Draw a line of text with its top left corner at (x,y)."""
+        self.markDirty( self.__surface__.blit(self.__textcache__.render(msg, color), (x, y)) )
+
+    def getTextCache(self):
+        """Get the TextCache used for the renderer's labels."""
+        return self.__textcache__
+
+    def drawWidget(self, name, state, draw):
+        """
+        Draw a HUD widget if the state that it shows has changed since it was last drawn.
+        draw takes the surface and draws the widget for the input state; it must return
+        the rectangle that it drew over (or a list of rectangles). Returns True if the
+        widget was drawn.
+        """
+        if name in self.__widgets__ and self.__widgets__[name] == state:
+            return False
+        self.__widgets__[name] = state
+        rects = draw(self.__surface__)
+        for rect in rects if type(rects) is list else [rects]:
+            self.markDirty(rect)
+        return True
+
+    def markDirty(self, rect):
+        """Send the input rectangle to the display on the next call to present."""
+        self.__dirty__ += [pygame.Rect(rect)]
+
+    def __updateLayout__(self):
+        """
+        Compute the layout of the board on the screen and the window of visible cells
+        again if the camera has moved, and redraw the board on the next frame.
+        """
+        if self.__camera__.getState() == self.__camerastate__:
+            return
+        self.__camerastate__ = self.__camera__.getState()
+        side, origin = self.__world__
+        self.__layout__ = self.__camera__.project(self.__map__.getDimensions(), side, origin)
+        self.__window__ = self.__layout__.visibleWindow(self.__viewport__)
+        if self.__sprites__ is None or self.__layout__.getSide() != self.__sprites__.getSide():
+            self.__sprites__ = cache.SpriteCache(self.__layout__.getSide(), self.__textcache__)
+        self.__redrawall__ = True
+
+    def __isVisible__(self, pos):
+        """Determine whether a cell lies in the window of visible cells."""
+        i0, i1, j0, j1 = self.__window__
+        return i0 <= pos[0] < i1 and j0 <= pos[1] < j1
+
+    def __drawCells__(self, cells, positions):
+        """
+        Draw the input cells, given the top left corners of their hexagons. Returns the
+        rectangles drawn.
+        """
+        game_map, side = self.__map__, self.__layout__.getSide()
+        if side < LOD_SIDE:
+            # Too small for the shape of a hexagon to matter: fill the middle of each one,
+            # which does not overlap the neighboring hexagons.
+            x_disp, y_disp = side / 2, side * np.sin(np.deg2rad(60))
+            return [self.__surface__.fill(game_map.getRGB(pos), (x - x_disp / 2, y, side + x_disp, 2 * y_disp))
+                    for pos, (x, y) in zip(cells, positions)]
+        sprites = self.__sprites__
+        anchor  = sprites.getAnchor()
+        # Each hexagon covers everything drawn for its cell before, so nothing is erased.
+        return self.__surface__.blits([(sprites.getSprite(game_map.getRGB(pos), game_map.getType(pos)),
+                                        (x - anchor, y)) for pos, (x, y) in zip(cells, positions)])
+
+    def invalidate(self):
+        """Redraw the whole board and every widget on the next frame."""
+        self.__camerastate__ = None
+        self.__widgets__     = {}
+        self.markDirty( self.__surface__.get_rect() )
+
+    def present(self):
+        """
+        Send the rectangles drawn since the last call to the display. Returns the list of
+        rectangles that were sent.
+        """
+        dirty, self.__dirty__ = self.__dirty__, []
+        if len(dirty) > MAX_DIRTY_RECTS:
+            # Updating one large rectangle is cheaper than updating many small ones.
+            dirty = [dirty[0].unionall(dirty)]
+        if dirty:
+            pygame.display.update(dirty)
+        return dirty
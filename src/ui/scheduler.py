@@ -0,0 +1,129 @@
+"""
+   .. module: scheduler
+    :synopsis: Frame scheduling for the UI. A FrameScheduler blocks until
+    there is an event to handle instead of polling, so that an idle window
+    does not use the CPU; caps the number of frames per second; and measures
+    how long each frame spends handling events and drawing.
+"""
+
+import collections
+import contextlib
+import json
+import sys
+import time
+import pygame
+
+# Default maximum number of frames per second.
+DEFAULT_FPS = 60
+
+# Number of recent frames that the statistics of each phase are computed over.
+DEFAULT_HISTORY = 600
+
+# Event posted by a timer to end a wait for events that has a timeout, since
+# pygame 1.9 cannot wait for an event with a timeout itself. It is never returned
+# to the event loop.
+TIMEOUT_EVENT = pygame.NUMEVENTS - 1
+
+"""
+Paces the frames of an event loop and records how long each phase of a frame takes.
+A frame starts when waitEvents returns; the loop measures its phases (usually
+"update" and "draw") with the measure context manager.
+"""
+class FrameScheduler(object):
+
+    def __init__(self, fps=DEFAULT_FPS, history=DEFAULT_HISTORY):
+        """Create a scheduler that runs at most fps frames per second."""
+        if fps <= 0:
+            raise ValueError( "The number of frames per second must be positive." )
+        self.__interval__   = 1.0 / fps
+        self.__history__    = history
+        # Recent durations of each phase, in seconds, keyed by the name of the phase
+        self.__samples__    = collections.OrderedDict()
+        self.__frame__      = {}
+        self.__numframes__  = 0
+        self.__framestart__ = None
+        self.__waittime__   = 0.0
+        self.__start__      = time.perf_counter()
+
+    def waitEvents(self, timeout=None):
+        """
+        Finish the current frame, wait until the next one may start, and block until
+        there is at least one event or until timeout seconds have passed (None waits
+        forever). Returns the list of pending events, which is empty after a timeout.
+        """
+        self.__endFrame__()
+        start = time.perf_counter()
+        if self.__framestart__ is not None:
+            delay = self.__framestart__ + self.__interval__ - start
+            if delay > 0:
+                pygame.time.wait(int(delay * 1000))
+        events = pygame.event.get()
+        if not events and (timeout is None or timeout > 0):
+            if timeout is None:
+                events = [pygame.event.wait()]
+            else:
+                # A timer of 0 milliseconds would never fire.
+                pygame.time.set_timer(TIMEOUT_EVENT, max(int(timeout * 1000), 1))
+                try:
+                    events = [pygame.event.wait()]
+                finally:
+                    pygame.time.set_timer(TIMEOUT_EVENT, 0)
+            events += pygame.event.get()
+        self.__framestart__ = time.perf_counter()
+        self.__waittime__  += self.__framestart__ - start
+        # A timer event can also arrive after a wait that another event has ended.
+        return [event for event in events if event.type != TIMEOUT_EVENT]
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        """Context manager that adds the time spent in its body to a phase of the current frame."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.__frame__[phase] = self.__frame__.get(phase, 0.0) + time.perf_counter() - start
+
+    def getStats(self):
+        """
+        Get a dictionary with the number of frames, the seconds spent waiting for events
+        and running, and the mean, 95th percentile and maximum duration of each phase
+        (and of whole frames) over the recent frames, in milliseconds.
+        """
+        stats = {"frames": self.__numframes__, "seconds": time.perf_counter() - self.__start__,
+                 "waiting": self.__waittime__}
+        for phase, samples in self.__samples__.items():
+            ordered = sorted(samples)
+            stats[phase] = {"mean_ms": 1000 * sum(ordered) / len(ordered),
+                            "p95_ms": 1000 * ordered[min(int(0.95 * len(ordered)), len(ordered) - 1)],
+                            "max_ms": 1000 * ordered[-1]}
+        return stats
+
+    def drawOverlay(self, renderer, x, y):
+        """Draw the mean duration of each phase through a BoardRenderer, with its top left corner at (x,y)."""
+        stats = self.getStats()
+        lines = ["%s %.1f ms" % (phase, stats[phase]["mean_ms"]) for phase in self.__samples__]
+        def draw(surface):
+            texts = renderer.getTextCache()
+            labels = [texts.render(line, (255, 255, 255)) for line in lines]
+            width = max([label.get_width() for label in labels] + [1])
+            rect = surface.fill((0, 0, 0), (x, y, width + 60, 20 * len(lines) + 20))
+            for k, label in enumerate(labels):
+                surface.blit(label, (x, y + 20 * k))
+            return rect
+        renderer.drawWidget("telemetry", tuple(lines), draw)
+
+    def dumpStats(self, stream=sys.stdout):
+        """Write the statistics (see getStats) to a stream as one line of JSON."""
+        stream.write(json.dumps(self.getStats()) + "\n")
+
+    def __endFrame__(self):
+        """Record the durations of the phases of the frame that has just finished."""
+        if not self.__frame__:
+            return
+        self.__frame__["frame"] = sum(self.__frame__.values())
+        for phase, duration in self.__frame__.items():
+            if phase not in self.__samples__:
+                self.__samples__[phase] = collections.deque(maxlen=self.__history__)
+            self.__samples__[phase].append(duration)
+        self.__numframes__ += 1
+        self.__frame__ = {}
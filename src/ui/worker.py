@@ -0,0 +1,114 @@
+"""
+   .. module: worker
+    :synopsis: Runs the turns of AI players off the UI thread. An AIWorker
+    passes a snapshot of the map to the player's makeMove generator on a
+    background thread, and streams the MoveVectors it yields back through a
+    queue, so that the UI can keep handling events while the player thinks
+    and apply the moves one at a time as they arrive.
+"""
+
+import os, sys
+import queue
+import threading
+import pygame
+
+src_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)
+if src_path not in sys.path:
+    sys.path.append( src_path )
+
+import game.movevector as movevector
+
+"""
+Runs one AI turn at a time on a background thread.
+"""
+class AIWorker(object):
+
+    def __init__(self, event_type=None):
+        """
+        Create an idle worker. If event_type is given, a pygame event of that type is
+        posted whenever a move is ready, so that a UI blocked waiting for events wakes up.
+        """
+        self.__eventtype__ = event_type
+        self.__thread__    = None
+        self.__moves__     = queue.Queue()
+        self.__cancel__    = threading.Event()
+
+    def start(self, moving_player, game_map):
+        """
+        Start the turn of moving_player. Its makeMove method is passed a snapshot of
+        game_map (see Map.snapshot), which is taken here, on the calling thread; the
+        game itself is never touched by the worker.
+        """
+        # A cancelled turn may still be running, but its moves are never queued.
+        if self.isRunning() and not self.__cancel__.is_set():
+            raise RuntimeError( "The worker is still running the previous turn." )
+        self.__moves__  = queue.Queue()
+        self.__cancel__ = threading.Event()
+        self.__thread__ = threading.Thread(target=self.__run__,
+                                           args=(moving_player, game_map.snapshot(), self.__moves__, self.__cancel__),
+                                           daemon=True)
+        self.__thread__.start()
+
+    def poll(self, max_moves=None):
+        """
+        Get the moves that are ready, without waiting, up to max_moves of them (all of
+        them if None). An exception raised by the player is raised here instead.
+        """
+        vects = []
+        while max_moves is None or len(vects) < max_moves:
+            try:
+                item = self.__moves__.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, Exception):
+                raise item
+            vects += [item]
+            if item.getMoveType() == movevector.TYPE_END_TURN:
+                # The thread stops right after queueing the end of the turn, so the
+                # next turn can be started as soon as this one has been collected.
+                self.__thread__.join()
+                break
+        return vects
+
+    def hasMoves(self):
+        """Determine whether there are moves ready to be collected with poll."""
+        return not self.__moves__.empty()
+
+    def isRunning(self):
+        """Determine whether the player is still thinking."""
+        return self.__thread__ is not None and self.__thread__.is_alive()
+
+    def isBusy(self):
+        """Determine whether the worker is running a turn or has moves left to collect."""
+        return self.isRunning() or self.hasMoves()
+
+    def cancel(self):
+        """
+        Stop the current turn. The player's generator is abandoned at the next move it
+        yields, and the moves not yet collected are discarded.
+        """
+        self.__cancel__.set()
+        self.__moves__ = queue.Queue()
+
+    def __run__(self, moving_player, game_map, moves, cancel):
+        """Body of the background thread: queue every move of the turn, in order."""
+        try:
+            for vect in moving_player.makeMove(game_map):
+                if cancel.is_set():
+                    return
+                moves.put(vect)
+                self.__notify__()
+                if vect.getMoveType() == movevector.TYPE_END_TURN:
+                    return
+            raise RuntimeError( "Finished iterating over the moves from makeMove() " +
+                                "before the player ended their turn with a move of type " +
+                                "movevector.TYPE_END_TURN." )
+        except Exception as error:
+            if not cancel.is_set():
+                moves.put(error)
+                self.__notify__()
+
+    def __notify__(self):
+        """Post the worker's pygame event, if it has one."""
+        if self.__eventtype__ is not None and pygame.display.get_init():
+            pygame.event.post(pygame.event.Event(self.__eventtype__))